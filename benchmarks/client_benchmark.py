@@ -0,0 +1,158 @@
+'''Benchmarks pureapi.client functions against a local stub Pure API server.
+
+Measures throughput, latency percentiles of individual requests, and peak
+memory, of ``get_all``, ``filter_all_by_uuid``, ``get_all_changes``, and their
+transformed variants. Save results with ``--output``, then compare them
+across pureapi versions with ``--baseline``.
+
+Run from the repository root:
+    python -m benchmarks.client_benchmark --records 20000 --latency 0.005
+'''
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Iterator, List, Mapping, MutableMapping, Optional
+
+import attr
+
+from pureapi import client
+from benchmarks.stub_server import StubServer, record_uuid
+
+@attr.s(auto_attribs=True)
+class Result:
+    '''Measurements of a single benchmark.'''
+
+    name: str
+    records: int = 0
+    pages: int = 0
+    seconds: float = 0.0
+    latencies: List[float] = attr.ib(factory=list, repr=False)
+    '''Seconds from sending each request to receiving its response headers.'''
+    peak_bytes: Optional[int] = None
+
+    def summary(self) -> MutableMapping:
+        latencies = sorted(self.latencies)
+        return {
+            'name': self.name,
+            'records': self.records,
+            'pages': self.pages,
+            'seconds': round(self.seconds, 4),
+            'records_per_second': round(self.records / self.seconds, 1) if self.seconds else None,
+            'pages_per_second': round(self.pages / self.seconds, 1) if self.seconds else None,
+            'latency_p50_ms': round(1000 * percentile(latencies, 0.50), 2) if latencies else None,
+            'latency_p90_ms': round(1000 * percentile(latencies, 0.90), 2) if latencies else None,
+            'latency_p99_ms': round(1000 * percentile(latencies, 0.99), 2) if latencies else None,
+            'peak_mib': round(self.peak_bytes / 2**20, 2) if self.peak_bytes is not None else None,
+        }
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    '''Returns the nearest-rank percentile of already sorted values.'''
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def consume_responses(responses: Iterator, result: Result) -> None:
+    for r in responses:
+        result.pages += 1
+        result.records += len(r.json().get('items', []))
+        result.latencies.append(r.elapsed.total_seconds())
+
+def consume_records(records: Iterator, result: Result) -> None:
+    for record in records:
+        result.records += 1
+
+def benchmarks(server: StubServer, config: client.Config, records: int, page_size: int) -> Mapping[str, Callable[[Result], None]]:
+    uuids = [record_uuid('persons', index) for index in range(records)]
+    return {
+        'get_all': lambda result: consume_responses(
+            client.get_all('research-outputs', {'size': page_size}, config=config), result
+        ),
+        'get_all_transformed': lambda result: consume_records(
+            client.get_all_transformed('research-outputs', {'size': page_size}, config=config), result
+        ),
+        'filter_all_by_uuid': lambda result: consume_responses(
+            client.filter_all_by_uuid('persons', uuids=uuids, uuids_per_request=page_size, config=config), result
+        ),
+        'filter_all_by_uuid_transformed': lambda result: consume_records(
+            client.filter_all_by_uuid_transformed('persons', uuids=uuids, uuids_per_request=page_size, config=config), result
+        ),
+        'get_all_changes': lambda result: consume_responses(
+            client.get_all_changes('2000-01-01', config=config), result
+        ),
+        'get_all_changes_transformed': lambda result: consume_records(
+            client.get_all_changes_transformed('2000-01-01', config=config), result
+        ),
+    }
+
+def run(name: str, benchmark: Callable[[Result], None], memory: bool) -> Result:
+    result = Result(name=name)
+    start = time.perf_counter()
+    benchmark(result)
+    result.seconds = time.perf_counter() - start
+    if memory:
+        # A separate run, because tracemalloc slows everything down:
+        tracemalloc.start()
+        benchmark(Result(name=name))
+        result.peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=2000, help='Number of records in each collection, and of changes.')
+    parser.add_argument('--page-size', type=int, default=100, help='Number of records per request.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Server latency per request, in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random extra latency, in seconds.')
+    parser.add_argument('--padding-bytes', type=int, default=0, help='Extra bytes per record.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail, and are retried.')
+    parser.add_argument('--zero-count-every', type=int, default=5, help='Pages of changes between zero-count pages.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark. Reports the fastest.')
+    parser.add_argument('--memory', action='store_true', help='Also measure peak memory, with tracemalloc.')
+    parser.add_argument('--only', nargs='*', help='Names of benchmarks to run. Default: all.')
+    parser.add_argument('--output', help='Path of a JSON file to which to write results.')
+    parser.add_argument('--baseline', help='Path of a JSON file of earlier results to compare against.')
+    args = parser.parse_args()
+
+    server = StubServer(
+        counts={'research-outputs': args.records, 'persons': args.records},
+        changes_count=args.records,
+        changes_page_size=args.page_size,
+        zero_count_every=args.zero_count_every,
+        latency=args.latency,
+        jitter=args.jitter,
+        padding_bytes=args.padding_bytes,
+        error_rate=args.error_rate,
+    )
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {summary['name']: summary for summary in json.load(f)}
+
+    summaries = []
+    with server:
+        for name, benchmark in benchmarks(server, server.config(), args.records, args.page_size).items():
+            if args.only and name not in args.only:
+                continue
+            results = [run(name, benchmark, memory=False) for _ in range(args.repeat)]
+            best = min(results, key=lambda result: result.seconds)
+            if args.memory:
+                best.peak_bytes = run(name, benchmark, memory=True).peak_bytes
+            summary = best.summary()
+            summaries.append(summary)
+            line = (
+                f"{name:>31}: {summary['records_per_second']:>10} records/s"
+                f" p50 {summary['latency_p50_ms']} ms p99 {summary['latency_p99_ms']} ms"
+            )
+            if summary['peak_mib'] is not None:
+                line += f" peak {summary['peak_mib']} MiB"
+            if name in baseline and baseline[name]['records_per_second']:
+                change = summary['records_per_second'] / baseline[name]['records_per_second'] - 1
+                line += f' ({change:+.1%} vs. baseline)'
+            print(line)
+        print(f'{server.request_count} requests, {server.error_count} injected errors')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summaries, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+'''Benchmarks the memory footprint of pureapi.client ``*_transformed()``
+functions, and of each transformer in pureapi.response, with tracemalloc.
+
+For each ``*_transformed()`` function, with and without
+``Config.max_resident_pages``, measures peak and steady-state traced memory
+while a consumer discards every record, and divides both by the page size, to
+give bytes per resident record. Steady state is the median of samples taken
+after every record. The stub server runs in a forked process, so that its own
+allocations are not traced.
+
+For each transformer, measures the size of raw JSON records, and of their
+transformed ``addict.Dict`` copies.
+
+Run from the repository root:
+    python -m benchmarks.memory_benchmark --records 2000 --padding-bytes 100000
+'''
+import argparse
+from contextlib import contextmanager
+import json
+import multiprocessing
+import statistics
+import tracemalloc
+from typing import Callable, Iterator, List, Mapping, MutableMapping, Optional
+
+from pureapi import client, response
+from benchmarks.stub_server import StubServer, record_uuid
+
+@contextmanager
+def forked(server: StubServer) -> Iterator[StubServer]:
+    '''Serves requests to ``server`` from a forked process.'''
+    process = multiprocessing.get_context('fork').Process(target=server.httpd.serve_forever, daemon=True)
+    process.start()
+    try:
+        yield server
+    finally:
+        process.terminate()
+        process.join()
+        server.httpd.server_close()
+
+def workloads(config: client.Config, records: int, page_size: int) -> Mapping[str, Callable[[], Iterator]]:
+    uuids = [record_uuid('research-outputs', index) for index in range(records)]
+    return {
+        'get_all_transformed': lambda: client.get_all_transformed(
+            'research-outputs', {'size': page_size}, config=config
+        ),
+        'filter_all_transformed': lambda: client.filter_all_transformed(
+            'research-outputs', {'size': page_size}, config=config
+        ),
+        'filter_all_by_uuid_transformed': lambda: client.filter_all_by_uuid_transformed(
+            'research-outputs', uuids=uuids, uuids_per_request=page_size, config=config
+        ),
+        'get_all_changes_transformed': lambda: client.get_all_changes_transformed('2000-01-01', config=config),
+    }
+
+def measure(records: Callable[[], Iterator], page_size: int) -> MutableMapping:
+    '''Consumes and discards all records, sampling traced memory after every
+    record.'''
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    samples: List[int] = []
+    count = 0
+    record = None
+    for record in records():
+        count += 1
+        samples.append(tracemalloc.get_traced_memory()[0] - baseline)
+    del record
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    steady = statistics.median(samples) if samples else 0
+    return {
+        'records': count,
+        'peak_mib': round(peak / 2**20, 2),
+        'steady_mib': round(steady / 2**20, 2),
+        'peak_bytes_per_record': round(peak / page_size),
+        'steady_bytes_per_record': round(steady / page_size),
+    }
+
+def traced_size(make: Callable[[], object], copies: int = 20) -> float:
+    '''Returns the mean traced size of objects returned by ``make``.'''
+    # Exclude one-time allocations, e.g., of cached schemas:
+    make()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [make() for _ in range(copies)]
+    size = (tracemalloc.get_traced_memory()[0] - before) / copies
+    tracemalloc.stop()
+    del objects
+    return size
+
+def transformer_sizes(server: StubServer) -> List[MutableMapping]:
+    sizes = []
+    for collection in sorted(server.templates):
+        if not server.templates[collection]:
+            continue
+        text = server.record_json(collection, 0)
+        raw = traced_size(lambda: json.loads(text))
+        record = json.loads(text)
+        transformed = traced_size(lambda: response.transform(collection, record, version=server.version))
+        sizes.append({
+            'collection': collection,
+            'json_bytes': len(text),
+            'raw_bytes': round(raw),
+            'transformed_bytes': round(transformed),
+        })
+    return sizes
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=1000, help='Number of records in each collection, and of changes.')
+    parser.add_argument('--page-size', type=int, default=100, help='Number of records per request.')
+    parser.add_argument('--padding-bytes', type=int, default=0, help='Extra bytes per record, to simulate heavier records.')
+    parser.add_argument('--max-resident-pages', type=int, nargs='*', default=[1, 2],
+        help='Values of Config.max_resident_pages to compare with the default, unbounded mode.')
+    parser.add_argument('--only', nargs='*', help='Names of functions to run. Default: all.')
+    parser.add_argument('--output', help='Path of a JSON file to which to write results.')
+    args = parser.parse_args()
+
+    server = StubServer(
+        counts={'research-outputs': args.records},
+        changes_count=args.records,
+        changes_page_size=args.page_size,
+        padding_bytes=args.padding_bytes,
+    )
+    results = {'transformers': transformer_sizes(server), 'functions': []}
+    for sizes in results['transformers']:
+        print(
+            f"{sizes['collection']:>31}: {sizes['json_bytes']:>9} JSON bytes,"
+            f" {sizes['raw_bytes']:>9} raw, {sizes['transformed_bytes']:>9} transformed"
+        )
+
+    with forked(server):
+        for mode in [None, *args.max_resident_pages]:
+            config = server.config(max_resident_pages=mode)
+            for name, records in workloads(config, args.records, args.page_size).items():
+                if args.only and name not in args.only:
+                    continue
+                summary = {'name': name, 'max_resident_pages': mode, **measure(records, args.page_size)}
+                results['functions'].append(summary)
+                print(
+                    f"{name:>31} max_resident_pages={str(mode):>4}: peak {summary['peak_mib']} MiB"
+                    f" ({summary['peak_bytes_per_record']} B/record),"
+                    f" steady {summary['steady_mib']} MiB ({summary['steady_bytes_per_record']} B/record)"
+                )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+'''Benchmarks the memory use and construction speed of ``addict.Dict``
+records, from ``response.transform()``, against the compact record classes
+in ``pureapi.records``.
+
+For each collection with recorded templates, decodes many copies of the
+templates, constructs records from them, and reports construction speed, in
+records per second, excluding decoding, and the memory that all records
+hold, in bytes per record, as measured by ``tracemalloc``, including any
+decoded JSON they reference. Compact records are measured both as
+constructed, with nested objects not yet converted, and after
+``records.materialize()``. For reference, also reports the bytes per record
+of the decoded JSON itself.
+
+Run from the repository root:
+    python -m benchmarks.records_benchmark --records 20000
+'''
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Callable, List, Mapping, MutableMapping
+
+from pureapi import records, response
+from benchmarks.stub_server import recorded_templates
+
+constructors: Mapping[str, Callable[[str, MutableMapping], object]] = {
+    'json': lambda collection, item: item,
+    'addict': lambda collection, item: response.transform(collection, item),
+    'slots': lambda collection, item: records.from_json(collection, item),
+    'slots-materialized': lambda collection, item: records.materialize(records.from_json(collection, item)),
+}
+'''Record constructors to compare, by name. ``json`` keeps decoded JSON.'''
+
+def run(name: str, collection: str, templates: List[str], count: int) -> MutableMapping:
+    construct = constructors[name]
+    # Warm up schema and class caches, which would otherwise count as record memory:
+    construct(collection, json.loads(templates[0]))
+
+    # Time construction without tracing, which slows allocation-heavy code:
+    items = [json.loads(templates[index % len(templates)]) for index in range(count)]
+    start = time.perf_counter()
+    kept = [construct(collection, item) for item in items]
+    seconds = time.perf_counter() - start
+    del items, kept
+
+    # Measure everything the kept records hold, including decoded JSON that
+    # compact records reference until their nested objects are converted:
+    gc.collect()
+    tracemalloc.start()
+    kept = []
+    for index in range(count):
+        kept.append(construct(collection, json.loads(templates[index % len(templates)])))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return {
+        'collection': collection,
+        'record_type': name,
+        'records': count,
+        'records_per_second': round(count / seconds),
+        'bytes_per_record': round(size / count),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000, help='Number of records of each collection to keep.')
+    parser.add_argument('--collections', nargs='*', help='Collections to run. Default: all with templates.')
+    parser.add_argument('--only', nargs='*', help='Names of record types to run. Default: all.')
+    parser.add_argument('--output', help='Path of a JSON file to which to write results.')
+    args = parser.parse_args()
+
+    results = []
+    for collection, templates in recorded_templates().items():
+        if not templates or (args.collections and collection not in args.collections):
+            continue
+        serialized = [json.dumps(template) for template in templates]
+        for name in constructors:
+            if args.only and name not in args.only:
+                continue
+            result = run(name, collection, serialized, args.records)
+            results.append(result)
+            print(
+                f"{collection:>22} {name:>18}: {result['records_per_second']:>8} records/s,"
+                f" {result['bytes_per_record']:>7} bytes/record"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
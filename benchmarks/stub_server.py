@@ -0,0 +1,450 @@
+'''A local stand-in for a Pure API server, for benchmarks.
+
+Serves paginated collections, filters, and changes, with records generated
+from the recorded records in ``tests/data``, or from any other templates.
+Latency, record size, and errors are all configurable, and all randomness is
+seeded, so runs are reproducible.
+
+Example:
+    from pureapi import client
+    from benchmarks.stub_server import StubServer
+    with StubServer(counts={'research-outputs': 10000}, latency=0.02) as server:
+        for r in client.get_all('research-outputs', config=server.config()):
+            ...
+'''
+import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import socketserver
+import threading
+import time
+from typing import Any, List, Mapping, MutableMapping, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import uuid as uuid_module
+
+from tenacity import Retrying, stop_after_attempt, wait_fixed
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+except ImportError: # pragma: no cover
+    h2 = None
+
+from pureapi import client
+from pureapi.common import default_version
+from pureapi.mirror import family_collections
+
+data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'data')
+
+template_dirs: Mapping[str, str] = {
+    'external-organisations': 'external_organisation',
+    'external-persons': 'external_person',
+    'organisational-units': 'organisational_unit',
+    'persons': 'person',
+    'research-outputs': 'research_output',
+}
+'''Subdirectories of ``tests/data/<version>`` containing recorded records,
+by collection.'''
+
+_uuid_placeholder = '00000000-0000-0000-0000-stub-uuid'
+
+collection_families: Mapping[str, str] = {collection: family for family, collection in family_collections.items()}
+
+def recorded_templates(version: str = None) -> MutableMapping[str, List[MutableMapping]]:
+    '''Returns the recorded records in ``tests/data``, by collection.'''
+    if version is None:
+        version = default_version()
+    templates = {}
+    for collection, subdir in template_dirs.items():
+        templates[collection] = []
+        for path in sorted(glob.glob(os.path.join(data_dir, version, subdir, '*.json'))):
+            with open(path) as f:
+                templates[collection].append(json.load(f))
+    return templates
+
+def record_uuid(collection: str, index: int) -> str:
+    '''Returns the uuid of the record at ``index`` in a stub ``collection``.'''
+    return str(uuid_module.uuid5(uuid_module.NAMESPACE_URL, f'{collection}/{index}'))
+
+class StubServer:
+    '''A threaded HTTP server that mimics the Pure API.
+
+    Collections are served at ``/ws/api/<version>/<collection>``, for both GET
+    requests, with ``offset`` and ``size`` params, and POST requests, with
+    ``offset``, ``size`` and ``uuids`` in JSON payloads. The record at each
+    offset is a template, with a deterministic uuid. Changes are
+    served at ``/ws/api/<version>/changes/<token or date>``, with resumption
+    tokens that are sequence numbers, pages of ``changes_page_size`` changes to
+    records in the served collections, and a page with a count of zero after
+    every ``zero_count_every`` pages, as the real Pure API sometimes returns.
+    With ``http2=True``, serves HTTP/2 instead of HTTP/1.1, to benchmark
+    multiplexing transports.
+    '''
+
+    def __init__(
+        self,
+        *,
+        counts: Mapping[str, int] = None,
+        templates: Mapping[str, List[MutableMapping]] = None,
+        version: str = None,
+        changes_count: int = 1000,
+        changes_page_size: int = 100,
+        zero_count_every: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        padding_bytes: int = 0,
+        error_rate: float = 0.0,
+        error_mode: str = 'reset',
+        seed: int = 0,
+        orderings: Mapping[str, List[str]] = None,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        http2: bool = False
+    ):
+        '''
+        Args:
+            counts: Number of records in each collection. Default: 1000 in
+                each collection with templates.
+            templates: Records on which to base the records served for each
+                collection. Default: Return value of ``recorded_templates()``.
+            version: The Pure API version, without the decimal point.
+            changes_count: Total number of changes.
+            changes_page_size: Number of changes in each changes response.
+            zero_count_every: Number of pages of changes after which to serve
+                a page with a count of zero. Default: 0, for none.
+            latency: Seconds to wait before each response.
+            jitter: Maximum random seconds to add to ``latency``.
+            padding_bytes: Size of a ``padding`` string to add to each record,
+                to simulate larger records.
+            error_rate: Fraction of requests, from 0 to 1, that fail.
+            error_mode: How requests fail: ``reset`` to close the connection
+                without a response, which ``client.Config.retryer`` retries, or
+                ``status`` to respond with HTTP status 503.
+            seed: Seed for random latency and errors.
+            orderings: Orderings to list at ``<collection>-meta/orderings``,
+                by collection. Pages are not ordered by them. Default:
+                ``None``, to respond with HTTP status 404, as Pure API
+                servers without the endpoint do.
+            host: Host on which to listen.
+            port: Port on which to listen. Default: 0, for any free port.
+            http2: Whether to serve HTTP/2 without TLS, with prior knowledge,
+                instead of HTTP/1.1. Requires ``h2``.
+        '''
+        self.version = version if version is not None else default_version()
+        self.templates = templates if templates is not None else recorded_templates(self.version)
+        self.counts = dict(counts) if counts is not None else {
+            collection: 1000 for collection, records in self.templates.items() if records
+        }
+        self.changes_count = changes_count
+        self.changes_page_size = changes_page_size
+        self.zero_count_every = zero_count_every
+        self.latency = latency
+        self.jitter = jitter
+        self.padding = 'x' * padding_bytes
+        self._serialized_templates = {}
+        self.orderings = dict(orderings) if orderings is not None else {}
+        self.error_rate = error_rate
+        self.error_mode = error_mode
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        '''Number of requests received, including failed requests.'''
+        self.error_count = 0
+        '''Number of requests deliberately failed.'''
+
+        self.connection_count = 0
+        '''Number of connections accepted.'''
+
+        self.protocol_error_count = 0
+        '''Number of HTTP/2 connections closed because of protocol errors,
+        e.g., from clients that share a connection without coordination.'''
+
+        stub = self
+        if http2:
+            if h2 is None:
+                raise ImportError('h2 is required for an HTTP/2 StubServer, but is not installed')
+            class H2Handler(_H2Handler):
+                server_stub = stub
+            self.httpd = socketserver.ThreadingTCPServer((host, port), H2Handler)
+        else:
+            class Handler(_Handler):
+                server_stub = stub
+            self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def domain(self) -> str:
+        '''Host and port, for ``client.Config.domain``.'''
+        host, port = self.httpd.server_address[:2]
+        return f'{host}:{port}'
+
+    def config(self, **kwargs) -> client.Config:
+        '''Returns a ``client.Config`` for requests to this server, which
+        retries failed requests quickly. ``kwargs`` override any attributes.'''
+        defaults = {
+            'protocol': 'http',
+            'domain': self.domain,
+            'key': 'stub',
+            'version': self.version,
+            'retryer': Retrying(stop=stop_after_attempt(10), wait=wait_fixed(0.01), reraise=True),
+        }
+        return client.Config(**{**defaults, **kwargs})
+
+    def start(self) -> 'StubServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def record(self, collection: str, index: int, uuid: str = None) -> MutableMapping:
+        '''Returns the record at ``index`` in a ``collection``.'''
+        return json.loads(self.record_json(collection, index, uuid))
+
+    def record_json(self, collection: str, index: int, uuid: str = None) -> str:
+        # Serializing templates once, then substituting uuids, is much faster
+        # than copying and serializing large records for every response:
+        if collection not in self._serialized_templates:
+            serialized = []
+            for template in self.templates[collection]:
+                record = {**template, 'uuid': _uuid_placeholder}
+                if self.padding:
+                    record['padding'] = self.padding
+                serialized.append(json.dumps(record).split(json.dumps(_uuid_placeholder)))
+            self._serialized_templates[collection] = serialized
+        templates = self._serialized_templates[collection]
+        uuid = uuid if uuid is not None else record_uuid(collection, index)
+        return json.dumps(uuid).join(templates[index % len(templates)])
+
+    def page(self, collection: str, offset: int, size: int) -> str:
+        count = self.counts.get(collection, 0)
+        items = ','.join(self.record_json(collection, index) for index in range(offset, min(offset + size, count)))
+        return f'{{"count": {count}, "pageInformation": {{"offset": {offset}, "size": {size}}}, "items": [{items}]}}'
+
+    def uuid_page(self, collection: str, uuids: List[str]) -> str:
+        items = ','.join(self.record_json(collection, index, uuid) for index, uuid in enumerate(uuids))
+        return f'{{"count": {len(uuids)}, "pageInformation": {{"offset": 0, "size": {len(uuids)}}}, "items": [{items}]}}'
+
+    def changes_page(self, token_or_date: str) -> str:
+        # Dates start from the first change:
+        start = int(token_or_date) if token_or_date.isdigit() else 0
+        page_number = start // self.changes_page_size
+        if self.zero_count_every and page_number % (self.zero_count_every + 1) == self.zero_count_every:
+            # Zero-count pages still advance the resumption token:
+            end = start + self.changes_page_size
+            return json.dumps({'count': 0, 'resumptionToken': str(end), 'moreChanges': end < self.changes_count})
+        end = min(start + self.changes_page_size, self.changes_count)
+        collections = sorted(collection for collection in self.counts if collection in collection_families)
+        items = []
+        for sequence_number in range(start, end):
+            collection = collections[sequence_number % len(collections)]
+            index = (sequence_number // len(collections)) % max(1, self.counts[collection])
+            items.append({
+                'uuid': record_uuid(collection, index),
+                'changeType': 'DELETE' if sequence_number % 10 == 9 else 'UPDATE',
+                'familySystemName': collection_families[collection],
+                'version': sequence_number,
+            })
+        return json.dumps({
+            'count': len(items),
+            'resumptionToken': str(end),
+            'moreChanges': end < self.changes_count,
+            'items': items,
+        })
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.request_count += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.error_count += 1
+                return True
+            return False
+
+    def count_connection(self) -> None:
+        with self.lock:
+            self.connection_count += 1
+
+    def count_protocol_error(self) -> None:
+        with self.lock:
+            self.protocol_error_count += 1
+
+    def respond(self, path: str, payload: Optional[Mapping]) -> Optional[Tuple[int, str]]:
+        '''Returns the HTTP status and JSON body of the response to a request,
+        after any latency, or ``None`` for a request to fail by resetting the
+        connection, or, with HTTP/2, the stream.
+
+        Args:
+            path: The request path, with any query string.
+            payload: The JSON payload of a POST request, or ``None`` for a GET
+                request.
+        '''
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        if self.should_fail():
+            if self.error_mode == 'status':
+                return 503, json.dumps({'code': 503, 'title': 'Service Unavailable'})
+            return None
+
+        url = urlsplit(path)
+        prefix = f'/ws/api/{self.version}/'
+        if not url.path.startswith(prefix):
+            return 404, json.dumps({'code': 404, 'title': 'Not Found'})
+        segments = url.path[len(prefix):].split('/')
+        collection = segments[0]
+        if collection == 'changes' and len(segments) == 2:
+            return 200, self.changes_page(segments[1])
+        if collection.endswith('-meta') and segments[1:] == ['orderings'] and collection[:-len('-meta')] in self.orderings:
+            return 200, json.dumps({'orderings': self.orderings[collection[:-len('-meta')]]})
+        if collection in self.counts and len(segments) == 1:
+            if payload is None:
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            else:
+                params = payload
+            if payload is not None and 'uuids' in payload:
+                return 200, self.uuid_page(collection, list(payload['uuids']))
+            return 200, self.page(collection, int(params.get('offset', 0)), int(params.get('size', 10)))
+        return 404, json.dumps({'code': 404, 'title': 'Not Found'})
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        with self.lock:
+            return self.latency + self.random.random() * self.jitter
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_stub: StubServer = None
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        self.server_stub.count_connection()
+
+    def do_GET(self) -> None:
+        self.respond(None)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        self.respond(json.loads(self.rfile.read(length) or b'{}'))
+
+    def respond(self, payload: Optional[Mapping]) -> None:
+        result = self.server_stub.respond(self.path, payload)
+        if result is None:
+            self.close_connection = True
+            self.connection.close()
+            return
+        self.send_json(*result)
+
+    def send_json(self, status: int, body: str) -> None:
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class _H2Handler(socketserver.BaseRequestHandler):
+    '''Serves HTTP/2 without TLS, with prior knowledge, on a single
+    connection, responding to each stream on its own thread, so that
+    concurrent requests are multiplexed.'''
+
+    server_stub: StubServer = None
+
+    def handle(self) -> None:
+        self.server_stub.count_connection()
+        self.conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding='utf-8')
+        )
+        self.lock = threading.Condition()
+        self.closed = False
+        with self.lock:
+            self.conn.initiate_connection()
+            self.flush()
+        requests: MutableMapping[int, MutableMapping] = {}
+        try:
+            while not self.closed:
+                data = self.request.recv(2**16)
+                if not data:
+                    break
+                with self.lock:
+                    for event in self.conn.receive_data(data):
+                        if isinstance(event, h2.events.RequestReceived):
+                            requests[event.stream_id] = {'headers': dict(event.headers), 'body': bytearray()}
+                        elif isinstance(event, h2.events.DataReceived):
+                            requests[event.stream_id]['body'] += event.data
+                            self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                        elif isinstance(event, h2.events.StreamEnded):
+                            threading.Thread(
+                                target=self.respond, args=(event.stream_id, requests.pop(event.stream_id)), daemon=True
+                            ).start()
+                        elif isinstance(event, h2.events.ConnectionTerminated):
+                            self.closed = True
+                    self.flush()
+                    # Wake responders waiting for flow control windows:
+                    self.lock.notify_all()
+        except OSError:
+            pass
+        except h2.exceptions.ProtocolError:
+            self.server_stub.count_protocol_error()
+        finally:
+            with self.lock:
+                self.closed = True
+                self.lock.notify_all()
+
+    def flush(self) -> None:
+        data = self.conn.data_to_send()
+        if data:
+            self.request.sendall(data)
+
+    def respond(self, stream_id: int, request: Mapping) -> None:
+        headers = request['headers']
+        payload = json.loads(bytes(request['body']) or b'{}') if headers[':method'] == 'POST' else None
+        result = self.server_stub.respond(headers[':path'], payload)
+        try:
+            with self.lock:
+                if result is None:
+                    self.conn.reset_stream(stream_id)
+                    self.flush()
+                    return
+                status, body = result
+                data = body.encode('utf-8')
+                self.conn.send_headers(stream_id, [
+                    (':status', str(status)),
+                    ('content-type', 'application/json'),
+                    ('content-length', str(len(data))),
+                ])
+                self.flush()
+            sent = 0
+            while True:
+                with self.lock:
+                    while not self.closed and self.conn.local_flow_control_window(stream_id) <= 0 and sent < len(data):
+                        self.lock.wait()
+                    if self.closed:
+                        return
+                    size = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+                    chunk = data[sent:sent + size]
+                    sent += len(chunk)
+                    self.conn.send_data(stream_id, chunk, end_stream=sent >= len(data))
+                    self.flush()
+                if sent >= len(data):
+                    return
+        except (h2.exceptions.StreamClosedError, OSError):
+            pass
@@ -0,0 +1,92 @@
+'''Benchmarks pureapi.transport transports against a local stub Pure API
+server, fetching pages of a collection with 1, 8 and 64 concurrent windows.
+
+Compares ``RequestsTransport``, which opens a new HTTP/1.1 connection for each
+request, with ``HTTPXTransport`` over pooled HTTP/1.1 connections, and over a
+single, multiplexed HTTP/2 connection. Reports pages per second, and the
+number of connections each transport opened. Requires ``httpx`` and ``h2``.
+
+Run from the repository root:
+    python -m benchmarks.transport_benchmark --pages 256 --latency 0.02
+'''
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+from typing import Callable, List, Mapping, MutableMapping
+
+from pureapi import client, transport
+from benchmarks.stub_server import StubServer
+
+transports: Mapping[str, Callable[[], transport.Transport]] = {
+    'requests-http1': transport.RequestsTransport,
+    'httpx-http1': lambda: transport.HTTPXTransport(http2=False),
+    'httpx-http2': lambda: transport.HTTPXTransport(http1=False),
+}
+'''Transports to compare, by name. The HTTP/2 transport uses prior knowledge,
+because the stub server does not use TLS.'''
+
+def run(name: str, server: StubServer, pages: int, page_size: int, concurrency: int) -> MutableMapping:
+    t = transports[name]()
+    config = server.config(transport=t)
+    windows = [{'offset': page * page_size, 'size': page_size} for page in range(pages)]
+    connections = server.connection_count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        records = sum(
+            len(r.json()['items'])
+            for r in executor.map(lambda params: client.get('persons', params, config=config), windows)
+        )
+    seconds = time.perf_counter() - start
+    if isinstance(t, transport.HTTPXTransport):
+        t.close()
+    return {
+        'transport': name,
+        'concurrency': concurrency,
+        'pages': pages,
+        'records': records,
+        'seconds': round(seconds, 4),
+        'pages_per_second': round(pages / seconds, 1),
+        'connections': server.connection_count - connections,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=256, help='Number of pages to fetch in each run.')
+    parser.add_argument('--page-size', type=int, default=10, help='Number of records per page.')
+    parser.add_argument('--latency', type=float, default=0.02, help='Server latency per request, in seconds.')
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 8, 64], help='Numbers of concurrent windows.')
+    parser.add_argument('--only', nargs='*', help='Names of transports to run. Default: all.')
+    parser.add_argument('--output', help='Path of a JSON file to which to write results.')
+    args = parser.parse_args()
+
+    counts = {'persons': args.pages * args.page_size}
+    servers = {
+        'http1': StubServer(counts=counts, latency=args.latency),
+        'http2': StubServer(counts=counts, latency=args.latency, http2=True),
+    }
+    results: List[MutableMapping] = []
+    for server in servers.values():
+        server.start()
+    try:
+        for concurrency in args.concurrency:
+            for name in transports:
+                if args.only and name not in args.only:
+                    continue
+                server = servers['http2' if name.endswith('http2') else 'http1']
+                result = run(name, server, args.pages, args.page_size, concurrency)
+                results.append(result)
+                print(
+                    f"{name:>15} x {concurrency:>3}: {result['pages_per_second']:>8} pages/s"
+                    f" in {result['seconds']} s, {result['connections']} connections"
+                )
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''Benchmarks pureapi.xmlparser on a large, synthetic publications export,
+with each available backend, with and without an ``EntityCache``, and in
+parallel with ``parallel_records()``.
+
+Run from the repository root:
+    python -m benchmarks.xmlparser_benchmark --count 20000
+'''
+import argparse
+import os
+import tempfile
+import time
+
+from pureapi import xmlparser
+from tests.publications_xml import write_publications_xml
+
+def run(path: str, backend: str, streaming: bool, cached: bool) -> float:
+    xmlparser.use_backend(backend)
+    cache = xmlparser.EntityCache() if cached else None
+    start = time.perf_counter()
+    if streaming:
+        for pub in xmlparser.iterrecords(path, parse=lambda elem: xmlparser.publication(elem, cache)):
+            pass
+    else:
+        with open(path, 'rb') as f:
+            for pub_elem in xmlparser.records(f.read()):
+                xmlparser.publication(pub_elem, cache)
+    return time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20000, help='Number of publications in the export.')
+    parser.add_argument('--persons', type=int, default=4, help='Number of persons per publication.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of processes for parallel_records().')
+    parser.add_argument('--chunk-bytes', type=int, default=4 * 2**20, help='Chunk size for parallel_records().')
+    args = parser.parse_args()
+
+    backends = ['etree'] + (['lxml'] if xmlparser.lxml_etree is not None else [])
+    original_backend = xmlparser.backend
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'publications.xml')
+        write_publications_xml(path, args.count, args.persons)
+        print(f'{args.count} publications, {os.path.getsize(path) / 2**20:.1f} MiB')
+        for backend in backends:
+            for streaming in (False, True):
+                for cached in (False, True):
+                    seconds = run(path, backend, streaming, cached)
+                    mode = ('iterrecords' if streaming else 'records') + (' cached' if cached else '')
+                    print(f'{backend:>6} {mode:>19}: {seconds:8.2f} s {args.count / seconds:10.0f} publications/s')
+            start = time.perf_counter()
+            for pub in xmlparser.parallel_records(
+                path,
+                processes=args.processes,
+                chunk_bytes=args.chunk_bytes,
+                cache_size=10000
+            ):
+                pass
+            seconds = time.perf_counter() - start
+            mode = f'parallel x{args.processes} cached'
+            print(f'{backend:>6} {mode:>19}: {seconds:8.2f} s {args.count / seconds:10.0f} publications/s')
+    xmlparser.use_backend(original_backend)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+'''An in-process cache of transformed records, by uuid, kept correct by the
+``changes`` collection.
+
+A ``RecordCache`` keeps up to ``maxsize`` transformed records in memory,
+evicting the least recently used, optionally for at most ``ttl`` seconds
+each, and optionally spills evicted records to a ``shelve`` file on disk.
+Its ``filter_all_by_uuid_transformed()`` serves cached records locally, and
+requests only the others. A ``ChangesInvalidator`` consumes the ``changes``
+collection in a background thread, and evicts, or refreshes, every cached
+record that changes, so that the cache stays correct without short TTLs.
+
+Example:
+    from pureapi import cache
+    records = cache.RecordCache(maxsize=20000)
+    with cache.ChangesInvalidator(records, start='2024-01-01', refresh=True):
+        ...
+        persons = list(records.filter_all_by_uuid_transformed('persons', uuids=uuids))
+'''
+from collections import OrderedDict
+import json
+import shelve
+import threading
+import time
+from typing import Dict, Iterator, List, Mapping, Optional, Set, Tuple
+
+import addict
+import attr
+
+from pureapi import client, records
+from pureapi.instrumentation import CombinedHooks
+from pureapi.mirror import _ChangesTokens, family_collections
+
+Key = Tuple[str, str, str]
+'''``(collection, uuid, version)``, where ``version`` is the Pure API version.'''
+
+class RecordCache:
+    '''A bounded LRU cache of transformed records, with an optional TTL and
+    optional spill to disk. Thread-safe.
+
+    ``hits`` and ``misses`` count lookups, e.g., for
+    ``metrics.PrometheusMetrics.register_cache()``.
+    '''
+
+    def __init__(
+        self,
+        *,
+        maxsize: int = 10000,
+        ttl: Optional[float] = None,
+        spill_path: Optional[str] = None,
+        config: client.Config = client.Config()
+    ):
+        '''
+        Args:
+            maxsize: Maximum number of records in memory.
+            ttl: Maximum seconds for which to keep each record. Default:
+                ``None``, to keep records until they are evicted or
+                invalidated.
+            spill_path: Path of a ``shelve`` file to which to move records
+                evicted from memory, instead of discarding them. Default:
+                ``None``, for no spill.
+            config: An instance of client.Config, for requests for records
+                not in the cache. Its ``version`` is part of every key.
+        '''
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self.config = config
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._records: 'OrderedDict[Key, Tuple[Optional[float], addict.Dict]]' = OrderedDict()
+        self._spill = shelve.open(spill_path) if spill_path is not None else None
+        # Numbers of requests in flight for records not in the cache, by key,
+        # and keys invalidated while in flight, whose responses may be stale:
+        self._in_flight: Dict[Key, int] = {}
+        self._stale: Set[Key] = set()
+
+    def _key(self, collection: str, uuid: str) -> Key:
+        return (collection, uuid, self.config.version)
+
+    @staticmethod
+    def _spill_key(key: Key) -> str:
+        return '\x00'.join(key)
+
+    def _expires(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl is not None else None
+
+    def get(self, collection: str, uuid: str) -> Optional[addict.Dict]:
+        '''Returns the cached record, or ``None`` if it is not cached, or
+        expired.'''
+        key = self._key(collection, uuid)
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is None and self._spill is not None:
+                spilled = self._spill.pop(self._spill_key(key), None)
+                if spilled is not None:
+                    # Spilled records are stored as JSON, because addict.Dict
+                    # objects do not survive pickling:
+                    data = json.loads(spilled[1])
+                    if self.config.record_type == 'slots':
+                        record = records.from_json(collection, data, version=self.config.version)
+                    else:
+                        record = addict.Dict(data)
+                    entry = (spilled[0], record)
+                    self._store(key, entry)
+            if entry is not None and entry[0] is not None and entry[0] <= time.time():
+                self._records.pop(key, None)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._records.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, collection: str, uuid: str, record: addict.Dict) -> None:
+        '''Caches a transformed record.'''
+        with self._lock:
+            self._store(self._key(collection, uuid), (self._expires(), record))
+
+    def _store(self, key: Key, entry: Tuple[Optional[float], addict.Dict]) -> None:
+        self._records[key] = entry
+        self._records.move_to_end(key)
+        while len(self._records) > self.maxsize:
+            evicted_key, (expires, record) = self._records.popitem(last=False)
+            if self._spill is not None:
+                self._spill[self._spill_key(evicted_key)] = (expires, json.dumps(records.to_dict(record)))
+
+    def invalidate(self, collection: str, uuid: str) -> bool:
+        '''Removes a record from the cache, including any spilled copy. If
+        the record is being requested, its response will not be cached.
+
+        Returns:
+            Whether the record was cached, or being requested.
+        '''
+        key = self._key(collection, uuid)
+        with self._lock:
+            found = self._records.pop(key, None) is not None
+            if self._spill is not None:
+                found = self._spill.pop(self._spill_key(key), None) is not None or found
+            if key in self._in_flight:
+                self._stale.add(key)
+                found = True
+            return found
+
+    def tracks(self, collection: str, uuid: str) -> bool:
+        '''Whether a record is cached, in memory or spilled, or being
+        requested to be cached, so that changes to it must be invalidated.'''
+        with self._lock:
+            return (collection, uuid) in self or self._key(collection, uuid) in self._in_flight
+
+    def _begin_requests(self, keys: List[Key]) -> None:
+        with self._lock:
+            for key in keys:
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    def _end_requests(self, keys: List[Key]) -> None:
+        with self._lock:
+            for key in keys:
+                self._in_flight[key] -= 1
+                if not self._in_flight[key]:
+                    del self._in_flight[key]
+                    self._stale.discard(key)
+
+    def _put_requested(self, collection: str, uuid: str, record: addict.Dict) -> None:
+        # Caches a requested record, unless it was invalidated while in flight:
+        key = self._key(collection, uuid)
+        with self._lock:
+            if key not in self._stale:
+                self._store(key, (self._expires(), record))
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        '''Whether ``(collection, uuid)`` is cached, in memory or spilled,
+        whether or not it has expired.'''
+        full_key = self._key(*key)
+        with self._lock:
+            return full_key in self._records or (
+                self._spill is not None and self._spill_key(full_key) in self._spill
+            )
+
+    def __len__(self) -> int:
+        '''Number of records in memory.'''
+        with self._lock:
+            return len(self._records)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            if self._spill is not None:
+                self._spill.clear()
+
+    def close(self) -> None:
+        '''Closes any spill file.'''
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+    def refresh(self, collection: str, uuids: List[str]) -> int:
+        '''Requests records again, and replaces any cached copies. Records
+        that the Pure API no longer returns are removed.
+
+        Returns:
+            The number of records refreshed.
+        '''
+        returned = set()
+        keys = [self._key(collection, uuid) for uuid in uuids]
+        self._begin_requests(keys)
+        try:
+            for record in client.filter_all_by_uuid_transformed(collection, uuids=uuids, config=self.config):
+                self._put_requested(collection, record.uuid, record)
+                returned.add(record.uuid)
+        finally:
+            self._end_requests(keys)
+        for uuid in uuids:
+            if uuid not in returned:
+                self.invalidate(collection, uuid)
+        return len(returned)
+
+    def filter_all_by_uuid_transformed(
+        self,
+        resource_path: str,
+        payload: Mapping = None,
+        uuids: List = None,
+        uuids_per_request: int = 100
+    ) -> Iterator[addict.Dict]:
+        '''Like ``client.filter_all_by_uuid_transformed()``, but serves cached
+        records locally, requests only the others, and caches them. Yields
+        records in the order of the ``uuids``, skipping any that the Pure API
+        does not return.
+
+        Args:
+            resource_path: The name of the collection, e.g., ``persons``.
+            payload: See ``client.filter_all_by_uuid_transformed()``. Not part
+                of the cache key, so it must not restrict the records returned.
+            uuids: The list of uuids to retrieve. Default: ``[]``
+            uuids_per_request: The number of records to retrieve in each request.
+
+        Yields:
+            Individual records.
+        '''
+        if uuids is None:
+            uuids = []
+        collection = client._get_collection_from_resource_path(resource_path, self.config.version)
+        for group in client._group_items(items=uuids, items_per_group=uuids_per_request):
+            records = {uuid: self.get(collection, uuid) for uuid in group}
+            misses = list(dict.fromkeys(uuid for uuid, record in records.items() if record is None))
+            if misses:
+                keys = [self._key(collection, uuid) for uuid in misses]
+                self._begin_requests(keys)
+                try:
+                    for record in client.filter_all_by_uuid_transformed(
+                        resource_path,
+                        payload=payload,
+                        uuids=misses,
+                        uuids_per_request=uuids_per_request,
+                        config=self.config
+                    ):
+                        self._put_requested(collection, record.uuid, record)
+                        records[record.uuid] = record
+                finally:
+                    self._end_requests(keys)
+            for uuid in group:
+                if records.get(uuid) is not None:
+                    yield records[uuid]
+
+class ChangesInvalidator:
+    '''Consumes the ``changes`` collection in a background thread, evicting,
+    or refreshing, every cached record that changes.'''
+
+    def __init__(
+        self,
+        cache: RecordCache,
+        start: str,
+        *,
+        refresh: bool = False,
+        poll_interval: float = 60.0,
+        config: client.Config = None
+    ):
+        '''
+        Args:
+            cache: The cache to keep correct.
+            start: Date in ISO 8601 format, YYYY-MM-DD, or a resumption
+                token, from which to start consuming changes. Should be no
+                later than when the cache started filling.
+            refresh: Whether to request changed records again, instead of
+                only evicting them. Records with ``DELETE`` changes are always
+                evicted.
+            poll_interval: Seconds to wait for more changes after reaching
+                the end of the ``changes`` collection.
+            config: An instance of client.Config. Default: The ``config`` of
+                the ``cache``.
+        '''
+        self.cache = cache
+        self.resumption_token = start
+        '''Resumption token, or date, from which the next poll starts.'''
+        self.refresh = refresh
+        self.poll_interval = poll_interval
+        self.config = config if config is not None else cache.config
+        self.invalidated = 0
+        '''Number of cached records evicted or refreshed.'''
+        self.error: Optional[Exception] = None
+        '''The exception from the last failed poll, if any. Failed polls are
+        retried after ``poll_interval``.'''
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll(self) -> int:
+        '''Applies all changes since the last poll, in the calling thread.
+
+        Returns:
+            The number of cached records evicted or refreshed.
+        '''
+        invalidated = 0
+        tokens = _ChangesTokens()
+        hooks = tokens if self.config.hooks is None else CombinedHooks((self.config.hooks, tokens))
+        for r in client.get_all_changes(self.resumption_token, config=attr.evolve(self.config, hooks=hooks)):
+            json_page = r.json()
+            # Only the last change to each record matters:
+            latest = {}
+            for change in json_page['items']:
+                collection = family_collections.get(change.get('familySystemName'))
+                if collection is not None and 'uuid' in change:
+                    latest[(collection, change['uuid'])] = change.get('changeType')
+            refreshed = {}
+            for (collection, uuid), change_type in latest.items():
+                if not self.cache.tracks(collection, uuid):
+                    continue
+                invalidated += 1
+                if self.refresh and change_type != 'DELETE' and (collection, uuid) in self.cache:
+                    refreshed.setdefault(collection, []).append(uuid)
+                else:
+                    self.cache.invalidate(collection, uuid)
+            for collection, uuids in refreshed.items():
+                self.cache.refresh(collection, uuids)
+            self.resumption_token = str(json_page['resumptionToken'])
+            if self._stop.is_set():
+                break
+        # Pages without changes that follow the last page with changes still
+        # advance the token, so that the next poll need not request them again:
+        if tokens.resumption_token is not None:
+            self.resumption_token = tokens.resumption_token
+        self.invalidated += invalidated
+        return invalidated
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+                self.error = None
+            except Exception as e:
+                self.error = e
+            self._stop.wait(self.poll_interval)
+
+    def start(self) -> 'ChangesInvalidator':
+        self._thread = threading.Thread(target=self._run, name='pureapi-changes-invalidator', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        '''Stops polling, after any page of changes in progress.'''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'ChangesInvalidator':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -1,7 +1,10 @@
 from functools import partial
 import math
 import os
-from typing import Callable, Iterator, List, Mapping, MutableMapping
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterator, List, Mapping, MutableMapping, Optional
 
 import addict
 import attr
@@ -9,9 +12,11 @@ import requests
 from requests.exceptions import RequestException, HTTPError
 from tenacity import Retrying, wait_exponential
 
-from pureapi import response
+from pureapi import profiling, records, response
 from pureapi.common import default_version, valid_collection, valid_version, PureAPIInvalidCollectionError, PureAPIInvalidVersionError
 from pureapi.exceptions import PureAPIException
+from pureapi.instrumentation import Hooks, PageEvent, RequestEvent, hooks_for
+from pureapi.transport import RequestsTransport, Transport
 
 env_key_varname: str = 'PURE_API_KEY'
 '''Environment variable name for a Pure API key. Defaults to PURE_API_KEY.
@@ -54,6 +59,10 @@ def default_retryer() -> Callable:
     '''
     return Retrying(wait=wait_exponential(multiplier=1, max=60), reraise=True)
 
+def default_transport() -> Transport:
+    '''Returns a new ``transport.RequestsTransport``. See Config for more details.'''
+    return RequestsTransport()
+
 class PureAPIClientException(PureAPIException):
     '''Base class for exceptions specific to pureapi.client.'''
     def __init__(self, *args, **kwargs):
@@ -73,6 +82,9 @@ def env_domain() -> str:
 def _get_collection_from_resource_path(resource_path: str, version: str) -> str:
     '''Extracts the collection name from a Pure API URL resource path.
 
+    Metadata resources of a collection, e.g., ``persons-meta/orderings``,
+    belong to the collection, e.g., ``persons``.
+
     Args:
         resource_path: URL path, without the base URL, to a Pure API resource.
         config: Instance of pureapi.client.Config.
@@ -85,6 +97,8 @@ def _get_collection_from_resource_path(resource_path: str, version: str) -> str:
             invalid for the given API version.
     '''
     collection = resource_path.split('/')[0]
+    if collection.endswith('-meta'):
+        collection = collection[:-len('-meta')]
     if not valid_collection(collection=collection, version=version):
         raise PureAPIInvalidCollectionError(collection=collection, version=version)
     return collection
@@ -177,6 +191,75 @@ class Config:
     inputs and outputs interchangeable with those of ``tenacity.Retrying()``.
     Default: Return value of ``default_retryer()``.'''
 
+    transport: Transport = attr.ib(
+        factory=default_transport,
+        validator=attr.validators.instance_of(Transport)
+    )
+    '''Transport that prepares and sends HTTP requests, e.g., to record and
+    replay them. See ``pureapi.transport``. Default: Return value of
+    ``default_transport()``.'''
+
+    validator: Optional[Callable] = attr.ib(
+        default=None,
+        validator=attr.validators.optional(attr.validators.is_callable())
+    )
+    '''A function that validates raw JSON records before the ``*_transformed()``
+    functions transform them. Must accept a collection name, a record, and a
+    ``version`` keyword argument, e.g., an instance of
+    ``validation.SampledValidator``. Default: ``None``, for no validation.'''
+
+    hooks: Optional[Hooks] = attr.ib(
+        default=None,
+        validator=attr.validators.optional(attr.validators.instance_of(Hooks))
+    )
+    '''Instrumentation hooks that receive request, retry, decoding and
+    transformation events, e.g., an instance of
+    ``instrumentation.MetricsCollector``. See ``pureapi.instrumentation``.
+    Default: ``None``, for no instrumentation.'''
+
+    profile: bool = attr.ib(
+        factory=profiling.env_profile,
+        validator=attr.validators.instance_of(bool)
+    )
+    '''Whether the ``*_transformed()`` functions attribute time to network
+    wait, JSON decoding, transformation, and the consumer, and write a
+    breakdown to ``stderr`` at the end of each run. See ``pureapi.profiling``.
+    Default: Return value of ``profiling.env_profile()``.'''
+
+    profile_samples: Optional[str] = attr.ib(
+        factory=profiling.env_profile_samples,
+        validator=attr.validators.optional(attr.validators.instance_of(str))
+    )
+    '''Path of a file to which the ``*_transformed()`` functions write
+    collapsed stacks from a sampling profiler, for flamegraphs. Enables
+    profiling. Default: Return value of ``profiling.env_profile_samples()``.'''
+
+    max_resident_pages: Optional[int] = attr.ib(
+        default=None,
+        validator=attr.validators.optional([attr.validators.instance_of(int), attr.validators.ge(1)])
+    )
+    '''Bounded-memory mode for the ``*_transformed()`` functions. If set, at
+    most this many pages are resident at any time, counting each page from the
+    start of its request until the caller has received its last record, and
+    including its response body, its decoded JSON, and any transformed records
+    not yet yielded. Each raw record is released as soon as it is transformed,
+    and each response body as soon as it is decoded. With ``1``, requests are
+    sequential; with more, a background thread prefetches up to this many
+    pages while the caller processes records. Transformed records that the
+    caller keeps are not counted. Ignored when profiling. Default: ``None``,
+    for no bound, in which case up to two pages may be resident while the
+    next page downloads.'''
+
+    record_type: str = attr.ib(
+        default='addict',
+        validator=attr.validators.in_(records.record_types)
+    )
+    '''Type of the records that the ``*_transformed()`` functions return:
+    ``addict`` for ``addict.Dict`` objects, from ``response.transform()``, or
+    ``slots`` for compact, schema-generated record classes, from
+    ``records.from_json()``, with lazily converted nested objects. See
+    ``pureapi.records``. Default: ``addict``'''
+
     base_url: str = attr.ib(init=False)
     '''Pure API entrypoint URL. Should not be included in constructor
     parameters. The constructor generates this automatically based on
@@ -206,6 +289,214 @@ def preconfig(config: Config, *args: Callable) -> List[Callable]:
     '''
     return [partial(function, config=config) for function in args]
 
+def _transform(collection: str, item: MutableMapping, config: Config) -> addict.Dict:
+    '''Transforms a raw JSON record with ``response.transform()``, or, if
+    ``config.record_type`` is ``slots``, ``records.from_json()``, first
+    passing it to ``config.validator``, if any.
+
+    Args:
+        collection: The name of the collection to which the record belongs.
+        item: A mapping representing a JSON record.
+        config: An instance of Config.
+
+    Returns:
+        A transformed record.
+    '''
+    if config.validator is not None:
+        config.validator(collection, item, version=config.version)
+    construct = records.from_json if config.record_type == 'slots' else response.transform
+    hooks = hooks_for(config.hooks)
+    if hooks is None:
+        return construct(collection, item, version=config.version)
+    start = time.perf_counter()
+    record = construct(collection, item, version=config.version)
+    hooks.record_transformed(collection, time.perf_counter() - start)
+    return record
+
+def _decode(r: requests.Response, collection: str, config: Config) -> Any:
+    '''Decodes the JSON body of a response, calling
+    ``page_decoded()`` on ``config.hooks`` and any registered hooks.
+
+    Args:
+        r: An HTTP response object.
+        collection: The name of the collection requested.
+        config: An instance of Config.
+
+    Returns:
+        The decoded JSON.
+    '''
+    hooks = hooks_for(config.hooks)
+    if hooks is None:
+        return r.json()
+    start = time.perf_counter()
+    json = r.json()
+    seconds = time.perf_counter() - start
+    records = len(json.get('items') or []) if isinstance(json, dict) else 0
+    hooks.page_decoded(PageEvent(collection=collection, records=records, bytes=len(r.content), seconds=seconds))
+    return json
+
+def _transformed_records(
+    collection: str,
+    responses: Iterator[requests.Response],
+    config: Config,
+    decode: bool = True
+) -> Iterator[addict.Dict]:
+    '''Yields the transformed records in each of the ``responses``, profiling
+    the run if ``config.profile`` or ``config.profile_samples`` is set.
+
+    Args:
+        collection: The name of the collection requested.
+        responses: HTTP response objects.
+        config: An instance of Config.
+        decode: Whether to decode responses with ``_decode()``, calling any
+            hooks. ``False`` for responses the caller already decoded that way.
+
+    Yields:
+        Individual records.
+    '''
+    def records(r: requests.Response) -> List:
+        return (_decode(r, collection, config) if decode else r.json())['items']
+
+    if config.profile or config.profile_samples is not None:
+        yield from profiling.profiled(
+            collection,
+            responses,
+            records,
+            lambda item: _transform(collection, item, config),
+            samples_path=config.profile_samples
+        )
+        return
+    if config.max_resident_pages is not None:
+        for items in _bounded_pages(responses, records, config.max_resident_pages):
+            # Release each raw record as soon as it is transformed, so that a
+            # page's raw and transformed records are never all resident at once:
+            items.reverse()
+            while items:
+                yield _transform(collection, items.pop(), config)
+        return
+    for r in responses:
+        for item in records(r):
+            yield _transform(collection, item, config)
+
+def _bounded_pages(
+    responses: Iterator[requests.Response],
+    records: Callable[[requests.Response], List],
+    max_pages: int
+) -> Iterator[List]:
+    '''Yields the raw records in each of the ``responses``, with at most
+    ``max_pages`` pages resident at any time. See ``Config.max_resident_pages``.
+
+    A page is resident from the start of its request until the caller asks for
+    the next page. Response objects, and so their bodies, are released as soon
+    as they are decoded.
+
+    Args:
+        responses: HTTP response objects.
+        records: Returns the raw records in a response.
+        max_pages: Maximum number of resident pages. With more than one, a
+            background thread requests and decodes pages ahead of the caller.
+
+    Yields:
+        Lists of raw records, one per response.
+    '''
+    if max_pages <= 1:
+        for r in responses:
+            items = records(r)
+            del r
+            yield items
+            del items
+        return
+
+    slots = threading.Semaphore(max_pages)
+    pages = queue.Queue()
+    stopped = threading.Event()
+
+    def prefetch():
+        try:
+            while True:
+                slots.acquire()
+                if stopped.is_set():
+                    return
+                r = next(responses, None)
+                if r is None:
+                    break
+                items = records(r)
+                del r
+                pages.put((items, None))
+                del items
+        except BaseException as e:
+            pages.put((None, e))
+            return
+        pages.put((None, None))
+
+    prefetcher = threading.Thread(target=prefetch, name='pureapi-prefetch', daemon=True)
+    prefetcher.start()
+    try:
+        while True:
+            items, error = pages.get()
+            if error is not None:
+                raise error
+            if items is None:
+                return
+            yield items
+            del items
+            slots.release()
+    finally:
+        # Wake the prefetcher if it is waiting for a slot, so that it exits:
+        stopped.set()
+        slots.release()
+
+def _send(
+    method: str,
+    collection: str,
+    resource_path: str,
+    params: Mapping,
+    prepped: requests.PreparedRequest,
+    config: Config
+) -> requests.Response:
+    '''Sends a prepared request with ``config.transport``, via
+    ``config.retryer``, calling ``config.hooks`` and any registered hooks
+    before and after the request, and before each retry.
+
+    Args:
+        method: The HTTP method.
+        collection: The name of the collection requested.
+        resource_path: URL path to a Pure API resource.
+        params: URL query string params or JSON payload, for instrumentation.
+        prepped: The prepared request.
+        config: An instance of Config.
+
+    Returns:
+        An HTTP response object, whatever its status code.
+    '''
+    hooks = hooks_for(config.hooks)
+    if hooks is None:
+        return config.retryer(config.transport.send, prepped, timeout=(10, 360))
+
+    event = RequestEvent(method=method, collection=collection, resource_path=resource_path, params=params)
+    def send(prepped: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        event.attempts += 1
+        if event.attempts > 1:
+            hooks.retry(event)
+        try:
+            return config.transport.send(prepped, **kwargs)
+        except Exception as e:
+            event.error = e
+            raise
+
+    hooks.request_start(event)
+    try:
+        r = config.retryer(send, prepped, timeout=(10, 360))
+        event.status = r.status_code
+        event.bytes = len(r.content)
+        return r
+    except BaseException as e:
+        event.error = e
+        raise
+    finally:
+        event.seconds = time.perf_counter() - event.started
+        hooks.request_end(event)
+
 def get(resource_path: str, params: Mapping = None, config: Config = Config()) -> requests.Response:
     '''Makes an HTTP GET request for Pure API resources.
 
@@ -238,30 +529,62 @@ def get(resource_path: str, params: Mapping = None, config: Config = Config()) -
         params = {}
 
     collection = _get_collection_from_resource_path(resource_path, config.version)
-    with requests.Session() as s:
-        prepped = s.prepare_request(requests.Request('GET', config.base_url + resource_path, params=params))
-        prepped.headers = {**prepped.headers, **config.headers}
+    prepped = config.transport.prepare(requests.Request('GET', config.base_url + resource_path, params=params))
+    prepped.headers = {**prepped.headers, **config.headers}
+
+    try:
+        r = _send('GET', collection, resource_path, params, prepped, config)
+        r.raise_for_status()
+        return r
+    except HTTPError as http_exc:
+        raise PureAPIHTTPError(
+            f'GET request for resource path {resource_path} with params {params} returned HTTP status {http_exc.response.status_code}',
+            request=http_exc.request,
+            response=http_exc.response
+        ) from http_exc
+    except RequestException as req_exc:
+        raise PureAPIRequestException(
+            f'Failed GET request for resource path {resource_path} with params {params}',
+            request=req_exc.request,
+            response=req_exc.response
+        ) from req_exc
+    except Exception as e:
+        raise PureAPIClientException(
+            f'Unexpected exception for GET request for resource path {resource_path} with params {params}'
+        ) from e
+
+def _get_all_windows(resource_path: str, params: MutableMapping, config: Config) -> List[MutableMapping]:
+    '''Requests the count of all records matching the ``params``, then
+    calculates the params for each window of records ``get_all()`` requests.
 
-        try:
-            r = config.retryer(s.send, prepped, timeout=(10, 360))
-            r.raise_for_status()
-            return r
-        except HTTPError as http_exc:
-            raise PureAPIHTTPError(
-                f'GET request for resource path {resource_path} with params {params} returned HTTP status {http_exc.response.status_code}',
-                request=http_exc.request,
-                response=http_exc.response
-            ) from http_exc
-        except RequestException as req_exc:
-            raise PureAPIRequestException(
-                f'Failed GET request for resource path {resource_path} with params {params}',
-                request=req_exc.request,
-                response=req_exc.response
-            ) from req_exc
-        except Exception as e:
-            raise PureAPIClientException(
-                f'Unexpected exception for GET request for resource path {resource_path} with params {params}'
-            ) from e
+    Args:
+        resource_path: URL path to a Pure API resource.
+        params: A mapping representing URL query string params. Sets
+            ``params['size']`` to 100 if missing.
+        config: An instance of Config.
+
+    Returns:
+        Params for each window, in order of offset.
+    '''
+    count_params = {
+        **params,
+        'size': 0,
+        'offset': 0,
+    }
+    r = get(resource_path, count_params, config)
+    json = r.json()
+    record_count = int(json['count'])
+    window_size = int(params.setdefault('size', 100))
+    window_count = int(math.ceil(float(record_count) / window_size))
+
+    return [
+        {
+            **params,
+            'offset': window * window_size,
+            'size': window_size,
+        }
+        for window in range(0, window_count)
+    ]
 
 def get_all(resource_path: str, params: Mapping = None, config: Config = Config()) -> Iterator[requests.Response]:
     '''Makes as many HTTP GET requests as necessary to get all resources in a
@@ -295,23 +618,7 @@ def get_all(resource_path: str, params: Mapping = None, config: Config = Config(
     if params is None:
         params = {}
 
-    count_params = {
-        **params,
-        'size': 0,
-        'offset': 0,
-    }
-    r = get(resource_path, count_params, config)
-    json = r.json()
-    record_count = int(json['count'])
-    window_size = int(params.setdefault('size', 100))
-    window_count = int(math.ceil(float(record_count) / window_size))
-
-    for window in range(0, window_count):
-        window_params = {
-            **params,
-            'offset': window * window_size,
-            'size': window_size,
-        }
+    for window_params in _get_all_windows(resource_path, params, config):
         yield get(resource_path, window_params, config)
 
 def get_all_transformed(
@@ -349,9 +656,7 @@ def get_all_transformed(
         params = {}
 
     collection = _get_collection_from_resource_path(resource_path, config.version)
-    for r in get_all(resource_path, params, config):
-        for item in r.json()['items']:
-            yield response.transform(collection, item, version=config.version)
+    yield from _transformed_records(collection, get_all(resource_path, params, config), config)
 
 def get_all_changes(start_date: str, params: Mapping = None, config: Config = Config()) -> Iterator[requests.Response]:
     '''Makes as many HTTP GET requests as necessary to get all resources from
@@ -389,11 +694,19 @@ def get_all_changes(start_date: str, params: Mapping = None, config: Config = Co
     next_token_or_date = start_date
     while(True):
         r = get('changes/' + next_token_or_date, params, config)
-        json = r.json()
+        json = _decode(r, 'changes', config)
 
         next_token_or_date = str(json['resumptionToken'])
-
-        if int(json['count']) == 0 or 'items' not in json:
+        more_changes = json['moreChanges']
+        count = int(json['count'])
+        has_items = 'items' in json
+        # Keep no decoded page while the caller processes the response:
+        del json
+        hooks = hooks_for(config.hooks)
+        if hooks is not None:
+            hooks.changes_page(next_token_or_date, more_changes is True, count)
+
+        if count == 0 or not has_items:
             # We skip these responses, under the assumption that a caller wanting all changes will
             # have no use for a response that contains no changes.
             # The "count" in changes responses has different semantics from all other endpoints.
@@ -404,14 +717,15 @@ def get_all_changes(start_date: str, params: Mapping = None, config: Config = Co
             # -- https://support.pure.elsevier.com/browse/PURESUPPORT-63657?focusedCommentId=560888&page=com.atlassian.jira.plugin.system.issuetabpanels:comment-tabpanel#comment-560888
             # We have seen counts of 0, sometimes in multiple, consecutive responses. When "count"
             # is zero, there will be no "items", so we check for that, too, for some extra protection.
-            if json['moreChanges'] is True:
+            if more_changes is True:
                 continue
             else:
                 return
 
         yield r
+        del r
 
-        if json['moreChanges'] is False:
+        if more_changes is False:
             return
 
 def get_all_changes_transformed(
@@ -447,9 +761,7 @@ def get_all_changes_transformed(
     if params is None:
         params = {}
 
-    for r in get_all_changes(start_date, params, config):
-        for item in r.json()['items']:
-            yield response.transform('changes', item, version=config.version)
+    yield from _transformed_records('changes', get_all_changes(start_date, params, config), config, decode=False)
 
 def filter(resource_path: str, payload: Mapping = None, config: Config = Config()) -> requests.Response:
     '''Makes an HTTP POST request for Pure API resources, filtered according to
@@ -484,30 +796,65 @@ def filter(resource_path: str, payload: Mapping = None, config: Config = Config(
         payload = {}
 
     collection = _get_collection_from_resource_path(resource_path, config.version)
-    with requests.Session() as s:
-        prepped = s.prepare_request(requests.Request('POST', config.base_url + resource_path, json=payload))
-        prepped.headers = {**prepped.headers, **config.headers}
+    prepped = config.transport.prepare(requests.Request('POST', config.base_url + resource_path, json=payload))
+    prepped.headers = {**prepped.headers, **config.headers}
+
+    try:
+        r = _send('POST', collection, resource_path, payload, prepped, config)
+        r.raise_for_status()
+        return r
+    except HTTPError as http_exc:
+        raise PureAPIHTTPError(
+            f'POST request for resource path {resource_path} with payload {payload} returned HTTP status {http_exc.response.status_code}',
+            request=http_exc.request,
+            response=http_exc.response
+        ) from http_exc
+    except RequestException as req_exc:
+        raise PureAPIRequestException(
+            f'Failed POST request for resource path {resource_path} with payload {payload}',
+            request=req_exc.request,
+            response=req_exc.response
+        ) from req_exc
+    except Exception as e:
+        raise PureAPIClientException(
+            f'Unexpected exception for POST request for resource path {resource_path} with payload {payload}'
+        ) from e
+
+def _filter_all_windows(resource_path: str, payload: MutableMapping, config: Config) -> List[MutableMapping]:
+    '''Requests the count of all records matching the ``payload``, then
+    calculates the payload for each window of records ``filter_all()``
+    requests.
 
-        try:
-            r = config.retryer(s.send, prepped, timeout=(10, 360))
-            r.raise_for_status()
-            return r
-        except HTTPError as http_exc:
-            raise PureAPIHTTPError(
-                f'POST request for resource path {resource_path} with payload {payload} returned HTTP status {http_exc.response.status_code}',
-                request=http_exc.request,
-                response=http_exc.response
-            ) from http_exc
-        except RequestException as req_exc:
-            raise PureAPIRequestException(
-                f'Failed POST request for resource path {resource_path} with payload {payload}',
-                request=req_exc.request,
-                response=req_exc.response
-            ) from req_exc
-        except Exception as e:
-            raise PureAPIClientException(
-                f'Unexpected exception for POST request for resource path {resource_path} with payload {payload}'
-            ) from e
+    Args:
+        resource_path: URL path to a Pure API resource.
+        payload: A mapping representing JSON filters of the collection. Sets
+            ``payload['size']`` to 100 if missing or invalid.
+        config: An instance of Config.
+
+    Returns:
+        Payloads for each window, in order of offset.
+    '''
+    count_payload = {
+        **payload,
+        'size': 0,
+        'offset': 0,
+    }
+    r = filter(resource_path, count_payload, config)
+    json = r.json()
+    record_count = int(json['count'])
+    window_size = int(payload.setdefault('size', 100))
+    if window_size <= 0:
+        window_size = 100
+    payload['size'] = window_size
+    window_count = int(math.ceil(float(record_count) / window_size))
+
+    return [
+        {
+            **payload,
+            'offset': window * window_size,
+        }
+        for window in range(0, window_count)
+    ]
 
 def filter_all(resource_path: str, payload: Mapping = None, config: Config = Config()) -> Iterator[requests.Response]:
     '''Makes as many HTTP POST requests as necessary to retrieve all resources in
@@ -541,25 +888,7 @@ def filter_all(resource_path: str, payload: Mapping = None, config: Config = Con
     if payload is None:
         payload = {}
 
-    count_payload = {
-        **payload,
-        'size': 0,
-        'offset': 0,
-    }
-    r = filter(resource_path, count_payload, config)
-    json = r.json()
-    record_count = int(json['count'])
-    window_size = int(payload.setdefault('size', 100))
-    if window_size <= 0:
-        window_size = 100
-    payload['size'] = window_size
-    window_count = int(math.ceil(float(record_count) / window_size))
-
-    for window in range(0, window_count):
-        window_payload = {
-            **payload,
-            'offset': window * window_size,
-        }
+    for window_payload in _filter_all_windows(resource_path, payload, config):
         yield filter(resource_path, window_payload, config)
 
 def _group_items(items: List = None, items_per_group: int = 100) -> Iterator[List]:
@@ -718,9 +1047,7 @@ def filter_all_transformed(
         payload = {}
 
     collection = _get_collection_from_resource_path(resource_path, config.version)
-    for r in filter_all(resource_path, payload, config):
-        for item in r.json()['items']:
-            yield response.transform(collection, item, version=config.version)
+    yield from _transformed_records(collection, filter_all(resource_path, payload, config), config)
 
 def filter_all_by_uuid_transformed(
     resource_path: str,
@@ -765,15 +1092,14 @@ def filter_all_by_uuid_transformed(
         uuids = []
 
     collection = _get_collection_from_resource_path(resource_path, config.version)
-    for r in filter_all_by_uuid(
+    responses = filter_all_by_uuid(
         resource_path,
         payload=payload,
         uuids=uuids,
         uuids_per_request=uuids_per_request,
         config=config
-    ):
-        for item in r.json()['items']:
-            yield response.transform(collection, item, version=config.version)
+    )
+    yield from _transformed_records(collection, responses, config)
 
 def filter_all_by_id_transformed(
     resource_path: str,
@@ -818,12 +1144,110 @@ def filter_all_by_id_transformed(
         ids = []
 
     collection = _get_collection_from_resource_path(resource_path, config.version)
-    for r in filter_all_by_id(
+    responses = filter_all_by_id(
         resource_path,
         payload=payload,
         ids=ids,
         ids_per_request=ids_per_request,
         config=config
-    ):
-        for item in r.json()['items']:
-            yield response.transform(collection, item, version=config.version)
+    )
+    yield from _transformed_records(collection, responses, config)
+
+def export(
+    resource_path: str,
+    sink: Any,
+    params: Mapping = None,
+    payload: Mapping = None,
+    transformed: bool = False,
+    max_queued_pages: int = 2,
+    config: Config = Config()
+) -> int:
+    '''Writes all records in a collection to a ``sink``, e.g., one of the
+    rolling-file sinks in ``pureapi.sinks``.
+
+    Uses ``get_all()`` or, if ``payload`` is given, ``filter_all()``. A
+    background writer thread transforms, if requested, and writes each page
+    of records while the next page downloads. At most ``max_queued_pages``
+    pages wait for the writer at any time, so memory use stays bounded
+    regardless of the size of the collection. The sink is closed when the
+    export finishes, even if it fails.
+
+    Args:
+        resource_path: URL path to a Pure API resource, to be appended to the
+            ``Config.base_url``. Do not include a leading forward slash (``/``).
+        sink: An object with ``write(collection, items)`` and ``close()``
+            methods.
+        params: A mapping representing URL query string params, for
+            ``get_all()``. Default: ``{'size': 100}``
+        payload: A mapping representing JSON filters of the collection, for
+            ``filter_all()``. Default: ``None``, to use ``get_all()``.
+        transformed: Whether to write records transformed as by the
+            ``*_transformed()`` functions, instead of raw JSON records.
+            Default: ``False``
+        max_queued_pages: Maximum number of pages waiting for the writer.
+            Default: 2
+        config: An instance of Config. If not provided, this function attempts
+            to automatically instantiate a Config based on environment variables
+            and default values.
+
+    Returns:
+        The number of records written.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection, the first
+            segment in the resource_path, is invalid for the given API version.
+        PureAPIHTTPError: If the response includes an HTTP error code, possibly
+            after multiple retries.
+        PureAPIRequestException: If the request generated some error unrelated
+            to any HTTP error status.
+        PureAPIClientException: Some unexpected exception that is none of the
+            above, including any exception raised by the sink.
+    '''
+    collection = _get_collection_from_resource_path(resource_path, config.version)
+    if payload is not None:
+        responses = filter_all(resource_path, payload, config)
+    else:
+        responses = get_all(resource_path, params, config)
+
+    pages = queue.Queue(maxsize=max(1, int(max_queued_pages)))
+    stop = object()
+    writer_errors = []
+    written = 0
+
+    def write_pages():
+        nonlocal written
+        while True:
+            items = pages.get()
+            if items is stop:
+                return
+            if writer_errors:
+                # Keep draining, so that the producer never blocks on a full queue.
+                continue
+            try:
+                if transformed:
+                    items = [_transform(collection, item, config) for item in items]
+                sink.write(collection, items)
+                written += len(items)
+            except Exception as e:
+                writer_errors.append(e)
+
+    writer = threading.Thread(target=write_pages, name=f'pureapi-export-{collection}', daemon=True)
+    writer.start()
+    try:
+        for r in responses:
+            items = _decode(r, collection, config)['items']
+            del r
+            pages.put(items)
+            del items
+            if writer_errors:
+                break
+    finally:
+        pages.put(stop)
+        writer.join()
+        sink.close()
+
+    if writer_errors:
+        raise PureAPIClientException(
+            f'Failed to write records from resource path {resource_path} to sink {sink}'
+        ) from writer_errors[0]
+    return written
@@ -0,0 +1,386 @@
+'''Columnar export of Pure API records.
+
+Converts pages of raw JSON records directly into columnar batches, bypassing
+the ``addict.Dict`` objects of ``response.transform()``. The columns for each
+collection derive from the schema for a Pure API version: scalar fields,
+including scalar fields of nested objects up to a configurable depth, e.g.,
+``title.value`` and ``type.uri``. Lists of nested objects, e.g.,
+``personAssociations`` and ``electronicVersions``, become child tables, with
+a ``parent_uuid`` column that refers to the ``uuid`` of the parent record.
+
+Batches are plain Python lists by column, convertible to Arrow record batches
+or NumPy structured arrays, if ``pyarrow`` or ``numpy`` are installed.
+
+Example:
+    from pureapi import client, columnar
+    responses = client.get_all('research-outputs')
+    columnar.write(
+        columnar.batches(responses, 'research-outputs'),
+        'research-outputs-parquet/',
+    )
+'''
+import os
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, MutableMapping, Optional, Sequence, Tuple
+
+import attr
+import requests
+
+from pureapi import common
+from pureapi.exceptions import PureAPIException
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError: # pragma: no cover
+    pyarrow = None
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+_scalar_types: Mapping[str, Tuple[type, ...]] = {
+    'string': (str,),
+    'integer': (int,),
+    'number': (int, float),
+    'boolean': (bool,),
+}
+'''Python types of decoded JSON scalar values, by swagger.io type name.'''
+
+default_depth: int = 2
+'''Default depth of nested objects from which to include scalar fields as
+columns. Depth ``1`` includes only top-level scalar fields.'''
+
+class PureAPIColumnarException(PureAPIException):
+    '''Raised when a columnar batch cannot be converted or written.'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+@attr.s(auto_attribs=True, frozen=True)
+class Column:
+    '''A column derived from a schema field.'''
+
+    name: str
+    '''Column name: the dotted path to the field, e.g., ``title.value``.'''
+
+    path: Tuple[str, ...]
+    '''Keys to the field in a record, e.g., ``('title', 'value')``.'''
+
+    type_name: str
+    '''swagger.io type name of the field: ``string``, ``integer``, ``number``,
+    or ``boolean``.'''
+
+def _scalar_columns(definition: str, version: str, depth: int, prefix: Tuple[str, ...] = ()) -> List[Column]:
+    columns = []
+    for name, schema in common.properties_for(definition=definition, version=version).items():
+        path = prefix + (name,)
+        if '$ref' in schema:
+            if depth > 1:
+                columns.extend(_scalar_columns(common._ref_name(schema['$ref']), version, depth - 1, path))
+        elif schema.get('type') in _scalar_types:
+            columns.append(Column(name='.'.join(path), path=path, type_name=schema['type']))
+    return columns
+
+def _item_definition(collection: str, version: str) -> str:
+    definition = common.item_definition_for(collection=collection, version=version)
+    if definition is None:
+        raise PureAPIColumnarException(f'No record definition for collection "{collection}" in version "{version}"')
+    return definition
+
+def columns_for(collection: str, *, version: str = None, depth: int = default_depth) -> Tuple[Column, ...]:
+    '''Returns the columns for records in a ``collection``.
+
+    Args:
+        collection: The name of the collection.
+        version: The Pure API version, without the decimal point.
+        depth: Depth of nested objects from which to include scalar fields.
+
+    Returns:
+        A tuple of columns, in schema order.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection name is
+            invalid for the given API version.
+        PureAPIColumnarException: If the schema defines no records for the
+            collection.
+    '''
+    if version is None:
+        version = common.default_version()
+    return tuple(_scalar_columns(_item_definition(collection, version), version, depth))
+
+def child_tables_for(collection: str, *, version: str = None) -> Mapping[str, str]:
+    '''Returns the names of all fields in records in a ``collection`` that are
+    lists of nested objects, each of which may become a child table, mapped to
+    the schema definition names of those objects.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection name is
+            invalid for the given API version.
+        PureAPIColumnarException: If the schema defines no records for the
+            collection.
+    '''
+    if version is None:
+        version = common.default_version()
+    return {
+        name: common._ref_name(schema['items']['$ref'])
+        for name, schema in common.properties_for(definition=_item_definition(collection, version), version=version).items()
+        if schema.get('type') == 'array' and '$ref' in schema.get('items', {})
+    }
+
+def _getter(column: Column) -> Callable[[Mapping], Any]:
+    '''Compiles a function that gets the value of a column from a record,
+    returning ``None`` for missing fields, or for values of the wrong type.'''
+    types = _scalar_types[column.type_name]
+    exclude_bool = column.type_name in ('integer', 'number')
+    path = column.path
+
+    def checked(value: Any) -> Any:
+        if value is None or not isinstance(value, types) or (exclude_bool and isinstance(value, bool)):
+            return None
+        return value
+
+    if len(path) == 1:
+        (key,) = path
+        return lambda record: checked(record.get(key))
+
+    def get(record: Mapping) -> Any:
+        value = record
+        for key in path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return checked(value)
+    return get
+
+@attr.s(auto_attribs=True)
+class ColumnBatch:
+    '''A batch of rows, stored by column, as Python lists.'''
+
+    name: str
+    '''Table name. For child tables, the parent collection and the field name,
+    e.g., ``research-outputs.personAssociations``.'''
+
+    columns: Tuple[Column, ...]
+    '''The columns in the batch, in order.'''
+
+    data: MutableMapping[str, List] = attr.ib(factory=dict)
+    '''Column values, by column name.'''
+
+    @property
+    def num_rows(self) -> int:
+        return len(next(iter(self.data.values()), []))
+
+    def to_pydict(self) -> MutableMapping[str, List]:
+        '''Returns the column values, by column name.'''
+        return self.data
+
+    def to_arrow(self) -> 'pyarrow.RecordBatch':
+        '''Returns an Arrow record batch. Requires ``pyarrow``.
+
+        Raises:
+            PureAPIColumnarException: If ``pyarrow`` is not installed.
+        '''
+        _require('pyarrow', pyarrow)
+        arrow_types = {
+            'string': pyarrow.string(),
+            'integer': pyarrow.int64(),
+            'number': pyarrow.float64(),
+            'boolean': pyarrow.bool_(),
+        }
+        schema = pyarrow.schema([(column.name, arrow_types[column.type_name]) for column in self.columns])
+        return pyarrow.RecordBatch.from_pydict(self.data, schema=schema)
+
+    def to_numpy(self) -> 'numpy.ndarray':
+        '''Returns a NumPy structured array. Requires ``numpy``.
+
+        Because any field may be missing from a record, ``number`` columns
+        have a ``float64`` dtype, with ``NaN`` for missing values, and all other
+        columns have an ``object`` dtype, with ``None`` for missing values.
+
+        Raises:
+            PureAPIColumnarException: If ``numpy`` is not installed.
+        '''
+        _require('numpy', numpy)
+        dtype = [(column.name, 'f8' if column.type_name == 'number' else 'O') for column in self.columns]
+        array = numpy.empty(self.num_rows, dtype=dtype)
+        for column in self.columns:
+            values = self.data[column.name]
+            if column.type_name == 'number':
+                values = [numpy.nan if value is None else value for value in values]
+            array[column.name] = values
+        return array
+
+def _require(name: str, module: Any) -> None:
+    if module is None:
+        raise PureAPIColumnarException(f'{name} is required for this operation, but is not installed')
+
+class _TableBuilder:
+    '''Builds column batches for a single table, with compiled getters.'''
+
+    def __init__(self, name: str, columns: Sequence[Column], key_columns: Sequence[Column] = ()):
+        self.name = name
+        self.key_columns = tuple(key_columns)
+        self.columns = self.key_columns + tuple(columns)
+        self.getters = [(column.name, _getter(column)) for column in columns]
+
+    def build(self, rows: Iterable[Tuple[Tuple, Mapping]]) -> ColumnBatch:
+        data = {column.name: [] for column in self.columns}
+        key_lists = [data[column.name] for column in self.key_columns]
+        value_lists = [(data[name], getter) for name, getter in self.getters]
+        for keys, record in rows:
+            for key_list, key in zip(key_lists, keys):
+                key_list.append(key)
+            for value_list, getter in value_lists:
+                value_list.append(getter(record))
+        return ColumnBatch(name=self.name, columns=self.columns, data=data)
+
+class ColumnarConverter:
+    '''Converts lists of raw JSON records from one collection into column
+    batches, one for the records themselves, and one for each child table.
+
+    Columns and getters are compiled once, when the converter is created.
+    '''
+
+    def __init__(
+        self,
+        collection: str,
+        *,
+        version: str = None,
+        depth: int = default_depth,
+        children: Optional[Sequence[str]] = None
+    ):
+        '''
+        Args:
+            collection: The name of the collection.
+            version: The Pure API version, without the decimal point.
+            depth: Depth of nested objects from which to include scalar fields.
+            children: Names of fields containing lists of nested objects to
+                convert into child tables. Default: all such fields, as
+                returned by ``child_tables_for()``.
+
+        Raises:
+            common.PureAPIInvalidCollectionError: If the collection name is
+                invalid for the given API version.
+            PureAPIColumnarException: If the schema defines no records for the
+                collection, or some of the ``children`` are not lists of
+                nested objects.
+        '''
+        if version is None:
+            version = common.default_version()
+        self.collection = collection
+        self.table = _TableBuilder(collection, columns_for(collection, version=version, depth=depth))
+        child_definitions = child_tables_for(collection, version=version)
+        if children is None:
+            children = tuple(child_definitions)
+        unknown = [child for child in children if child not in child_definitions]
+        if unknown:
+            raise PureAPIColumnarException(f'Not lists of nested objects in collection "{collection}": {unknown}')
+        key_columns = (
+            Column(name='parent_uuid', path=('parent_uuid',), type_name='string'),
+            Column(name='ordinal', path=('ordinal',), type_name='integer'),
+        )
+        self.child_tables = {
+            child: _TableBuilder(
+                f'{collection}.{child}',
+                _scalar_columns(child_definitions[child], version, depth),
+                key_columns
+            )
+            for child in children
+        }
+
+    def convert(self, items: Sequence[Mapping]) -> MutableMapping[str, ColumnBatch]:
+        '''Converts raw JSON records into column batches.
+
+        Args:
+            items: Raw JSON records, e.g., the ``items`` in a response.
+
+        Returns:
+            Column batches, by table name.
+        '''
+        batches = {self.collection: self.table.build(((), item) for item in items)}
+        for child, builder in self.child_tables.items():
+            batches[builder.name] = builder.build(
+                ((item.get('uuid'), ordinal), child_item)
+                for item in items
+                for ordinal, child_item in enumerate(item.get(child) or ())
+                if isinstance(child_item, dict)
+            )
+        return batches
+
+def batches(
+    responses: Iterable[requests.Response],
+    collection: str,
+    *,
+    version: str = None,
+    depth: int = default_depth,
+    children: Optional[Sequence[str]] = None
+) -> Iterator[MutableMapping[str, ColumnBatch]]:
+    '''Converts each response in ``responses``, e.g., from ``client.get_all()``
+    or ``client.filter_all()``, into column batches.
+
+    Args:
+        responses: HTTP responses containing records from the ``collection``.
+        collection: The name of the collection.
+        version: The Pure API version, without the decimal point.
+        depth: Depth of nested objects from which to include scalar fields.
+        children: Names of fields to convert into child tables. See
+            ``ColumnarConverter``.
+
+    Yields:
+        Column batches for each response, by table name.
+    '''
+    converter = ColumnarConverter(collection, version=version, depth=depth, children=children)
+    for r in responses:
+        yield converter.convert(r.json()['items'])
+
+def write(
+    table_batches: Iterable[Mapping[str, ColumnBatch]],
+    directory: os.PathLike,
+    *,
+    format: str = 'parquet'
+) -> MutableMapping[str, Path]:
+    '''Writes column batches, e.g., from ``batches()``, to one Parquet or
+    Feather file per table, in ``directory``. Requires ``pyarrow``.
+
+    Writes each batch as it arrives, so only one batch per table is in memory
+    at any time.
+
+    Args:
+        table_batches: Column batches, by table name.
+        directory: Directory in which to write the files. Created if missing.
+        format: ``parquet`` or ``feather``.
+
+    Returns:
+        Paths of the written files, by table name.
+
+    Raises:
+        PureAPIColumnarException: If ``pyarrow`` is not installed, or the
+            ``format`` is unsupported.
+    '''
+    _require('pyarrow', pyarrow)
+    if format not in ('parquet', 'feather'):
+        raise PureAPIColumnarException(f'Unsupported format "{format}"')
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    writers = {}
+    paths = {}
+    try:
+        for batches_by_table in table_batches:
+            for name, batch in batches_by_table.items():
+                record_batch = batch.to_arrow()
+                if name not in writers:
+                    paths[name] = directory / f'{name}.{format}'
+                    if format == 'parquet':
+                        writers[name] = pyarrow.parquet.ParquetWriter(paths[name], record_batch.schema)
+                    else:
+                        writers[name] = pyarrow.ipc.new_file(str(paths[name]), record_batch.schema)
+                if format == 'parquet':
+                    writers[name].write_batch(record_batch)
+                else:
+                    writers[name].write(record_batch)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return paths
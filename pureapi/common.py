@@ -2,7 +2,7 @@ import functools
 import json
 import os
 from pathlib import Path
-from typing import Any, Callable, MutableMapping, Tuple, TypeVar, cast
+from typing import Any, Callable, MutableMapping, Optional, Tuple, TypeVar, cast
 
 from pureapi.exceptions import PureAPIException
 
@@ -147,3 +147,66 @@ def validate_collection(func: F) -> F:
             raise PureAPIInvalidCollectionError(collection=kwargs['collection'], version=kwargs['version'])
         return func(*args, **kwargs)
     return cast(F, wrapper_validate_collection)
+
+@functools.lru_cache(maxsize=None)
+@validate_version
+def definitions_for(*, version: str = None) -> MutableMapping:
+    '''Returns a mapping of all definitions, by name, in the schema for the
+    given Pure API ``version``.'''
+    return schema_for(version=version)['definitions']
+
+def _ref_name(ref: str) -> str:
+    '''Returns the definition name from a swagger.io ``$ref`` string, e.g.,
+    ``WSPerson`` from ``#/definitions/WSPerson``.'''
+    return ref.rsplit('/', 1)[-1]
+
+@functools.lru_cache(maxsize=None)
+@validate_collection
+def item_definition_for(*, collection: str, version: str = None) -> Optional[str]:
+    '''Returns the name of the schema definition for individual records in the
+    given ``collection``, or ``None`` if the schema defines no list results for
+    the collection.
+
+    Raises:
+        PureAPIInvalidCollectionError: If the given ``collection`` is invalid
+        for the ``version``.
+    '''
+    paths = schema_for(version=version)['paths']
+    for path in (f'/{collection}', f'/{collection}/{{tokenOrDate}}'):
+        try:
+            list_ref = paths[path]['get']['responses']['200']['schema']['$ref']
+            list_definition = definitions_for(version=version)[_ref_name(list_ref)]
+            return _ref_name(list_definition['properties']['items']['items']['$ref'])
+        except KeyError:
+            continue
+    return None
+
+@functools.lru_cache(maxsize=None)
+@validate_version
+def properties_for(*, definition: str, version: str = None) -> MutableMapping:
+    '''Returns a mapping of all properties, by name, of the schema
+    ``definition`` for the given Pure API ``version``.
+
+    Includes properties inherited through ``allOf``, and also properties of
+    any sub-types that extend the ``definition``, e.g., ``volume`` from
+    ``WSContributionToJournal`` for ``WSResearchOutput``, because records in a
+    collection may be any of these sub-types. Returns an empty mapping for
+    unknown definitions, and for definitions that specify no properties.
+    '''
+    definitions = definitions_for(version=version)
+    properties = {}
+
+    def add_properties(name: str) -> None:
+        for part in definitions.get(name, {}).get('allOf', [definitions.get(name, {})]):
+            if '$ref' in part:
+                add_properties(_ref_name(part['$ref']))
+            for property_name, property_schema in part.get('properties', {}).items():
+                properties.setdefault(property_name, property_schema)
+
+    add_properties(definition)
+    ref = f'#/definitions/{definition}'
+    for name, schema in definitions.items():
+        if any(part.get('$ref') == ref for part in schema.get('allOf', [])):
+            for property_name, property_schema in properties_for(definition=name, version=version).items():
+                properties.setdefault(property_name, property_schema)
+    return properties
@@ -0,0 +1,370 @@
+'''Harvests that stay consistent while records are added or deleted.
+
+``client.get_all()`` and ``client.filter_all()`` calculate the offset of each
+window of records from a single count, taken at the start. When records are
+added or deleted during a long harvest, later windows shift: a deletion
+before the current offset moves a record into a window already requested, so
+the harvest misses it, and an addition moves a record into the next window,
+so the harvest returns it twice.
+
+The functions in this module harvest individual records instead, in a
+consistency mode that:
+
+* requests records in a stable ordering, e.g., ``created``, if the server
+  lists one at ``<collection>-meta/orderings``, so that added records come
+  last;
+* de-duplicates records by uuid, with a compact set of the uuids seen;
+* detects drift from changes in the count that each page reports, from
+  duplicates and from short pages, and re-checks the count at the end;
+* re-requests the windows that drift may have affected, from just before
+  the first window where it was detected, until a pass finds no drift, or
+  ``max_passes`` is reached.
+
+Records that are deleted after they were yielded cannot be taken back. A
+``ConsistencyReport`` records what happened, including any drift that
+remained.
+
+Example:
+    from pureapi import consistency
+    report = consistency.ConsistencyReport()
+    for ro in consistency.get_all_transformed('research-outputs', report=report):
+        ...
+    if report.drift:
+        ...
+'''
+from typing import Callable, Iterator, List, Mapping, MutableMapping, Optional, Sequence, Set, Tuple, Union
+
+import addict
+import attr
+
+from pureapi import client
+from pureapi.exceptions import PureAPIException
+
+preferred_orderings: Tuple[str, ...] = ('created',)
+'''Orderings under which records keep their relative positions when other
+records are added, in order of preference.'''
+
+class PureAPIConsistencyException(PureAPIException):
+    '''Raised, with ``strict=True``, when drift remains after all passes.'''
+    def __init__(self, *args, report: 'ConsistencyReport' = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.report = report
+
+@attr.s(auto_attribs=True)
+class ConsistencyReport:
+    '''What a consistent harvest found. Filled in as the harvest proceeds.'''
+
+    ordering: Optional[str] = None
+    '''The ordering requested, or ``None`` for the server's default.'''
+
+    initial_count: int = 0
+    '''Count of records at the start.'''
+
+    final_count: int = 0
+    '''Count of records at the end.'''
+
+    records: int = 0
+    '''Number of unique records yielded.'''
+
+    duplicates: int = 0
+    '''Number of records in the first pass skipped because they were already
+    yielded, i.e., that moved into a later window.'''
+
+    requests: int = 0
+    '''Number of windows requested, including re-requests.'''
+
+    passes: int = 0
+    '''Number of passes. ``1`` if there was no drift.'''
+
+    drift: bool = False
+    '''Whether drift remained after the last pass, so that records may be
+    missing.'''
+
+class _SeenSet:
+    '''A set of record uuids, stored as 128-bit integers, which take about
+    half the memory of uuid strings. Other identifiers are stored as they
+    are.'''
+
+    def __init__(self):
+        self._seen: Set[Union[int, str]] = set()
+
+    @staticmethod
+    def _key(uuid: str) -> Union[int, str]:
+        try:
+            return int(uuid.replace('-', ''), 16) if len(uuid) == 36 else uuid
+        except ValueError:
+            return uuid
+
+    def add(self, uuid: str) -> bool:
+        '''Adds a uuid, and returns whether it was new.'''
+        key = self._key(uuid)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+    def __contains__(self, uuid: str) -> bool:
+        return self._key(uuid) in self._seen
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+def orderings(resource_path: str, config: client.Config = client.Config()) -> List[str]:
+    '''Returns the orderings that the server supports for a collection, from
+    ``<collection>-meta/orderings``, or an empty list if it lists none.
+
+    Args:
+        resource_path: URL path to a Pure API collection, e.g., ``persons``.
+        config: An instance of client.Config.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection is invalid
+            for the API version.
+        client.PureAPIClientException: If the request fails for any reason
+            other than HTTP status 404.
+    '''
+    collection = client._get_collection_from_resource_path(resource_path, config.version)
+    try:
+        r = client.get(f'{collection}-meta/orderings', config=config)
+    except client.PureAPIHTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return []
+        raise
+    return list(r.json().get('orderings') or [])
+
+def stable_ordering(
+    resource_path: str,
+    preferred: Sequence[str] = preferred_orderings,
+    config: client.Config = client.Config()
+) -> Optional[str]:
+    '''Returns the first of the ``preferred`` orderings that the server
+    supports for a collection, or ``None``.'''
+    available = orderings(resource_path, config)
+    return next((ordering for ordering in preferred if ordering in available), None)
+
+def _consistent_items(
+    fetch: Callable[[int, int], Mapping],
+    size: int,
+    max_passes: int,
+    strict: bool,
+    report: ConsistencyReport
+) -> Iterator[MutableMapping]:
+    '''Yields unique raw records from windows of ``size`` records, re-requesting
+    windows affected by drift.
+
+    Args:
+        fetch: Requests the window at an offset, with a size, and returns the
+            decoded JSON. With a size of 0, returns only the count.
+    '''
+    seen = _SeenSet()
+    expected = report.initial_count = int(fetch(0, 0)['count'])
+    start_window = 0
+    for pass_number in range(1, max(1, int(max_passes)) + 1):
+        report.passes = pass_number
+        # The first window in which drift was detected, and by how many records
+        # the count changed:
+        drift_window: Optional[int] = None
+        shift = 0
+        window = start_window
+        while window * size < expected:
+            json = fetch(window * size, size)
+            report.requests += 1
+            count = int(json['count'])
+            items = json.get('items') or []
+            duplicates = 0
+            for item in items:
+                if seen.add(item['uuid']):
+                    report.records += 1
+                    yield item
+                else:
+                    duplicates += 1
+            short = len(items) < min(size, count - window * size)
+            # Later passes request records again, so only duplicates in the
+            # first pass show that records were added before them:
+            if pass_number > 1:
+                duplicates = 0
+            report.duplicates += duplicates
+            if drift_window is None and (count != expected or duplicates or short):
+                drift_window = window
+            shift += abs(count - expected)
+            expected = count
+            window += 1
+        final_count = int(fetch(0, 0)['count'])
+        if final_count != expected:
+            if drift_window is None:
+                drift_window = max(0, window - 1)
+            shift += abs(final_count - expected)
+        report.final_count = expected = final_count
+        if drift_window is None:
+            report.drift = False
+            return
+        report.drift = True
+        # Records may have moved back by up to ``shift`` positions, into
+        # windows before the one where drift was detected:
+        start_window = max(0, drift_window - 1 - (max(shift, 1) - 1) // size)
+    if strict:
+        raise PureAPIConsistencyException(
+            f'Records drifted in every one of {report.passes} passes',
+            report=report
+        )
+
+def _ordering(resource_path: str, ordering: Optional[str], config: client.Config) -> Optional[str]:
+    if ordering == 'auto':
+        return stable_ordering(resource_path, config=config)
+    return ordering
+
+def get_all(
+    resource_path: str,
+    params: Mapping = None,
+    *,
+    ordering: Optional[str] = 'auto',
+    max_passes: int = 3,
+    strict: bool = False,
+    report: ConsistencyReport = None,
+    config: client.Config = client.Config()
+) -> Iterator[MutableMapping]:
+    '''Like ``client.get_all()``, but in consistency mode, and yields
+    individual raw records, each once.
+
+    Args:
+        resource_path: See ``client.get_all()``.
+        params: See ``client.get_all()``. An ``order`` param overrides
+            ``ordering``.
+        ordering: The ordering in which to request records: ``auto`` for the
+            first of ``preferred_orderings`` that the server supports, if
+            any, or the name of an ordering, or ``None`` for the server's
+            default.
+        max_passes: Maximum number of passes over the windows affected by
+            drift, including the first pass over all windows.
+        strict: Whether to raise an exception if drift remains after the last
+            pass.
+        report: A ``ConsistencyReport`` to fill in. Default: ``None``, for a
+            new, discarded report.
+        config: An instance of client.Config.
+
+    Yields:
+        Individual raw records.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection, the first
+            segment in the resource_path, is invalid for the given API version.
+        client.PureAPIClientException: If any request fails, possibly after
+            multiple retries.
+        PureAPIConsistencyException: With ``strict=True``, if drift remains
+            after the last pass.
+    '''
+    params = dict(params) if params is not None else {}
+    if report is None:
+        report = ConsistencyReport()
+    if 'order' in params:
+        report.ordering = params['order']
+    else:
+        report.ordering = _ordering(resource_path, ordering, config)
+        if report.ordering is not None:
+            params['order'] = report.ordering
+    size = int(params.get('size') or 100)
+    if size <= 0:
+        size = 100
+
+    def fetch(offset: int, window_size: int) -> Mapping:
+        return client.get(resource_path, {**params, 'offset': offset, 'size': window_size}, config).json()
+
+    yield from _consistent_items(fetch, size, max_passes, strict, report)
+
+def filter_all(
+    resource_path: str,
+    payload: Mapping = None,
+    *,
+    ordering: Optional[str] = 'auto',
+    max_passes: int = 3,
+    strict: bool = False,
+    report: ConsistencyReport = None,
+    config: client.Config = client.Config()
+) -> Iterator[MutableMapping]:
+    '''Like ``client.filter_all()``, but in consistency mode, and yields
+    individual raw records, each once.
+
+    Args:
+        resource_path: See ``client.filter_all()``.
+        payload: See ``client.filter_all()``. An ``orderings`` field overrides
+            ``ordering``.
+        ordering: See ``get_all()``.
+        max_passes: See ``get_all()``.
+        strict: See ``get_all()``.
+        report: See ``get_all()``.
+        config: An instance of client.Config.
+
+    Yields:
+        Individual raw records.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection, the first
+            segment in the resource_path, is invalid for the given API version.
+        client.PureAPIClientException: If any request fails, possibly after
+            multiple retries.
+        PureAPIConsistencyException: With ``strict=True``, if drift remains
+            after the last pass.
+    '''
+    payload = dict(payload) if payload is not None else {}
+    if report is None:
+        report = ConsistencyReport()
+    if payload.get('orderings'):
+        report.ordering = payload['orderings'][0]
+    else:
+        report.ordering = _ordering(resource_path, ordering, config)
+        if report.ordering is not None:
+            payload['orderings'] = [report.ordering]
+    size = int(payload.get('size') or 100)
+    if size <= 0:
+        size = 100
+
+    def fetch(offset: int, window_size: int) -> Mapping:
+        return client.filter(resource_path, {**payload, 'offset': offset, 'size': window_size}, config).json()
+
+    yield from _consistent_items(fetch, size, max_passes, strict, report)
+
+def get_all_transformed(
+    resource_path: str,
+    params: Mapping = None,
+    *,
+    config: client.Config = client.Config(),
+    **kwargs
+) -> Iterator[addict.Dict]:
+    '''Like ``get_all()``, but yields transformed records, as
+    ``client.get_all_transformed()`` does.
+
+    Args:
+        resource_path: See ``get_all()``.
+        params: See ``get_all()``.
+        config: An instance of client.Config.
+        **kwargs: See ``get_all()``.
+
+    Yields:
+        Individual records.
+    '''
+    collection = client._get_collection_from_resource_path(resource_path, config.version)
+    for item in get_all(resource_path, params, config=config, **kwargs):
+        yield client._transform(collection, item, config)
+
+def filter_all_transformed(
+    resource_path: str,
+    payload: Mapping = None,
+    *,
+    config: client.Config = client.Config(),
+    **kwargs
+) -> Iterator[addict.Dict]:
+    '''Like ``filter_all()``, but yields transformed records, as
+    ``client.filter_all_transformed()`` does.
+
+    Args:
+        resource_path: See ``filter_all()``.
+        payload: See ``filter_all()``.
+        config: An instance of client.Config.
+        **kwargs: See ``filter_all()``.
+
+    Yields:
+        Individual records.
+    '''
+    collection = client._get_collection_from_resource_path(resource_path, config.version)
+    for item in filter_all(resource_path, payload, config=config, **kwargs):
+        yield client._transform(collection, item, config)
@@ -0,0 +1,212 @@
+'''Batched lookups of individual records by uuid.
+
+Application code often looks up records one at a time, e.g., the persons in
+a list of research outputs, at the cost of one round trip per record. A
+``DataLoader`` collects individual ``load()`` calls, from any number of
+threads or coroutines, for up to ``wait`` seconds or ``max_batch_size``
+uuids, whichever comes first, then requests each batch with a single
+``client.filter()`` request with ``uuids``, the same request that
+``client.filter_all_by_uuid()`` makes, and resolves each caller's future.
+
+Records that were requested but not returned, e.g., because they were
+deleted, resolve to ``None``, or, with ``raise_missing=True``, to a
+``PureAPIRecordNotFoundError``, and are reported in ``DataLoader.missing``.
+
+Examples:
+    from pureapi import dataloader
+    with dataloader.DataLoader() as loader:
+        futures = [loader.load('persons', uuid) for uuid in uuids]
+        persons = [future.result() for future in futures]
+
+    # With asyncio:
+    async def person_names(loader, uuids):
+        persons = await asyncio.gather(*(loader.aload('persons', uuid) for uuid in uuids))
+        return [person.name.lastName for person in persons if person is not None]
+'''
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import time
+from typing import Any, Dict, List, MutableMapping, Set, Tuple
+
+from pureapi import client
+from pureapi.exceptions import PureAPIException
+
+class PureAPIRecordNotFoundError(PureAPIException):
+    '''Raised for a record that was requested by uuid, but not returned.'''
+    def __init__(self, *args, collection: str = None, uuid: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collection = collection
+        self.uuid = uuid
+
+class _Batch:
+    '''Futures for the uuids waiting to be requested from one collection, one
+    for each lookup, by uuid.'''
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.futures: Dict[str, List[Future]] = {}
+
+class DataLoader:
+    '''Collects individual lookups of records by uuid into batched
+    ``client.filter()`` requests. Thread-safe.
+    '''
+
+    def __init__(
+        self,
+        *,
+        max_batch_size: int = 100,
+        wait: float = 0.005,
+        max_concurrent_batches: int = 4,
+        transformed: bool = True,
+        raise_missing: bool = False,
+        config: client.Config = client.Config()
+    ):
+        '''
+        Args:
+            max_batch_size: Maximum number of uuids in each request.
+            wait: Maximum seconds to wait for more lookups, after the first
+                one in a batch, before requesting the batch.
+            max_concurrent_batches: Maximum number of requests in flight.
+            transformed: Whether to resolve records transformed as by the
+                ``client.*_transformed()`` functions, instead of raw JSON
+                records.
+            raise_missing: Whether records that were not returned resolve to
+                a ``PureAPIRecordNotFoundError``, instead of ``None``.
+            config: An instance of client.Config.
+        '''
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.wait = wait
+        self.transformed = transformed
+        self.raise_missing = raise_missing
+        self.config = config
+        self.missing: Set[Tuple[str, str]] = set()
+        '''``(collection, uuid)`` of every record requested but not returned.'''
+        self.batch_count = 0
+        '''Number of requests made.'''
+        self._lock = threading.Condition()
+        self._batches: MutableMapping[str, _Batch] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix='pureapi-dataloader')
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch_due, name='pureapi-dataloader-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def load(self, collection: str, uuid: str) -> Future:
+        '''Returns a future for a record, to be requested in the next batch
+        for its collection. Lookups of the same uuid in the same batch share a
+        request, but each has its own future, so that cancelling one cancels
+        no others.
+
+        Args:
+            collection: The name of the collection, e.g., ``persons``.
+            uuid: The uuid of the record.
+
+        Returns:
+            A future that resolves to the record, or to ``None`` if it was
+            not returned.
+
+        Raises:
+            common.PureAPIInvalidCollectionError: If the collection is invalid
+                for the API version.
+        '''
+        client._get_collection_from_resource_path(collection, self.config.version)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('DataLoader is closed')
+            batch = self._batches.get(collection)
+            if batch is None:
+                batch = self._batches[collection] = _Batch(time.monotonic() + self.wait)
+                self._lock.notify()
+            future = Future()
+            batch.futures.setdefault(uuid, []).append(future)
+            if len(batch.futures) >= self.max_batch_size:
+                self._submit(collection)
+        return future
+
+    def load_many(self, collection: str, uuids: List[str]) -> List[Future]:
+        '''Like ``load()``, for many uuids.'''
+        return [self.load(collection, uuid) for uuid in uuids]
+
+    def get(self, collection: str, uuid: str) -> Any:
+        '''Like ``load()``, but waits for, and returns, the record.'''
+        return self.load(collection, uuid).result()
+
+    async def aload(self, collection: str, uuid: str) -> Any:
+        '''Like ``load()``, but awaitable, for use with asyncio.'''
+        return await asyncio.wrap_future(self.load(collection, uuid))
+
+    def flush(self) -> None:
+        '''Requests all waiting batches now.'''
+        with self._lock:
+            for collection in list(self._batches):
+                self._submit(collection)
+
+    def close(self) -> None:
+        '''Requests all waiting batches, waits for all requests to finish, and
+        stops accepting lookups.'''
+        with self._lock:
+            self._closed = True
+            for collection in list(self._batches):
+                self._submit(collection)
+            self._lock.notify()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> 'DataLoader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _submit(self, collection: str) -> None:
+        # Must be called with the lock held.
+        batch = self._batches.pop(collection)
+        self.batch_count += 1
+        self._executor.submit(self._request, collection, batch.futures)
+
+    def _dispatch_due(self) -> None:
+        with self._lock:
+            while not self._closed:
+                now = time.monotonic()
+                for collection, batch in list(self._batches.items()):
+                    if batch.deadline <= now:
+                        self._submit(collection)
+                timeout = min((batch.deadline for batch in self._batches.values()), default=None)
+                self._lock.wait(None if timeout is None else max(0.0, timeout - now))
+
+    def _request(self, collection: str, batch_futures: Dict[str, List[Future]]) -> None:
+        # Lookups cancelled before the request need no result, and can no longer
+        # be cancelled after it starts:
+        futures = {}
+        for uuid, uuid_futures in batch_futures.items():
+            running = [future for future in uuid_futures if future.set_running_or_notify_cancel()]
+            if running:
+                futures[uuid] = running
+        if not futures:
+            return
+        uuids = list(futures)
+        try:
+            r = client.filter(collection, {'uuids': uuids, 'size': len(uuids)}, self.config)
+            items = client._decode(r, collection, self.config).get('items', [])
+            records = {}
+            for item in items:
+                records[item['uuid']] = client._transform(collection, item, self.config) if self.transformed else item
+        except BaseException as e:
+            for uuid_futures in futures.values():
+                for future in uuid_futures:
+                    future.set_exception(e)
+            return
+        for uuid, uuid_futures in futures.items():
+            if uuid in records:
+                for future in uuid_futures:
+                    future.set_result(records[uuid])
+                continue
+            with self._lock:
+                self.missing.add((collection, uuid))
+            for future in uuid_futures:
+                if self.raise_missing:
+                    future.set_exception(PureAPIRecordNotFoundError(
+                        f'Record {uuid} not found in collection {collection}', collection=collection, uuid=uuid
+                    ))
+                else:
+                    future.set_result(None)
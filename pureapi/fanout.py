@@ -0,0 +1,278 @@
+'''Concurrent harvests of the same collections from multiple Pure API
+servers, or with multiple API keys.
+
+A fan-out runs the same workload, e.g., ``client.get_all_transformed()``, for
+each of several ``client.Config`` objects at once, each in its own thread, and
+yields every result tagged with the config it came from, as soon as it
+arrives. A harvest from N servers then takes roughly as long as the slowest
+of them, instead of the sum of all. Requests to the same server, even with
+different configs, e.g., API keys, share a concurrency limit.
+
+Example:
+    from pureapi import client, fanout
+    configs = {
+        'production': client.Config(domain='example.com', key='123-abc'),
+        'test': client.Config(domain='test.example.com', key='456-def'),
+    }
+    for result in fanout.get_all_transformed(configs, 'persons'):
+        print(result.tag, result.value.uuid)
+'''
+import queue
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Mapping, Optional
+
+import attr
+
+from pureapi import client
+from pureapi.exceptions import PureAPIException
+from pureapi.transport import LimitedTransport
+
+class PureAPIFanOutException(PureAPIException):
+    '''Raised when the workload for any config fails.'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+@attr.s(auto_attribs=True, frozen=True)
+class Tagged:
+    '''A single result of a fan-out, tagged with the config it came from.'''
+
+    tag: Hashable
+    '''Key of the config in the mapping passed to the fan-out.'''
+
+    value: Any = None
+    '''A result of the workload, e.g., a response or a record, or ``None`` if
+    the workload failed.'''
+
+    error: Optional[BaseException] = None
+    '''The exception with which the workload failed, only with
+    ``return_exceptions=True``.'''
+
+def server(config: client.Config) -> str:
+    '''Returns the server to which a config sends requests, by which the
+    fan-out functions limit concurrency: its protocol and domain.'''
+    return f'{config.protocol}://{config.domain}'
+
+def limited_configs(
+    configs: Mapping[Hashable, client.Config],
+    max_requests_per_server: int = 4,
+    server_limits: Mapping[str, int] = None
+) -> Dict[Hashable, client.Config]:
+    '''Returns copies of ``configs`` whose transports share a limit on the
+    number of requests in flight to each server.
+
+    Args:
+        configs: Configs, by tag.
+        max_requests_per_server: Default limit for each server.
+        server_limits: Limits for specific servers, by the return value of
+            ``server()``, e.g., ``{'https://example.com': 8}``.
+
+    Returns:
+        Configs, by tag.
+    '''
+    if server_limits is None:
+        server_limits = {}
+    semaphores: Dict[str, threading.BoundedSemaphore] = {}
+    limited = {}
+    for tag, config in configs.items():
+        key = server(config)
+        if key not in semaphores:
+            semaphores[key] = threading.BoundedSemaphore(max(1, int(server_limits.get(key, max_requests_per_server))))
+        limited[tag] = attr.evolve(config, transport=LimitedTransport(config.transport, semaphores[key]))
+    return limited
+
+def fan_out(
+    configs: Mapping[Hashable, client.Config],
+    workload: Callable[[client.Config], Iterable[Any]],
+    *,
+    max_requests_per_server: int = 4,
+    server_limits: Mapping[str, int] = None,
+    max_queued: int = 1000,
+    return_exceptions: bool = False
+) -> Iterator[Tagged]:
+    '''Runs a workload for each config concurrently, and yields its results,
+    tagged, in the order in which they arrive. Results for each config are in
+    the order in which its workload yields them.
+
+    Args:
+        configs: Configs, by tag.
+        workload: A function that accepts a config, and returns an iterable
+            of results, e.g.,
+            ``lambda config: client.get_all('persons', config=config)``.
+        max_requests_per_server: See ``limited_configs()``.
+        server_limits: See ``limited_configs()``.
+        max_queued: Maximum number of results waiting for the caller. Workloads
+            pause while the caller catches up, which bounds memory use.
+        return_exceptions: Whether to yield a ``Tagged`` result with an
+            ``error`` for a failed workload, and continue with the others,
+            instead of raising an exception.
+
+    Yields:
+        Tagged results.
+
+    Raises:
+        PureAPIFanOutException: If any workload fails, unless
+            ``return_exceptions`` is ``True``. The remaining workloads stop.
+    '''
+    results: queue.Queue = queue.Queue(maxsize=max(1, int(max_queued)))
+    stopped = threading.Event()
+    done = object()
+
+    def put(item: Any) -> bool:
+        # Wait for space, but give up if the caller has stopped:
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(tag: Hashable, config: client.Config) -> None:
+        try:
+            iterator = iter(workload(config))
+            try:
+                for value in iterator:
+                    if not put(Tagged(tag=tag, value=value)):
+                        return
+            finally:
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+        except Exception as e:
+            put(Tagged(tag=tag, error=e))
+        finally:
+            put(done)
+
+    threads: List[threading.Thread] = [
+        threading.Thread(target=run, args=(tag, config), name=f'pureapi-fanout-{tag}', daemon=True)
+        for tag, config in limited_configs(configs, max_requests_per_server, server_limits).items()
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        running = len(threads)
+        while running:
+            result = results.get()
+            if result is done:
+                running -= 1
+            elif result.error is not None and not return_exceptions:
+                raise PureAPIFanOutException(f'Workload for {result.tag!r} failed') from result.error
+            else:
+                yield result
+    finally:
+        stopped.set()
+
+def get_all(
+    configs: Mapping[Hashable, client.Config],
+    resource_path: str,
+    params: Mapping = None,
+    **kwargs: Any
+) -> Iterator[Tagged]:
+    '''Runs ``client.get_all()`` for each config concurrently.
+
+    Args:
+        configs: Configs, by tag.
+        resource_path: See ``client.get_all()``.
+        params: See ``client.get_all()``.
+        **kwargs: See ``fan_out()``.
+
+    Yields:
+        Tagged HTTP response objects.
+    '''
+    return fan_out(configs, lambda config: client.get_all(resource_path, params, config=config), **kwargs)
+
+def get_all_transformed(
+    configs: Mapping[Hashable, client.Config],
+    resource_path: str,
+    params: Mapping = None,
+    **kwargs: Any
+) -> Iterator[Tagged]:
+    '''Runs ``client.get_all_transformed()`` for each config concurrently.
+
+    Args:
+        configs: Configs, by tag.
+        resource_path: See ``client.get_all()``.
+        params: See ``client.get_all()``.
+        **kwargs: See ``fan_out()``.
+
+    Yields:
+        Tagged individual records.
+    '''
+    return fan_out(configs, lambda config: client.get_all_transformed(resource_path, params, config=config), **kwargs)
+
+def filter_all(
+    configs: Mapping[Hashable, client.Config],
+    resource_path: str,
+    payload: Mapping = None,
+    **kwargs: Any
+) -> Iterator[Tagged]:
+    '''Runs ``client.filter_all()`` for each config concurrently.
+
+    Args:
+        configs: Configs, by tag.
+        resource_path: See ``client.filter_all()``.
+        payload: See ``client.filter_all()``.
+        **kwargs: See ``fan_out()``.
+
+    Yields:
+        Tagged HTTP response objects.
+    '''
+    return fan_out(configs, lambda config: client.filter_all(resource_path, payload, config=config), **kwargs)
+
+def filter_all_transformed(
+    configs: Mapping[Hashable, client.Config],
+    resource_path: str,
+    payload: Mapping = None,
+    **kwargs: Any
+) -> Iterator[Tagged]:
+    '''Runs ``client.filter_all_transformed()`` for each config concurrently.
+
+    Args:
+        configs: Configs, by tag.
+        resource_path: See ``client.filter_all()``.
+        payload: See ``client.filter_all()``.
+        **kwargs: See ``fan_out()``.
+
+    Yields:
+        Tagged individual records.
+    '''
+    return fan_out(configs, lambda config: client.filter_all_transformed(resource_path, payload, config=config), **kwargs)
+
+def get_all_changes(
+    configs: Mapping[Hashable, client.Config],
+    start_date: str,
+    params: Mapping = None,
+    **kwargs: Any
+) -> Iterator[Tagged]:
+    '''Runs ``client.get_all_changes()`` for each config concurrently.
+
+    Args:
+        configs: Configs, by tag.
+        start_date: See ``client.get_all_changes()``.
+        params: See ``client.get_all_changes()``.
+        **kwargs: See ``fan_out()``.
+
+    Yields:
+        Tagged HTTP response objects.
+    '''
+    return fan_out(configs, lambda config: client.get_all_changes(start_date, params, config=config), **kwargs)
+
+def get_all_changes_transformed(
+    configs: Mapping[Hashable, client.Config],
+    start_date: str,
+    params: Mapping = None,
+    **kwargs: Any
+) -> Iterator[Tagged]:
+    '''Runs ``client.get_all_changes_transformed()`` for each config
+    concurrently.
+
+    Args:
+        configs: Configs, by tag.
+        start_date: See ``client.get_all_changes()``.
+        params: See ``client.get_all_changes()``.
+        **kwargs: See ``fan_out()``.
+
+    Yields:
+        Tagged individual records.
+    '''
+    return fan_out(configs, lambda config: client.get_all_changes_transformed(start_date, params, config=config), **kwargs)
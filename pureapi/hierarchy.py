@@ -0,0 +1,440 @@
+'''An in-memory index of the organisational-unit hierarchy.
+
+An ``OrganisationHierarchy`` is built in one pass over the records in the
+``organisational-units`` collection, from the ``parents`` of each record, and
+stores the hierarchy as compact arrays: a parent pointer for each unit, and
+the interval that its subtree occupies in a pre-order numbering of all units.
+A unit is an ancestor of another if and only if the other's number is in its
+interval, so ancestor tests take constant time, and the descendants of a unit
+are a contiguous slice of the pre-order, so subtree enumeration and rollups
+never walk records.
+
+The index can be saved to, and loaded from, a JSON file, and refreshed from
+the ``changes`` collection, like a ``mirror.Mirror``. Readers may query the
+index while it refreshes: each refresh swaps in a complete new index.
+
+Example:
+    from pureapi import hierarchy
+    orgs = hierarchy.OrganisationHierarchy.harvest()
+    orgs.save('orgs.json')
+    # Later, e.g., nightly:
+    orgs = hierarchy.OrganisationHierarchy.load('orgs.json')
+    orgs.refresh()
+    orgs.save('orgs.json')
+    department_uuids = orgs.descendants(college_uuid)
+'''
+from array import array
+from datetime import datetime, timezone
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Union
+
+import attr
+
+from pureapi import client
+from pureapi.exceptions import PureAPIException
+from pureapi.mirror import family_collections
+
+collection = 'organisational-units'
+'''The collection from which to build the hierarchy.'''
+
+_family = next(family for family, name in family_collections.items() if name == collection)
+
+_format_version = 1
+'''Version of the JSON file format written by ``save()``.'''
+
+class PureAPIHierarchyException(PureAPIException):
+    '''Raised when a hierarchy cannot be loaded or refreshed.'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+def parent_uuid(record: Mapping) -> Optional[str]:
+    '''Returns the uuid of the parent of an organisational unit, or ``None``
+    if it has none.
+
+    Units with more than one parent are indexed under the first one, so that
+    the index is a forest, in which every unit has a single ancestor chain.
+
+    Args:
+        record: A raw or transformed record from the ``organisational-units``
+            collection.
+
+    Returns:
+        The uuid of the first parent, if any.
+    '''
+    for parent in record.get('parents') or []:
+        uuid = parent.get('uuid') if isinstance(parent, Mapping) else None
+        if uuid:
+            return uuid
+    return None
+
+@attr.s(auto_attribs=True, frozen=True)
+class _Index:
+    '''Compact arrays for all units, by position in ``uuids``.'''
+
+    uuids: List[str]
+    positions: Dict[str, int]
+    parent: array
+    '''Position of the parent of each unit, or -1 for roots.'''
+
+    child_start: array
+    '''Start of the children of each unit in ``children``.'''
+
+    children: array
+    '''Positions of the children of all units, grouped by parent.'''
+
+    depth: array
+    '''Number of ancestors of each unit.'''
+
+    enter: array
+    '''Pre-order number of each unit.'''
+
+    exit: array
+    '''Pre-order number after the last descendant of each unit, so that the
+    subtree of a unit is the half-open interval ``[enter, exit)``.'''
+
+    order: array
+    '''Positions of units, in pre-order.'''
+
+def _build(parents: Mapping[str, Optional[str]]) -> _Index:
+    uuids = list(parents)
+    positions = {uuid: position for position, uuid in enumerate(uuids)}
+    n = len(uuids)
+    parent = array('l', (positions.get(parents[uuid], -1) for uuid in uuids))
+
+    # Pure should not contain cycles, but if it does, make the unit at which
+    # each cycle is detected a root, so that every unit is indexed:
+    state = bytearray(n) # 0: unvisited, 1: on the current path, 2: done
+    for start in range(n):
+        path = []
+        position = start
+        while position != -1 and state[position] == 0:
+            state[position] = 1
+            path.append(position)
+            position = parent[position]
+        if position != -1 and state[position] == 1:
+            parent[path[-1]] = -1
+        for position in path:
+            state[position] = 2
+
+    # Children, in compressed sparse row form, in input order: the children
+    # of each unit are children[child_start[position]:child_start[position + 1]].
+    child_start = array('l', [0]) * (n + 1)
+    for position in range(n):
+        if parent[position] != -1:
+            child_start[parent[position] + 1] += 1
+    for position in range(n):
+        child_start[position + 1] += child_start[position]
+    children = array('l', [0]) * child_start[n]
+    fill = array('l', child_start)
+    for position in range(n):
+        p = parent[position]
+        if p != -1:
+            children[fill[p]] = position
+            fill[p] += 1
+
+    depth = array('l', [0]) * n
+    enter = array('l', [0]) * n
+    exit = array('l', [0]) * n
+    order = array('l', [0]) * n
+    number = 0
+    for root in range(n):
+        if parent[root] != -1:
+            continue
+        # Iterative depth-first traversal, where each stack entry is a unit
+        # and the position of its next child:
+        stack = [(root, child_start[root])]
+        enter[root] = number
+        order[number] = root
+        number += 1
+        while stack:
+            position, next_child = stack[-1]
+            if next_child < child_start[position + 1]:
+                stack[-1] = (position, next_child + 1)
+                child = children[next_child]
+                depth[child] = depth[position] + 1
+                enter[child] = number
+                order[number] = child
+                number += 1
+                stack.append((child, child_start[child]))
+            else:
+                exit[position] = number
+                stack.pop()
+    return _Index(
+        uuids=uuids,
+        positions=positions,
+        parent=parent,
+        child_start=child_start,
+        children=children,
+        depth=depth,
+        enter=enter,
+        exit=exit,
+        order=order
+    )
+
+class OrganisationHierarchy:
+    '''An index of the organisational-unit hierarchy, for constant-time
+    ancestor tests, and fast subtree enumeration and rollups.
+
+    Units whose parent is not in the index are roots.
+    '''
+
+    def __init__(self, parents: Mapping[str, Optional[str]] = None, *, resumption_token: str = None):
+        '''
+        Args:
+            parents: The uuid of the parent of each unit, or ``None``, by the
+                uuid of the unit. Usually empty, with units added by
+                ``from_records()``, ``harvest()`` or ``load()``.
+            resumption_token: Date in ISO 8601 format, YYYY-MM-DD, or a
+                resumption token, from which ``refresh()`` will start.
+        '''
+        self._parents: Dict[str, Optional[str]] = dict(parents) if parents is not None else {}
+        self._index = _build(self._parents)
+        self.resumption_token = resumption_token
+        '''Date or resumption token from which the next ``refresh()`` will
+        start.'''
+
+    @classmethod
+    def from_records(cls, records: Iterable[Mapping], *, resumption_token: str = None) -> 'OrganisationHierarchy':
+        '''Builds a hierarchy from records in the ``organisational-units``
+        collection, e.g., from ``client.get_all_transformed()``.
+
+        Args:
+            records: Raw or transformed records.
+            resumption_token: See ``OrganisationHierarchy()``.
+
+        Returns:
+            A hierarchy.
+        '''
+        return cls({record['uuid']: parent_uuid(record) for record in records}, resumption_token=resumption_token)
+
+    @classmethod
+    def harvest(cls, params: Mapping = None, config: client.Config = client.Config()) -> 'OrganisationHierarchy':
+        '''Builds a hierarchy from all records in the ``organisational-units``
+        collection. The next ``refresh()`` will start from the date of the
+        harvest, so that no changes made during the harvest are lost.
+
+        Args:
+            params: See ``client.get_all()``.
+            config: An instance of client.Config.
+
+        Returns:
+            A hierarchy.
+        '''
+        start_date = datetime.now(timezone.utc).date().isoformat()
+        return cls.from_records(
+            client.get_all_transformed(collection, params, config=config),
+            resumption_token=start_date
+        )
+
+    def save(self, path: Union[str, os.PathLike]) -> None:
+        '''Writes the hierarchy, and its resumption token, to a JSON file.
+
+        Args:
+            path: Path to the file. Replaced if it exists.
+        '''
+        with open(path, 'w') as f:
+            json.dump({
+                'version': _format_version,
+                'resumption_token': self.resumption_token,
+                'parents': self._parents,
+            }, f)
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike]) -> 'OrganisationHierarchy':
+        '''Reads a hierarchy written by ``save()``.
+
+        Args:
+            path: Path to the file.
+
+        Returns:
+            A hierarchy.
+
+        Raises:
+            PureAPIHierarchyException: If the file is in an unsupported format.
+        '''
+        with open(path) as f:
+            saved = json.load(f)
+        if saved.get('version') != _format_version:
+            raise PureAPIHierarchyException(f'Unsupported hierarchy file format version: {saved.get("version")!r}')
+        return cls(saved['parents'], resumption_token=saved['resumption_token'])
+
+    def refresh(
+        self,
+        start_date: str = None,
+        *,
+        uuids_per_request: int = 100,
+        config: client.Config = client.Config()
+    ) -> int:
+        '''Applies all changes to organisational units since the last
+        ``harvest()`` or ``refresh()``. Units with changes are requested
+        again, and units with ``DELETE`` changes, or that the Pure API no
+        longer returns, are removed. Their children become roots, until they
+        return.
+
+        Args:
+            start_date: Date in ISO 8601 format, YYYY-MM-DD, or a resumption
+                token, from which to start. Default: ``resumption_token``.
+            uuids_per_request: Number of changed units to request in each
+                request.
+            config: An instance of client.Config.
+
+        Returns:
+            The number of units added, changed or removed.
+
+        Raises:
+            PureAPIHierarchyException: If there is no ``start_date`` and no
+                ``resumption_token``.
+            client.PureAPIClientException: If any request fails. Changes from
+                pages before the failure are kept.
+        '''
+        token_or_date = start_date if start_date is not None else self.resumption_token
+        if token_or_date is None:
+            raise PureAPIHierarchyException('No start date or resumption token. Harvest the hierarchy before refreshing.')
+        parents = dict(self._parents)
+        changed_count = 0
+        try:
+            for r in client.get_all_changes(token_or_date, config=config):
+                json_page = r.json()
+                # Only the last change to each unit matters:
+                latest: Dict[str, Optional[str]] = {}
+                for change in json_page['items']:
+                    if change.get('familySystemName') == _family and 'uuid' in change:
+                        latest.pop(change['uuid'], None)
+                        latest[change['uuid']] = change.get('changeType')
+                changed = [uuid for uuid, change_type in latest.items() if change_type != 'DELETE']
+                returned = set()
+                for record in client.filter_all_by_uuid_transformed(
+                    collection,
+                    uuids=changed,
+                    uuids_per_request=uuids_per_request,
+                    config=config
+                ):
+                    parents[record.uuid] = parent_uuid(record)
+                    returned.add(record.uuid)
+                for uuid in latest:
+                    if uuid not in returned:
+                        parents.pop(uuid, None)
+                changed_count += len(latest)
+                self.resumption_token = str(json_page['resumptionToken'])
+        finally:
+            if parents != self._parents:
+                self._index = _build(parents)
+                self._parents = parents
+        return changed_count
+
+    def __len__(self) -> int:
+        return len(self._index.uuids)
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._index.positions
+
+    def __iter__(self) -> Iterator[str]:
+        '''Iterates over the uuids of all units, in pre-order.'''
+        index = self._index
+        return (index.uuids[position] for position in index.order)
+
+    def _position(self, index: _Index, uuid: str) -> int:
+        try:
+            return index.positions[uuid]
+        except KeyError:
+            raise KeyError(f'No organisational unit {uuid} in the hierarchy') from None
+
+    def parent(self, uuid: str) -> Optional[str]:
+        '''Returns the uuid of the parent of a unit, or ``None`` for roots.
+
+        Raises:
+            KeyError: If the unit is not in the hierarchy. Likewise for all
+                other methods that accept uuids.
+        '''
+        index = self._index
+        parent = index.parent[self._position(index, uuid)]
+        return index.uuids[parent] if parent != -1 else None
+
+    def depth(self, uuid: str) -> int:
+        '''Returns the number of ancestors of a unit.'''
+        index = self._index
+        return index.depth[self._position(index, uuid)]
+
+    def ancestors(self, uuid: str) -> List[str]:
+        '''Returns the uuids of the ancestors of a unit, nearest first.'''
+        index = self._index
+        ancestors = []
+        position = index.parent[self._position(index, uuid)]
+        while position != -1:
+            ancestors.append(index.uuids[position])
+            position = index.parent[position]
+        return ancestors
+
+    def is_ancestor(self, ancestor: str, descendant: str, *, inclusive: bool = False) -> bool:
+        '''Whether a unit is an ancestor of another, in constant time.
+
+        Args:
+            ancestor: The uuid of the possible ancestor.
+            descendant: The uuid of the possible descendant.
+            inclusive: Whether a unit counts as its own ancestor.
+        '''
+        index = self._index
+        a = self._position(index, ancestor)
+        d = self._position(index, descendant)
+        if a == d:
+            return inclusive
+        return index.enter[a] <= index.enter[d] < index.exit[a]
+
+    def children(self, uuid: str) -> List[str]:
+        '''Returns the uuids of the children of a unit.'''
+        index = self._index
+        position = self._position(index, uuid)
+        return [
+            index.uuids[child]
+            for child in index.children[index.child_start[position]:index.child_start[position + 1]]
+        ]
+
+    def descendants(self, uuid: str, *, inclusive: bool = False) -> List[str]:
+        '''Returns the uuids of the descendants of a unit, in pre-order.
+
+        Args:
+            uuid: The uuid of the unit.
+            inclusive: Whether to include the unit itself, first.
+        '''
+        index = self._index
+        position = self._position(index, uuid)
+        start = index.enter[position] + (0 if inclusive else 1)
+        return [index.uuids[descendant] for descendant in index.order[start:index.exit[position]]]
+
+    def subtree_size(self, uuid: str) -> int:
+        '''Returns the number of units in the subtree of a unit, including
+        itself.'''
+        index = self._index
+        position = self._position(index, uuid)
+        return index.exit[position] - index.enter[position]
+
+    def roots(self) -> List[str]:
+        '''Returns the uuids of all units without a parent in the hierarchy.'''
+        index = self._index
+        return [index.uuids[position] for position in index.order if index.parent[position] == -1]
+
+    def rollup(self, values: Mapping[str, float]) -> Dict[str, float]:
+        '''Sums values, e.g., counts of research outputs, over the subtree of
+        every unit, in one pass over all units.
+
+        Args:
+            values: Values, by the uuid of a unit. Values for uuids that are
+                not in the hierarchy are ignored.
+
+        Returns:
+            The sum of the values of each unit and all its descendants, by
+            the uuid of the unit, for all units.
+        '''
+        index = self._index
+        totals = [0] * len(index.uuids)
+        for uuid, value in values.items():
+            position = index.positions.get(uuid)
+            if position is not None:
+                totals[position] += value
+        # In reverse pre-order, every unit comes after all its descendants:
+        for position in reversed(index.order):
+            parent = index.parent[position]
+            if parent != -1:
+                totals[parent] += totals[position]
+        return {index.uuids[position]: total for position, total in enumerate(totals)}
@@ -0,0 +1,356 @@
+'''Instrumentation hooks for ``pureapi.client``, and a built-in metrics
+collector.
+
+To receive events, pass an instance of a ``Hooks`` subclass to
+``client.Config``, or, to receive events for all requests, whatever their
+config, ``register()`` it. With the default, ``Config.hooks=None``, and no
+registered hooks, the client skips all instrumentation, at no cost.
+
+Example:
+    from pureapi import client, instrumentation
+    metrics = instrumentation.MetricsCollector()
+    config = client.Config(hooks=metrics)
+    for ro in client.get_all_transformed('research-outputs', config=config):
+        ...
+    print(metrics.report())
+'''
+from bisect import bisect_left
+import heapq
+import threading
+import time
+from typing import Any, Dict, List, Mapping, MutableMapping, Optional, Sequence, Tuple
+
+import attr
+
+@attr.s(auto_attribs=True)
+class RequestEvent:
+    '''A single request, possibly with multiple attempts. The same instance is
+    passed to ``Hooks.request_start()``, any ``Hooks.retry()`` calls, and
+    ``Hooks.request_end()``.'''
+
+    method: str
+    '''HTTP method: ``GET`` or ``POST``.'''
+
+    collection: str
+    resource_path: str
+    params: Optional[Mapping] = None
+    '''URL query string params for ``GET`` requests, or the JSON payload for
+    ``POST`` requests.'''
+
+    started: float = attr.ib(factory=time.perf_counter)
+    '''Start time, from ``time.perf_counter()``.'''
+
+    attempts: int = 0
+    '''Number of attempts so far, including the first.'''
+
+    status: Optional[int] = None
+    '''HTTP status code of the final response, or ``None`` if there was none.'''
+
+    bytes: int = 0
+    '''Size of the final response body.'''
+
+    seconds: Optional[float] = None
+    '''Total time for all attempts. Set at the end of the request.'''
+
+    error: Optional[BaseException] = None
+    '''Exception raised by the last failed attempt, if any.'''
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.attempts - 1)
+
+@attr.s(auto_attribs=True, frozen=True)
+class PageEvent:
+    '''Decoding of the JSON body of a single response.'''
+
+    collection: str
+    records: int
+    '''Number of records in the ``items`` of the response.'''
+
+    bytes: int
+    seconds: float
+    '''Time spent decoding JSON.'''
+
+class Hooks:
+    '''Base class for instrumentation hooks, which do nothing by default.
+
+    Subclasses override any of the methods below. The client may call hooks
+    from multiple threads at once, and ignores their return values. Hooks must
+    not raise exceptions.
+    '''
+
+    def request_start(self, event: RequestEvent) -> None:
+        '''Called before the first attempt of a request.'''
+
+    def retry(self, event: RequestEvent) -> None:
+        '''Called before each attempt after the first, with ``event.error``
+        set to the exception from the previous attempt.'''
+
+    def request_end(self, event: RequestEvent) -> None:
+        '''Called after the last attempt of a request, whether it succeeded
+        or failed. ``event.status`` may be an HTTP error status.'''
+
+    def page_decoded(self, event: PageEvent) -> None:
+        '''Called after decoding the JSON body of a response.'''
+
+    def record_transformed(self, collection: str, seconds: float) -> None:
+        '''Called after transforming a single record.'''
+
+    def changes_page(self, resumption_token: str, more_changes: bool, count: int) -> None:
+        '''Called for each page of the ``changes`` collection that
+        ``client.get_all_changes()`` receives, including pages with a count of
+        zero, with the resumption token for the next page.'''
+
+class CombinedHooks(Hooks):
+    '''Calls each of a sequence of hooks, in order.'''
+
+    def __init__(self, hooks: Sequence[Hooks]):
+        self.hooks = tuple(hooks)
+
+    def request_start(self, event: RequestEvent) -> None:
+        for hooks in self.hooks:
+            hooks.request_start(event)
+
+    def retry(self, event: RequestEvent) -> None:
+        for hooks in self.hooks:
+            hooks.retry(event)
+
+    def request_end(self, event: RequestEvent) -> None:
+        for hooks in self.hooks:
+            hooks.request_end(event)
+
+    def page_decoded(self, event: PageEvent) -> None:
+        for hooks in self.hooks:
+            hooks.page_decoded(event)
+
+    def record_transformed(self, collection: str, seconds: float) -> None:
+        for hooks in self.hooks:
+            hooks.record_transformed(collection, seconds)
+
+    def changes_page(self, resumption_token: str, more_changes: bool, count: int) -> None:
+        for hooks in self.hooks:
+            hooks.changes_page(resumption_token, more_changes, count)
+
+_registry_lock = threading.Lock()
+_registered: Tuple[Hooks, ...] = ()
+
+_max_combined = 64
+# Combined hooks, by id of the config hooks, with the config hooks and the
+# registered hooks they combine. ``register()`` and ``unregister()`` replace
+# ``global_hooks``, so its identity also identifies the registry generation:
+_combined: Dict[int, Tuple[Hooks, Hooks, CombinedHooks]] = {}
+
+global_hooks: Optional[Hooks] = None
+'''Hooks that receive events for all requests, combining all registered
+hooks, or ``None`` if there are none. Use ``register()`` and
+``unregister()`` instead of setting this directly.'''
+
+def register(hooks: Hooks) -> None:
+    '''Registers hooks to receive events for all requests, in addition to
+    any ``Config.hooks``.'''
+    global _registered, global_hooks
+    with _registry_lock:
+        if hooks not in _registered:
+            _registered = _registered + (hooks,)
+        global_hooks = _registered[0] if len(_registered) == 1 else CombinedHooks(_registered)
+        _combined.clear()
+
+def unregister(hooks: Hooks) -> None:
+    '''Unregisters hooks registered with ``register()``, if registered.'''
+    global _registered, global_hooks
+    with _registry_lock:
+        _registered = tuple(registered for registered in _registered if registered is not hooks)
+        if not _registered:
+            global_hooks = None
+        else:
+            global_hooks = _registered[0] if len(_registered) == 1 else CombinedHooks(_registered)
+        _combined.clear()
+
+def hooks_for(config_hooks: Optional[Hooks]) -> Optional[Hooks]:
+    '''Returns the hooks to call for a request, combining ``config_hooks``,
+    i.e., ``Config.hooks``, with any registered hooks, or ``None`` if there
+    are none. Combinations are cached, because this is called for every
+    request and record.'''
+    registered = global_hooks
+    if registered is None:
+        return config_hooks
+    if config_hooks is None:
+        return registered
+    cached = _combined.get(id(config_hooks))
+    if cached is not None and cached[0] is config_hooks and cached[1] is registered:
+        return cached[2]
+    combined = CombinedHooks((config_hooks, registered))
+    if len(_combined) >= _max_combined:
+        _combined.clear()
+    _combined[id(config_hooks)] = (config_hooks, registered, combined)
+    return combined
+
+default_buckets: Tuple[float, ...] = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 360.0
+)
+'''Upper bounds, in seconds, of latency histogram buckets.'''
+
+class Histogram:
+    '''A histogram of observed values, with fixed bucket upper bounds, a
+    count, and a sum. Not thread-safe on its own.'''
+
+    def __init__(self, buckets: Sequence[float] = default_buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        '''Counts of observations in each bucket, not cumulative. The last
+        count is for values greater than the greatest bucket bound.'''
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        '''Returns the upper bound of the bucket that contains the ``q``
+        quantile, or ``None`` if there are no observations, or the quantile is
+        greater than the greatest bucket bound.'''
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return None
+
+    def snapshot(self) -> MutableMapping:
+        return {'count': self.count, 'sum': self.sum, 'buckets': dict(zip(self.buckets, self.counts))}
+
+class MetricsCollector(Hooks):
+    '''Collects counters and latency histograms for requests, by collection
+    and status code, and for decoding and transforming, by collection. Also
+    keeps the slowest requests, with their params, e.g., to find which
+    offsets dominate the runtime of a harvest.
+
+    Status codes are strings, e.g., ``'200'``, or the name of the exception
+    type for requests that failed without a response.
+    '''
+
+    def __init__(self, *, buckets: Sequence[float] = default_buckets, slowest_count: int = 10):
+        '''
+        Args:
+            buckets: Upper bounds of latency histogram buckets, in seconds.
+            slowest_count: Number of slowest requests to keep.
+        '''
+        self.buckets = tuple(buckets)
+        self.slowest_count = slowest_count
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        '''Discards all collected metrics.'''
+        with self._lock:
+            self.requests: Dict[Tuple[str, str], int] = {}
+            '''Counts of requests, by ``(collection, status)``.'''
+            self.request_seconds: Dict[Tuple[str, str], Histogram] = {}
+            self.response_bytes: Dict[str, int] = {}
+            self.retries: Dict[str, int] = {}
+            self.in_flight = 0
+            '''Number of requests started but not yet ended.'''
+            self.records_decoded: Dict[str, int] = {}
+            self.decode_seconds: Dict[str, Histogram] = {}
+            self.records_transformed: Dict[str, int] = {}
+            self.transform_seconds: Dict[str, Histogram] = {}
+            self._slowest: List[Tuple[float, int, RequestEvent]] = []
+            self._sequence = 0
+
+    def _histogram(self, histograms: MutableMapping, key: Any) -> Histogram:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def request_start(self, event: RequestEvent) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def retry(self, event: RequestEvent) -> None:
+        with self._lock:
+            self.retries[event.collection] = self.retries.get(event.collection, 0) + 1
+
+    def request_end(self, event: RequestEvent) -> None:
+        status = str(event.status) if event.status is not None else type(event.error).__name__
+        key = (event.collection, status)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._histogram(self.request_seconds, key).observe(event.seconds)
+            self.response_bytes[event.collection] = self.response_bytes.get(event.collection, 0) + event.bytes
+            # A min-heap of the slowest requests; the sequence number breaks ties:
+            self._sequence += 1
+            entry = (event.seconds, self._sequence, event)
+            if len(self._slowest) < self.slowest_count:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def page_decoded(self, event: PageEvent) -> None:
+        with self._lock:
+            self.records_decoded[event.collection] = self.records_decoded.get(event.collection, 0) + event.records
+            self._histogram(self.decode_seconds, event.collection).observe(event.seconds)
+
+    def record_transformed(self, collection: str, seconds: float) -> None:
+        with self._lock:
+            self.records_transformed[collection] = self.records_transformed.get(collection, 0) + 1
+            self._histogram(self.transform_seconds, collection).observe(seconds)
+
+    def slowest(self) -> List[RequestEvent]:
+        '''Returns the slowest requests, slowest first.'''
+        with self._lock:
+            return [event for _, _, event in sorted(self._slowest, reverse=True)]
+
+    def report(self) -> MutableMapping:
+        '''Returns a summary of all metrics.
+
+        Returns:
+            A mapping with a ``collections`` mapping of collection names to
+            request counts and latency by status, retries, bytes, and decode
+            and transform counts and times, and a ``slowest`` list of the
+            slowest requests.
+        '''
+        with self._lock:
+            collections: Dict[str, MutableMapping] = {}
+            def collection_report(collection: str) -> MutableMapping:
+                return collections.setdefault(collection, {
+                    'requests': {},
+                    'retries': self.retries.get(collection, 0),
+                    'response_bytes': self.response_bytes.get(collection, 0),
+                })
+            for (collection, status), count in self.requests.items():
+                histogram = self.request_seconds[(collection, status)]
+                collection_report(collection)['requests'][status] = {
+                    'count': count,
+                    'seconds': histogram.sum,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                }
+            for collection, histogram in self.decode_seconds.items():
+                collection_report(collection).update({
+                    'records_decoded': self.records_decoded[collection],
+                    'decode_seconds': histogram.sum,
+                })
+            for collection, histogram in self.transform_seconds.items():
+                collection_report(collection).update({
+                    'records_transformed': self.records_transformed[collection],
+                    'transform_seconds': histogram.sum,
+                })
+            slowest = [
+                {
+                    'method': event.method,
+                    'resource_path': event.resource_path,
+                    'params': event.params,
+                    'status': event.status,
+                    'seconds': event.seconds,
+                    'attempts': event.attempts,
+                }
+                for _, _, event in sorted(self._slowest, reverse=True)
+            ]
+            return {'collections': collections, 'in_flight': self.in_flight, 'slowest': slowest}
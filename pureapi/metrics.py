@@ -0,0 +1,243 @@
+'''Prometheus-compatible metrics for long-running harvesters.
+
+``PrometheusMetrics`` collects the same metrics as
+``instrumentation.MetricsCollector``, plus the position and lag of a changes
+tailer in sequence numbers, and hit and miss counts of caches, and renders
+them all in the Prometheus text exposition format. ``serve()`` registers a
+``PrometheusMetrics`` for all requests, so that callers need not change their
+``client.Config``, and serves it on a local HTTP endpoint.
+
+Example:
+    from pureapi import metrics, mirror
+    prometheus, server = metrics.serve(port=9464)
+    with mirror.Mirror('pure.sqlite', collections=['persons']) as m:
+        while True:
+            m.sync()
+            ...
+    # Scrape http://127.0.0.1:9464/metrics
+
+Counters are totals since the process started, e.g.,
+``pureapi_requests_total`` and ``pureapi_records_decoded_total``, so use
+``rate()`` in Prometheus queries to get pages and records per second.
+'''
+import base64
+import binascii
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+
+from pureapi import instrumentation
+
+content_type = 'text/plain; version=0.0.4; charset=utf-8'
+'''Content type of the Prometheus text exposition format.'''
+
+def sequence_number(resumption_token: str) -> Optional[int]:
+    '''Returns the sequence number in a resumption token from the ``changes``
+    collection, or ``None`` if it has none, e.g., if it is a date.
+
+    Pure API resumption tokens are base64-encoded JSON objects, e.g.,
+    ``eyJzZXF1ZW5jZU51bWJlciI6MTk0MTM1MjM2fQ==``, for
+    ``{"sequenceNumber":194135236}``. Tokens that are plain integers are also
+    accepted.
+    '''
+    if resumption_token.isdigit():
+        return int(resumption_token)
+    try:
+        decoded = json.loads(base64.b64decode(resumption_token, validate=True))
+        return int(decoded['sequenceNumber'])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(labels: Mapping[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class PrometheusMetrics(instrumentation.MetricsCollector):
+    '''A metrics collector that renders its metrics in the Prometheus text
+    exposition format.'''
+
+    def __init__(self, *, namespace: str = 'pureapi', **kwargs):
+        '''
+        Args:
+            namespace: Prefix for all metric names.
+            **kwargs: See ``instrumentation.MetricsCollector``.
+        '''
+        self.namespace = namespace
+        self._caches: List[Tuple[str, Any]] = []
+        super().__init__(**kwargs)
+
+    def reset(self) -> None:
+        super().reset()
+        with self._lock:
+            self.changes_pages = 0
+            self.changes_sequence_number: Optional[int] = None
+            '''Sequence number of the next change a tailer will request.'''
+            self.changes_head: Optional[int] = None
+            '''Greatest sequence number known to exist, from the last page
+            without more changes, or from ``set_changes_head()``.'''
+
+    def changes_page(self, resumption_token: str, more_changes: bool, count: int) -> None:
+        number = sequence_number(resumption_token)
+        with self._lock:
+            self.changes_pages += 1
+            if number is None:
+                return
+            self.changes_sequence_number = number
+            if not more_changes and (self.changes_head is None or number > self.changes_head):
+                self.changes_head = number
+
+    def set_changes_head(self, number: int) -> None:
+        '''Sets the greatest sequence number known to exist, e.g., from
+        another tailer that is further ahead.'''
+        with self._lock:
+            self.changes_head = number
+
+    @property
+    def changes_lag(self) -> Optional[int]:
+        '''Number of sequence numbers between the tailer's position and the
+        head, or ``None`` if either is unknown.'''
+        if self.changes_head is None or self.changes_sequence_number is None:
+            return None
+        return max(0, self.changes_head - self.changes_sequence_number)
+
+    def register_cache(self, name: str, cache: Any) -> None:
+        '''Exports the hit and miss counts of a cache, read from its ``hits``
+        and ``misses`` attributes at the time of each scrape, e.g., of an
+        ``xmlparser.EntityCache``.'''
+        with self._lock:
+            self._caches.append((name, cache))
+
+    def _metric(self, lines: List[str], name: str, metric_type: str, help_text: str, samples: Iterable[Tuple[Mapping, Any]]) -> None:
+        full_name = f'{self.namespace}_{name}'
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {metric_type}')
+        for labels, value in samples:
+            lines.append(f'{full_name}{_labels(labels)} {_number(value)}')
+
+    def _histogram_metric(self, lines: List[str], name: str, help_text: str, histograms: Mapping[Any, instrumentation.Histogram], label_names: Tuple[str, ...]) -> None:
+        full_name = f'{self.namespace}_{name}'
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} histogram')
+        for key, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                lines.append(f'{full_name}_bucket{_labels({**labels, "le": _number(float(bound))})} {cumulative}')
+            lines.append(f'{full_name}_sum{_labels(labels)} {_number(histogram.sum)}')
+            lines.append(f'{full_name}_count{_labels(labels)} {histogram.count}')
+
+    def render(self) -> str:
+        '''Returns all metrics in the Prometheus text exposition format.'''
+        lines: List[str] = []
+        with self._lock:
+            self._metric(lines, 'requests_total', 'counter', 'Requests, by collection and HTTP status or exception.', (
+                ({'collection': collection, 'status': status}, count)
+                for (collection, status), count in sorted(self.requests.items())
+            ))
+            self._histogram_metric(
+                lines, 'request_duration_seconds', 'Request latency, including retries.',
+                self.request_seconds, ('collection', 'status')
+            )
+            self._metric(lines, 'retries_total', 'counter', 'Retried request attempts.', (
+                ({'collection': collection}, count) for collection, count in sorted(self.retries.items())
+            ))
+            self._metric(lines, 'response_bytes_total', 'counter', 'Response body bytes.', (
+                ({'collection': collection}, count) for collection, count in sorted(self.response_bytes.items())
+            ))
+            self._metric(lines, 'in_flight_requests', 'gauge', 'Requests started but not yet ended.', [({}, self.in_flight)])
+            self._metric(lines, 'records_decoded_total', 'counter', 'Records in decoded pages.', (
+                ({'collection': collection}, count) for collection, count in sorted(self.records_decoded.items())
+            ))
+            self._histogram_metric(
+                lines, 'decode_duration_seconds', 'JSON decoding time per page.', self.decode_seconds, ('collection',)
+            )
+            self._metric(lines, 'records_transformed_total', 'counter', 'Transformed records.', (
+                ({'collection': collection}, count) for collection, count in sorted(self.records_transformed.items())
+            ))
+            self._histogram_metric(
+                lines, 'transform_duration_seconds', 'Transformation time per record.', self.transform_seconds, ('collection',)
+            )
+            self._metric(lines, 'changes_pages_total', 'counter', 'Pages of changes received.', [({}, self.changes_pages)])
+            if self.changes_sequence_number is not None:
+                self._metric(
+                    lines, 'changes_sequence_number', 'gauge', 'Sequence number of the next change to request.',
+                    [({}, self.changes_sequence_number)]
+                )
+            if self.changes_lag is not None:
+                self._metric(
+                    lines, 'changes_lag', 'gauge', 'Sequence numbers between the tailer and the known head.',
+                    [({}, self.changes_lag)]
+                )
+            caches = list(self._caches)
+        if caches:
+            self._metric(lines, 'cache_hits_total', 'counter', 'Cache hits.', (
+                ({'cache': name}, cache.hits) for name, cache in caches
+            ))
+            self._metric(lines, 'cache_misses_total', 'counter', 'Cache misses.', (
+                ({'cache': name}, cache.misses) for name, cache in caches
+            ))
+        return '\n'.join(lines) + '\n'
+
+class _Handler(BaseHTTPRequestHandler):
+    metrics: PrometheusMetrics = None
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_http_server(metrics: PrometheusMetrics, port: int = 9464, addr: str = '127.0.0.1') -> ThreadingHTTPServer:
+    '''Serves ``metrics`` at ``/metrics`` on a daemon thread.
+
+    Args:
+        metrics: The metrics to serve.
+        port: Port on which to listen. ``0`` for any free port.
+        addr: Address on which to listen. Default: localhost only.
+
+    Returns:
+        The server. Call ``shutdown()`` on it to stop serving.
+    '''
+    class Handler(_Handler):
+        pass
+    Handler.metrics = metrics
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='pureapi-metrics', daemon=True).start()
+    return server
+
+def serve(port: int = 9464, addr: str = '127.0.0.1', **kwargs) -> Tuple[PrometheusMetrics, ThreadingHTTPServer]:
+    '''Creates a ``PrometheusMetrics``, registers it to receive events for all
+    requests with ``instrumentation.register()``, and serves it with
+    ``start_http_server()``.
+
+    Args:
+        port: See ``start_http_server()``.
+        addr: See ``start_http_server()``.
+        **kwargs: See ``PrometheusMetrics``.
+
+    Returns:
+        The metrics, and the server.
+    '''
+    metrics = PrometheusMetrics(**kwargs)
+    instrumentation.register(metrics)
+    return metrics, start_http_server(metrics, port, addr)
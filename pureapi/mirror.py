@@ -0,0 +1,321 @@
+'''A local SQLite mirror of Pure API collections, kept current from the
+``changes`` collection.
+
+A mirror first loads all records in some collections, then repeatedly applies
+changes: records with changes are downloaded again, in batches, and records
+with ``DELETE`` changes are removed. Each record is stored as raw JSON, with
+its uuid, version, and modified date in indexed columns.
+
+Readers may query the mirror database concurrently, using their own
+connections, while a single ``Mirror`` updates it.
+
+Example:
+    from pureapi import mirror
+    with mirror.Mirror('pure.sqlite', collections=['persons', 'organisational-units']) as m:
+        m.load('persons')
+        m.load('organisational-units')
+        # Later, e.g., nightly:
+        m.sync()
+        person = m.get('persons', '01edf3d8-7e44-4dfa-bec4-8e3472965e1f')
+'''
+from datetime import datetime, timezone
+import json
+import os
+import sqlite3
+from typing import Iterator, Mapping, MutableMapping, Optional, Sequence
+
+import attr
+
+from pureapi import client
+from pureapi.common import PureAPIInvalidCollectionError, valid_collection
+from pureapi.exceptions import PureAPIException
+from pureapi.instrumentation import CombinedHooks, Hooks
+
+family_collections: Mapping[str, str] = {
+    'Activity': 'activities',
+    'Application': 'applications',
+    'Award': 'awards',
+    'DataSet': 'datasets',
+    'Equipment': 'equipments',
+    'Event': 'events',
+    'ExternalOrganisation': 'external-organisations',
+    'ExternalPerson': 'external-persons',
+    'Impact': 'impacts',
+    'Journal': 'journals',
+    'Organisation': 'organisational-units',
+    'Person': 'persons',
+    'PressMedia': 'press-media',
+    'Prize': 'prizes',
+    'Project': 'projects',
+    'Publisher': 'publishers',
+    'ResearchOutput': 'research-outputs',
+}
+'''Collection names, by the ``familySystemName`` of records in the
+``changes`` collection.'''
+
+class PureAPIMirrorException(PureAPIException):
+    '''Raised when a mirror cannot load or sync records.'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+class _ChangesTokens(Hooks):
+    '''Records the resumption token of every page of changes, including the
+    pages without changes that ``client.get_all_changes()`` skips.'''
+
+    def __init__(self):
+        self.resumption_token: Optional[str] = None
+
+    def changes_page(self, resumption_token: str, more_changes: bool, count: int) -> None:
+        self.resumption_token = resumption_token
+
+@attr.s(auto_attribs=True)
+class SyncResult:
+    '''Counts of records changed by ``Mirror.sync()``.'''
+
+    upserted: int = 0
+    '''Number of records inserted or updated.'''
+
+    deleted: int = 0
+    '''Number of records deleted, including records with changes that the
+    Pure API no longer returns.'''
+
+    resumption_token: Optional[str] = None
+    '''Resumption token from which the next sync will start.'''
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS records (
+    collection TEXT NOT NULL,
+    uuid TEXT NOT NULL,
+    version INTEGER,
+    modified TEXT,
+    json TEXT NOT NULL,
+    PRIMARY KEY (collection, uuid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS records_modified ON records (collection, modified);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+class Mirror:
+    '''A local SQLite mirror of some Pure API collections.'''
+
+    def __init__(
+        self,
+        path: os.PathLike,
+        collections: Sequence[str],
+        *,
+        uuids_per_request: int = 100,
+        config: client.Config = client.Config()
+    ):
+        '''
+        Args:
+            path: Path to the SQLite database file. Created if missing.
+            collections: Names of the collections to mirror.
+            uuids_per_request: Number of changed records to download in each
+                request. Default: 100
+            config: An instance of client.Config.
+
+        Raises:
+            common.PureAPIInvalidCollectionError: If any collection name is
+                invalid for the configured API version.
+        '''
+        for collection in collections:
+            if not valid_collection(collection=collection, version=config.version):
+                raise PureAPIInvalidCollectionError(collection=collection, version=config.version)
+        self.path = path
+        self.collections = tuple(collections)
+        self.uuids_per_request = uuids_per_request
+        self.config = config
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(_schema)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> 'Mirror':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self.connection.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_state(self, key: str, value: str) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, value))
+
+    @property
+    def resumption_token(self) -> Optional[str]:
+        '''Resumption token, or ISO 8601 date, from which the next ``sync()``
+        will start, or ``None`` if the mirror has never been loaded or synced.'''
+        return self._get_state('resumption_token')
+
+    def _upsert(self, collection: str, items: Sequence[Mapping], versions: Mapping[str, int] = None) -> int:
+        # Records themselves have no version, so only records with changes have
+        # one:
+        if versions is None:
+            versions = {}
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO records (collection, uuid, version, modified, json) VALUES (?, ?, ?, ?, ?)',
+            (
+                (
+                    collection,
+                    item['uuid'],
+                    versions.get(item['uuid']),
+                    (item.get('info') or {}).get('modifiedDate'),
+                    json.dumps(item, ensure_ascii=False),
+                )
+                for item in items
+            )
+        )
+        return len(items)
+
+    def _delete(self, collection: str, uuids: Sequence[str]) -> int:
+        self.connection.executemany(
+            'DELETE FROM records WHERE collection = ? AND uuid = ?',
+            ((collection, uuid) for uuid in uuids)
+        )
+        return len(uuids)
+
+    def load(self, collection: str, params: Mapping = None, payload: Mapping = None) -> int:
+        '''Replaces all mirrored records in a ``collection`` with a full
+        download, using ``client.get_all()`` or, if ``payload`` is given,
+        ``client.filter_all()``.
+
+        If the mirror has never been synced, the next ``sync()`` will start
+        from the date of the first load, so that no changes made during the
+        load are lost.
+
+        Records do not include their versions, which only changes do, so each
+        record is stored with a NULL version until a ``sync()`` applies a
+        change to it.
+
+        Args:
+            collection: The name of the collection. Must be one of the
+                mirrored collections.
+            params: A mapping representing URL query string params.
+            payload: A mapping representing JSON filters of the collection.
+
+        Returns:
+            The number of records loaded.
+
+        Raises:
+            PureAPIMirrorException: If the collection is not mirrored.
+            client.PureAPIClientException: If any request fails. All changes
+                to the mirror are rolled back.
+        '''
+        if collection not in self.collections:
+            raise PureAPIMirrorException(f'Collection "{collection}" is not mirrored')
+        if payload is not None:
+            responses = client.filter_all(collection, payload, self.config)
+        else:
+            responses = client.get_all(collection, params, self.config)
+
+        start_date = datetime.now(timezone.utc).date().isoformat()
+        loaded = 0
+        with self.connection:
+            self.connection.execute('DELETE FROM records WHERE collection = ?', (collection,))
+            for r in responses:
+                loaded += self._upsert(collection, client._decode(r, collection, self.config)['items'])
+            if self.resumption_token is None:
+                self._set_state('resumption_token', start_date)
+        return loaded
+
+    def sync(self, start_date: str = None) -> SyncResult:
+        '''Applies all changes since the last ``load()`` or ``sync()`` to the
+        mirrored collections.
+
+        Commits after applying each page of changes, so an interrupted sync
+        resumes after the last page it completed.
+
+        Args:
+            start_date: Date in ISO 8601 format, YYYY-MM-DD, or a resumption
+                token, from which to start. Default: The token where the last
+                sync or load ended.
+
+        Returns:
+            Counts of changed records, and the resumption token for the next
+            sync.
+
+        Raises:
+            PureAPIMirrorException: If there is no ``start_date`` and the
+                mirror has never been loaded or synced.
+            client.PureAPIClientException: If any request fails. All changes
+                from the current page are rolled back.
+        '''
+        token_or_date = start_date if start_date is not None else self.resumption_token
+        if token_or_date is None:
+            raise PureAPIMirrorException('No start date or resumption token. Load the mirror before syncing.')
+        result = SyncResult(resumption_token=token_or_date)
+        tokens = _ChangesTokens()
+        hooks = tokens if self.config.hooks is None else CombinedHooks((self.config.hooks, tokens))
+        for r in client.get_all_changes(token_or_date, config=attr.evolve(self.config, hooks=hooks)):
+            json_page = r.json()
+            with self.connection:
+                self._apply_changes(json_page['items'], result)
+                result.resumption_token = str(json_page['resumptionToken'])
+                self._set_state('resumption_token', result.resumption_token)
+        # Pages without changes that follow the last page with changes still
+        # advance the token, so that the next sync need not request them again:
+        if tokens.resumption_token is not None and tokens.resumption_token != result.resumption_token:
+            with self.connection:
+                result.resumption_token = tokens.resumption_token
+                self._set_state('resumption_token', result.resumption_token)
+        return result
+
+    def _apply_changes(self, changes: Sequence[Mapping], result: SyncResult) -> None:
+        # Only the last change to each record matters:
+        latest: MutableMapping[str, MutableMapping[str, Mapping]] = {}
+        for change in changes:
+            collection = family_collections.get(change.get('familySystemName'))
+            if collection not in self.collections or 'uuid' not in change:
+                continue
+            latest.setdefault(collection, {}).pop(change['uuid'], None)
+            latest[collection][change['uuid']] = change
+
+        for collection, changes_by_uuid in latest.items():
+            deleted = [uuid for uuid, change in changes_by_uuid.items() if change.get('changeType') == 'DELETE']
+            changed = {uuid: change.get('version') for uuid, change in changes_by_uuid.items() if change.get('changeType') != 'DELETE'}
+            returned = set()
+            for r in client.filter_all_by_uuid(
+                collection,
+                uuids=list(changed),
+                uuids_per_request=self.uuids_per_request,
+                config=self.config
+            ):
+                items = client._decode(r, collection, self.config).get('items', [])
+                returned.update(item['uuid'] for item in items)
+                result.upserted += self._upsert(collection, items, changed)
+            # Records may have become confidential, or been deleted since the change:
+            deleted.extend(uuid for uuid in changed if uuid not in returned)
+            result.deleted += self._delete(collection, deleted)
+
+    def get(self, collection: str, uuid: str) -> Optional[MutableMapping]:
+        '''Returns the raw JSON record with the ``uuid`` from the ``collection``,
+        or ``None`` if the mirror does not contain it.'''
+        row = self.connection.execute(
+            'SELECT json FROM records WHERE collection = ? AND uuid = ?',
+            (collection, uuid)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def records(self, collection: str, modified_since: str = None) -> Iterator[MutableMapping]:
+        '''Yields all raw JSON records in a ``collection``, optionally only
+        those modified since an ISO 8601 date or datetime.'''
+        if modified_since is None:
+            cursor = self.connection.execute('SELECT json FROM records WHERE collection = ?', (collection,))
+        else:
+            cursor = self.connection.execute(
+                'SELECT json FROM records WHERE collection = ? AND modified >= ?',
+                (collection, modified_since)
+            )
+        for (record_json,) in cursor:
+            yield json.loads(record_json)
+
+    def count(self, collection: str) -> int:
+        '''Returns the number of mirrored records in a ``collection``.'''
+        return self.connection.execute('SELECT COUNT(*) FROM records WHERE collection = ?', (collection,)).fetchone()[0]
@@ -0,0 +1,252 @@
+'''Harvests in which fetching and transformation overlap.
+
+``client.get_all_transformed()`` and similar functions request, decode and
+transform each page in the caller's thread, so the network sits idle while
+records are transformed, and the CPU sits idle while requests are in flight.
+A pipeline instead plans the same windows of records, from a single count
+request, then runs two stages concurrently: ``fetch_workers`` threads request
+and decode pages, and ``transform_workers`` threads transform their records.
+The stages are connected by a bounded queue, and at most ``max_pages`` pages
+are in the pipeline at any time, from the start of their requests until the
+caller has received their last records, so a slow caller applies backpressure
+to both stages, and memory use stays bounded. Records are yielded in the same
+order as ``client.get_all_transformed()`` would yield them.
+
+When the caller stops early, e.g., by breaking out of a loop over the
+records, or closing the generator, the pipeline sends no further requests,
+discards the results of requests already in flight, and waits for its
+threads to finish them.
+
+Example:
+    from pureapi import pipeline
+    for ro in pipeline.get_all_transformed('research-outputs', fetch_workers=8):
+        ...
+'''
+from functools import partial
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import addict
+import requests
+
+from pureapi import client
+
+def records(
+    collection: str,
+    fetches: Sequence[Callable[[], requests.Response]],
+    *,
+    fetch_workers: int = 4,
+    transform_workers: int = 1,
+    max_pages: int = None,
+    transformed: bool = True,
+    config: client.Config = client.Config()
+) -> Iterator[Any]:
+    '''Runs a pipeline over pages of records, and yields the records, in
+    order.
+
+    Args:
+        collection: The name of the collection requested.
+        fetches: Functions that each request one page of records, in order,
+            e.g., ``functools.partial(client.get, 'persons', params, config)``.
+        fetch_workers: Number of threads that request and decode pages.
+        transform_workers: Number of threads that transform records. Because
+            transformation holds the GIL, more than one rarely helps.
+        max_pages: Maximum number of pages in the pipeline. Default: Twice the
+            number of ``fetch_workers``.
+        transformed: Whether to yield records transformed as by the
+            ``client.*_transformed()`` functions, instead of raw JSON records.
+            Default: ``True``
+        config: An instance of client.Config.
+
+    Yields:
+        Individual records.
+
+    Raises:
+        Any exception raised by a fetch, e.g.,
+        ``client.PureAPIClientException``, or by transformation, when the
+        caller reaches the page in which it occurred.
+    '''
+    fetch_workers = max(1, int(fetch_workers))
+    transform_workers = max(1, int(transform_workers))
+    if max_pages is None:
+        max_pages = 2 * fetch_workers
+    max_pages = max(1, int(max_pages))
+
+    slots = threading.Semaphore(max_pages)
+    stopped = threading.Event()
+    lock = threading.Lock()
+    pending = iter(enumerate(fetches))
+    decoded: queue.Queue = queue.Queue(maxsize=max_pages)
+    done = object()
+    finished_fetchers = 0
+    # Completed pages, by sequence number, as (items, error):
+    completed: Dict[int, Tuple[Optional[List], Optional[BaseException]]] = {}
+    completed_changed = threading.Condition(lock)
+
+    def complete(sequence: int, items: Optional[List], error: Optional[BaseException] = None) -> None:
+        with completed_changed:
+            completed[sequence] = (items, error)
+            completed_changed.notify_all()
+
+    def fetch() -> None:
+        nonlocal finished_fetchers
+        try:
+            while not stopped.is_set():
+                # Wait for a slot, but give up if the caller has stopped:
+                if not slots.acquire(timeout=0.1):
+                    continue
+                with lock:
+                    sequence, request = next(pending, (None, None))
+                if request is None or stopped.is_set():
+                    slots.release()
+                    return
+                try:
+                    items = client._decode(request(), collection, config).get('items', [])
+                except Exception as e:
+                    complete(sequence, None, e)
+                    continue
+                if transformed:
+                    # Never blocks, because the queue holds up to max_pages:
+                    decoded.put((sequence, items))
+                else:
+                    complete(sequence, items)
+        finally:
+            with lock:
+                finished_fetchers += 1
+                last = finished_fetchers == fetch_workers
+            # Without transformation, no threads would take the sentinels:
+            if last and transformed:
+                for _ in range(transform_workers):
+                    decoded.put(done)
+
+    def transform() -> None:
+        while True:
+            page = decoded.get()
+            if page is done:
+                return
+            sequence, items = page
+            if stopped.is_set():
+                continue
+            try:
+                # Release each raw record as soon as it is transformed:
+                items.reverse()
+                transformed_items = []
+                while items:
+                    transformed_items.append(client._transform(collection, items.pop(), config))
+            except Exception as e:
+                complete(sequence, None, e)
+                continue
+            complete(sequence, transformed_items)
+
+    threads = [
+        threading.Thread(target=fetch, name=f'pureapi-pipeline-fetch-{i}', daemon=True)
+        for i in range(fetch_workers)
+    ]
+    if transformed:
+        threads.extend(
+            threading.Thread(target=transform, name=f'pureapi-pipeline-transform-{i}', daemon=True)
+            for i in range(transform_workers)
+        )
+    for thread in threads:
+        thread.start()
+    try:
+        for sequence in range(len(fetches)):
+            with completed_changed:
+                while sequence not in completed:
+                    completed_changed.wait()
+                items, error = completed.pop(sequence)
+            if error is not None:
+                raise error
+            # Release each record as soon as the caller receives it:
+            items.reverse()
+            while items:
+                yield items.pop()
+            del items
+            slots.release()
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+
+def get_all_transformed(
+    resource_path: str,
+    params: Mapping = None,
+    *,
+    fetch_workers: int = 4,
+    transform_workers: int = 1,
+    max_pages: int = None,
+    config: client.Config = client.Config()
+) -> Iterator[addict.Dict]:
+    '''Like ``client.get_all_transformed()``, but fetches and transforms
+    pages concurrently, in a pipeline.
+
+    Args:
+        resource_path: See ``client.get_all()``.
+        params: See ``client.get_all()``.
+        fetch_workers: See ``records()``.
+        transform_workers: See ``records()``.
+        max_pages: See ``records()``.
+        config: An instance of client.Config.
+
+    Yields:
+        Individual records.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection, the first
+            segment in the resource_path, is invalid for the given API version.
+        client.PureAPIClientException: If any request fails, possibly after
+            multiple retries.
+    '''
+    params = dict(params) if params is not None else {}
+    collection = client._get_collection_from_resource_path(resource_path, config.version)
+    windows = client._get_all_windows(resource_path, params, config)
+    yield from records(
+        collection,
+        [partial(client.get, resource_path, window_params, config) for window_params in windows],
+        fetch_workers=fetch_workers,
+        transform_workers=transform_workers,
+        max_pages=max_pages,
+        config=config
+    )
+
+def filter_all_transformed(
+    resource_path: str,
+    payload: Mapping = None,
+    *,
+    fetch_workers: int = 4,
+    transform_workers: int = 1,
+    max_pages: int = None,
+    config: client.Config = client.Config()
+) -> Iterator[addict.Dict]:
+    '''Like ``client.filter_all_transformed()``, but fetches and transforms
+    pages concurrently, in a pipeline.
+
+    Args:
+        resource_path: See ``client.filter_all()``.
+        payload: See ``client.filter_all()``.
+        fetch_workers: See ``records()``.
+        transform_workers: See ``records()``.
+        max_pages: See ``records()``.
+        config: An instance of client.Config.
+
+    Yields:
+        Individual records.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection, the first
+            segment in the resource_path, is invalid for the given API version.
+        client.PureAPIClientException: If any request fails, possibly after
+            multiple retries.
+    '''
+    payload = dict(payload) if payload is not None else {}
+    collection = client._get_collection_from_resource_path(resource_path, config.version)
+    windows = client._filter_all_windows(resource_path, payload, config)
+    yield from records(
+        collection,
+        [partial(client.filter, resource_path, window_payload, config) for window_payload in windows],
+        fetch_workers=fetch_workers,
+        transform_workers=transform_workers,
+        max_pages=max_pages,
+        config=config
+    )
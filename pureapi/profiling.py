@@ -0,0 +1,195 @@
+'''Profiling of harvests by the ``client.*_transformed()`` functions.
+
+With profiling enabled, by ``Config.profile`` or the ``PURE_API_PROFILE``
+environment variable, each ``*_transformed()`` run attributes wall and CPU
+time, per collection, to four stages:
+
+* ``network``: waiting for requests, including retries,
+* ``decode``: decoding JSON response bodies,
+* ``transform``: validating and transforming records,
+* ``consumer``: the caller's own processing of each yielded record,
+
+and writes a breakdown to ``stderr`` when the run ends. CPU time is that of
+the thread iterating over the records. With ``Config.profile_samples``, or
+the ``PURE_API_PROFILE_SAMPLES`` environment variable, set to a file path, a
+sampling profiler also records the stacks of that thread, and writes them in
+the collapsed format that flamegraph tools, e.g., ``flamegraph.pl`` or
+speedscope, accept.
+
+Example:
+    PURE_API_PROFILE=1 PURE_API_PROFILE_SAMPLES=harvest.folded python harvest.py
+'''
+from collections import Counter
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, IO, Iterable, Iterator, List, MutableMapping, Optional
+
+import attr
+
+env_profile_varname: str = 'PURE_API_PROFILE'
+'''Environment variable that enables profiling when set to anything other
+than an empty string, ``0`` or ``false``. Used by ``env_profile()``.'''
+
+env_profile_samples_varname: str = 'PURE_API_PROFILE_SAMPLES'
+'''Environment variable for the path of a collapsed-stack output file. Used
+by ``env_profile_samples()``.'''
+
+stages = ('network', 'decode', 'transform', 'consumer')
+'''Names of pipeline stages, in order.'''
+
+def env_profile() -> bool:
+    '''Returns whether the ``env_profile_varname`` environment variable
+    enables profiling. See ``client.Config`` for more details.'''
+    return os.environ.get(env_profile_varname, '').strip().lower() not in ('', '0', 'false')
+
+def env_profile_samples() -> Optional[str]:
+    '''Returns the value of the ``env_profile_samples_varname`` environment
+    variable, or ``None`` if undefined. See ``client.Config`` for more details.'''
+    return os.environ.get(env_profile_samples_varname) or None
+
+@attr.s(auto_attribs=True)
+class StageTimes:
+    '''Time spent in a single stage.'''
+
+    wall: float = 0.0
+    cpu: float = 0.0
+    calls: int = 0
+
+@attr.s(auto_attribs=True)
+class RunProfile:
+    '''Stage times for a single ``*_transformed()`` run.'''
+
+    collection: str
+    records: int = 0
+    pages: int = 0
+    stages: MutableMapping[str, StageTimes] = attr.ib(factory=lambda: {stage: StageTimes() for stage in stages})
+
+    def add(self, stage: str, wall: float, cpu: float) -> None:
+        times = self.stages[stage]
+        times.wall += wall
+        times.cpu += cpu
+        times.calls += 1
+
+    def report(self) -> str:
+        '''Returns a table of wall and CPU time, and shares of total wall
+        time, by stage.'''
+        total_wall = sum(times.wall for times in self.stages.values()) or 1.0
+        lines = [
+            f'pureapi profile: {self.collection}, {self.records} records in {self.pages} pages',
+            f'{"stage":<10} {"wall s":>10} {"cpu s":>10} {"wall %":>7}',
+        ]
+        for stage, times in self.stages.items():
+            lines.append(f'{stage:<10} {times.wall:>10.3f} {times.cpu:>10.3f} {100 * times.wall / total_wall:>6.1f}%')
+        return '\n'.join(lines)
+
+last_profile: Optional[RunProfile] = None
+'''Profile of the most recently ended run, for programmatic access.'''
+
+class SamplingProfiler:
+    '''Samples the stack of a single thread at a fixed interval, from a
+    background thread, using only the standard library.'''
+
+    def __init__(self, thread_id: int = None, interval: float = 0.005):
+        '''
+        Args:
+            thread_id: Identifier of the thread to sample. Default: The
+                current thread.
+            interval: Seconds between samples.
+        '''
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples: Counter = Counter()
+        '''Counts of collapsed stacks, e.g., ``module:function;module:function``.'''
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'SamplingProfiler':
+        self._thread = threading.Thread(target=self._run, name='pureapi-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{frame.f_globals.get("__name__", "?")}:{code.co_name}')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def write_collapsed(self, f: IO[str]) -> None:
+        '''Writes samples in the collapsed-stack format: one line per distinct
+        stack, with frames separated by semicolons, then a count.'''
+        for stack, count in self.samples.most_common():
+            f.write(f'{stack} {count}\n')
+
+def profiled(
+    collection: str,
+    responses: Iterable[Any],
+    decode: Callable[[Any], Iterable[Any]],
+    transform: Callable[[Any], Any],
+    *,
+    samples_path: Optional[str] = None,
+    output: IO[str] = None
+) -> Iterator[Any]:
+    '''Yields transformed records, attributing time to each stage, then
+    writes the breakdown to ``output`` when the run ends, whether it completes
+    or the caller stops early.
+
+    Args:
+        collection: The name of the collection.
+        responses: HTTP responses, e.g., from ``client.get_all()``.
+        decode: Returns the raw records in a response.
+        transform: Transforms a raw record.
+        samples_path: Path of a file to which to write collapsed stacks from
+            a ``SamplingProfiler``. Default: ``None``, for no sampling.
+        output: Where to write the breakdown. Default: ``sys.stderr``.
+
+    Yields:
+        Transformed records.
+    '''
+    global last_profile
+    profile = RunProfile(collection=collection)
+    sampler = SamplingProfiler().start() if samples_path is not None else None
+    responses = iter(responses)
+    wall, cpu = time.perf_counter, time.thread_time
+    try:
+        while True:
+            start_wall, start_cpu = wall(), cpu()
+            r = next(responses, None)
+            profile.add('network', wall() - start_wall, cpu() - start_cpu)
+            if r is None:
+                return
+            profile.pages += 1
+
+            start_wall, start_cpu = wall(), cpu()
+            items = decode(r)
+            profile.add('decode', wall() - start_wall, cpu() - start_cpu)
+            del r
+
+            for item in items:
+                start_wall, start_cpu = wall(), cpu()
+                record = transform(item)
+                profile.add('transform', wall() - start_wall, cpu() - start_cpu)
+                profile.records += 1
+
+                start_wall, start_cpu = wall(), cpu()
+                yield record
+                profile.add('consumer', wall() - start_wall, cpu() - start_cpu)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            with open(samples_path, 'w') as f:
+                sampler.write_collapsed(f)
+        last_profile = profile
+        print(profile.report(), file=output if output is not None else sys.stderr)
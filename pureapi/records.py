@@ -0,0 +1,367 @@
+'''Compact record classes, generated from the schema for a Pure API version.
+
+``addict.Dict`` records, from ``response.transform()``, are dictionaries all
+the way down, and cost several times the memory of the data they hold.
+Applications that keep many records in memory, e.g., caches of persons or
+organisational units, can instead set ``client.Config.record_type`` to
+``'slots'``, so that the ``*_transformed()`` functions return instances of
+record classes generated from the schema definitions: one class per
+definition, e.g., ``WSPerson``, with a ``__slots__`` entry for each property.
+
+Records are constructed directly from decoded JSON, without copying. Nested
+objects and lists of nested objects stay as decoded JSON until first
+accessed, then become instances of their own record classes, so records that
+are only partly read cost little to construct. ``materialize()`` converts all
+nested objects at once, for the smallest records to keep in memory.
+
+Record classes ensure the same fields exist as the transformers in
+``pureapi.response``, with the same defaults. Otherwise, properties that a
+record lacks are ``None`` when accessed as attributes, instead of the empty
+``addict.Dict`` objects of transformed records. Records are also mutable
+mappings, so that ``record['title']``, ``record.get('title')``, ``'title' in
+record`` and ``dict(record)`` work as they do for ``addict.Dict`` records.
+Fields that the schema does not define are kept, and accessible both as keys
+and attributes.
+
+Example:
+    from pureapi import client
+    config = client.Config(record_type='slots')
+    persons = list(client.get_all_transformed('persons', config=config))
+    print(persons[0].name.lastName)
+'''
+from collections.abc import MutableMapping
+import functools
+import threading
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Sequence, Tuple
+
+from pureapi import common
+
+record_types: Tuple[str, ...] = ('addict', 'slots')
+'''Valid values of ``client.Config.record_type``.'''
+
+_Default = Tuple[Tuple[str, ...], Callable[[], Any]]
+
+_none: Callable[[], None] = lambda: None
+
+defaults: Mapping[str, Sequence[_Default]] = {
+    'external-organisations': (
+        (('info', 'previousUuids'), list),
+        (('pureId',), _none),
+    ),
+    'external-persons': (
+        (('info', 'previousUuids'), list),
+        (('name', 'firstName'), _none),
+        (('name', 'lastName'), _none),
+    ),
+    'organisational-units': (
+        (('info', 'previousUuids'), list),
+        (('externalId',), _none),
+        (('ids',), list),
+        (('parents',), lambda: [{'uuid': None}]),
+    ),
+    'persons': (
+        (('info', 'previousUuids'), list),
+        (('name', 'firstName'), _none),
+        (('name', 'lastName'), _none),
+        (('externalId',), _none),
+        (('scopusHIndex',), _none),
+        (('orcid',), _none),
+    ),
+    'research-outputs': (
+        (('electronicVersions',), list),
+        (('info', 'additionalExternalIds'), list),
+        (('info', 'previousUuids'), list),
+        (('volume',), _none),
+        (('journalNumber',), _none),
+        (('pages',), _none),
+        (('totalScopusCitations',), _none),
+    ),
+}
+'''Fields that records in each collection always have, by path, with
+factories for their default values, as ensured by the transformers in
+``pureapi.response``.'''
+
+class Record(MutableMapping):
+    '''Base class of all generated record classes.'''
+
+    __slots__ = ('_extra',)
+
+    _definition: str = ''
+    '''Name of the schema definition for the class.'''
+
+    _version: str = ''
+    '''The Pure API version of the schema.'''
+
+    _fields: Mapping[str, '_Field'] = {}
+    '''Fields, by property name, in schema order.'''
+
+    _nested: Tuple['_Field', ...] = ()
+    '''Fields of nested objects, or lists of nested objects.'''
+
+    @classmethod
+    def from_json(cls, data: Mapping) -> 'Record':
+        '''Constructs a record from a decoded JSON object, without copying
+        nested objects, which are converted on first access.'''
+        record = cls.__new__(cls)
+        fields = cls._fields
+        extra = None
+        for key, value in data.items():
+            field = fields.get(key)
+            if field is not None:
+                field.member.__set__(record, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        if extra is not None:
+            record._extra = extra
+        return record
+
+    def _extras(self) -> Optional[Dict[str, Any]]:
+        try:
+            return self._extra
+        except AttributeError:
+            return None
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for names that are neither fields nor methods:
+        extra = self._extras() if name != '_extra' else None
+        if extra is not None and name in extra:
+            return extra[name]
+        raise AttributeError(f'{type(self).__name__!r} record has no field {name!r}')
+
+    def __getitem__(self, key: str) -> Any:
+        field = self._fields.get(key)
+        if field is not None:
+            if field.is_set(self):
+                return field.__get__(self, type(self))
+        else:
+            extra = self._extras()
+            if extra is not None and key in extra:
+                return extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        field = self._fields.get(key)
+        if field is not None:
+            field.member.__set__(self, value)
+            return
+        extra = self._extras()
+        if extra is None:
+            extra = self._extra = {}
+        extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        field = self._fields.get(key)
+        if field is not None and field.is_set(self):
+            field.member.__delete__(self)
+            return
+        extra = self._extras()
+        if extra is None or key not in extra:
+            raise KeyError(key)
+        del extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for name, field in self._fields.items():
+            if field.is_set(self):
+                yield name
+        extra = self._extras()
+        if extra is not None:
+            yield from extra
+
+    def __len__(self) -> int:
+        extra = self._extras()
+        return sum(1 for field in self._fields.values() if field.is_set(self)) + (len(extra) if extra else 0)
+
+    def __contains__(self, key: object) -> bool:
+        field = self._fields.get(key) if isinstance(key, str) else None
+        if field is not None:
+            return field.is_set(self)
+        extra = self._extras()
+        return extra is not None and key in extra
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({to_dict(self)!r})'
+
+    def __reduce__(self) -> Tuple[Callable, Tuple[str, str, Dict]]:
+        # Generated classes cannot be pickled by name:
+        return _unpickle, (self._definition, self._version, to_dict(self))
+
+class _Field:
+    '''A property of a record class, whose value is stored in a slot.
+    Converts nested objects to records on first access.'''
+
+    __slots__ = ('name', 'member', 'definition', 'is_array', 'version')
+
+    def __init__(self, name: str, member: Any, definition: Optional[str], is_array: bool, version: str):
+        self.name = name
+        self.member = member
+        '''The slot's member descriptor.'''
+        self.definition = definition
+        '''The definition of nested objects, if any.'''
+        self.is_array = is_array
+        self.version = version
+
+    def is_set(self, record: Record) -> bool:
+        try:
+            self.member.__get__(record, type(record))
+            return True
+        except AttributeError:
+            return False
+
+    def __get__(self, record: Optional[Record], owner: type) -> Any:
+        if record is None:
+            return self
+        try:
+            value = self.member.__get__(record, owner)
+        except AttributeError:
+            return None
+        if self.definition is None:
+            return value
+        if self.is_array:
+            if value and type(value) is list and type(value[0]) is dict:
+                cls = record_class(self.definition, self.version)
+                value = [cls.from_json(item) if type(item) is dict else item for item in value]
+                self.member.__set__(record, value)
+        elif type(value) is dict:
+            value = record_class(self.definition, self.version).from_json(value)
+            self.member.__set__(record, value)
+        return value
+
+    def __set__(self, record: Record, value: Any) -> None:
+        self.member.__set__(record, value)
+
+    def __delete__(self, record: Record) -> None:
+        self.member.__delete__(record)
+
+def _nested_definition(schema: Mapping) -> Tuple[Optional[str], bool]:
+    '''Returns the definition of the nested objects of a property, if any,
+    and whether the property is an array.'''
+    if '$ref' in schema:
+        return common._ref_name(schema['$ref']), False
+    if schema.get('type') == 'array' and '$ref' in schema.get('items', {}):
+        return common._ref_name(schema['items']['$ref']), True
+    return None, False
+
+_classes: Dict[Tuple[str, str], type] = {}
+_lock = threading.Lock()
+
+def record_class(definition: str, version: str = None) -> type:
+    '''Returns the record class for a schema definition, generating it on
+    first use.
+
+    Args:
+        definition: The name of the schema definition, e.g., ``WSPerson``.
+        version: The Pure API version. Default: Return value of
+            ``common.default_version()``.
+
+    Returns:
+        A subclass of ``Record``, with a slot for each property of the
+        definition, including properties of sub-types.
+    '''
+    if version is None:
+        version = common.default_version()
+    try:
+        return _classes[(definition, version)]
+    except KeyError:
+        pass
+    properties = common.properties_for(definition=definition, version=version)
+    # Properties that would hide Record or MutableMapping methods, e.g.,
+    # ``items``, are only accessible as keys:
+    reserved = set(dir(Record))
+    slots = tuple(f'_{index}' for index in range(len(properties)))
+    with _lock:
+        if (definition, version) in _classes:
+            return _classes[(definition, version)]
+        cls = type(definition, (Record,), {
+            '__slots__': slots,
+            '__module__': __name__,
+            '_definition': definition,
+            '_version': version,
+        })
+        fields = {}
+        for (name, schema), slot in zip(properties.items(), slots):
+            nested, is_array = _nested_definition(schema)
+            field = _Field(name, cls.__dict__[slot], nested, is_array, version)
+            fields[name] = field
+            if name not in reserved:
+                setattr(cls, name, field)
+        cls._fields = fields
+        cls._nested = tuple(field for field in fields.values() if field.definition is not None)
+        _classes[(definition, version)] = cls
+    return cls
+
+@functools.lru_cache(maxsize=None)
+def _collection_class(collection: str, version: str) -> type:
+    definition = common.item_definition_for(collection=collection, version=version)
+    # Collections without a schema definition get a class without fields, so
+    # that all fields are kept as extras:
+    return record_class(definition if definition is not None else 'UntypedRecord', version)
+
+def _apply_defaults(collection: str, data: Dict) -> None:
+    for path, factory in defaults.get(collection, ()):
+        target = data
+        for key in path[:-1]:
+            child = target.get(key)
+            if not isinstance(child, dict):
+                child = target[key] = {}
+            target = child
+        if path[-1] not in target:
+            target[path[-1]] = factory()
+
+def from_json(collection: str, data: Dict, *, version: str = None) -> Record:
+    '''Constructs a record of the class for a collection from a decoded raw
+    JSON record, ensuring the same fields exist as the transformer for the
+    collection. Takes ownership of ``data``, which may be modified.
+
+    Args:
+        collection: The name of the collection, e.g., ``persons``.
+        data: A decoded raw JSON record.
+        version: The Pure API version. Default: Return value of
+            ``common.default_version()``.
+
+    Returns:
+        A record.
+
+    Raises:
+        common.PureAPIInvalidCollectionError: If the collection is invalid
+            for the API version.
+    '''
+    if version is None:
+        version = common.default_version()
+    _apply_defaults(collection, data)
+    return _collection_class(collection, version).from_json(data)
+
+def materialize(record: Any) -> Any:
+    '''Converts all nested objects of a record to records, in place, so that
+    the record uses as little memory as possible.
+
+    Returns:
+        The record.
+    '''
+    stack = [record] if isinstance(record, Record) else []
+    while stack:
+        value = stack.pop()
+        cls = type(value)
+        for field in cls._nested:
+            child = field.__get__(value, cls)
+            if type(child) is list:
+                stack.extend(item for item in child if isinstance(item, Record))
+            elif isinstance(child, Record):
+                stack.append(child)
+    return record
+
+def to_dict(value: Any) -> Any:
+    '''Converts a record, including nested records, to plain ``dict`` and
+    ``list`` objects, e.g., for ``json.dumps()``. Other values are returned
+    as they are.'''
+    if isinstance(value, Record):
+        return {key: to_dict(value[key]) for key in value}
+    if isinstance(value, Mapping):
+        return {key: to_dict(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_dict(item) for item in value]
+    return value
+
+def _unpickle(definition: str, version: str, data: Dict) -> Record:
+    return record_class(definition, version).from_json(data)
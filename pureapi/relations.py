@@ -0,0 +1,187 @@
+'''Expansion of the records that other records reference by uuid.
+
+Records reference related records, e.g., the persons, external persons,
+organisational units, external organisations and journal of a research
+output, with nested objects that contain a ``uuid`` and a ``link.href`` to
+the related record. ``expand()`` collects these references across a batch of
+records, de-duplicates them, requests the related records of each collection
+in parallel batches of uuids, and attaches them to the referencing objects.
+For a batch of records, that takes a few requests per collection, instead of
+one request per reference.
+
+Example:
+    from pureapi import client, relations
+    research_outputs = client.get_all_transformed('research-outputs')
+    for ro in relations.expand(research_outputs):
+        for association in ro.personAssociations:
+            person = association.person.expanded or association.externalPerson.expanded
+'''
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, MutableMapping, Optional, Sequence, Tuple
+
+import addict
+
+from pureapi import client
+
+default_collections: Tuple[str, ...] = (
+    'persons',
+    'external-persons',
+    'organisational-units',
+    'external-organisations',
+    'journals',
+)
+'''Collections of related records that ``expand()`` requests by default.'''
+
+def _reference(value: Any) -> Optional[Tuple[str, str]]:
+    '''Returns ``(collection, uuid)`` if ``value`` is a reference to another
+    record, i.e., a mapping with a ``uuid`` and a ``link.href`` that ends with
+    ``<collection>/<uuid>``, or ``None`` otherwise.'''
+    if not isinstance(value, Mapping) or 'uuid' not in value or 'link' not in value:
+        return None
+    link = value['link']
+    href = link.get('href') if isinstance(link, Mapping) else None
+    if not isinstance(href, str):
+        return None
+    segments = href.rstrip('/').split('/')
+    if len(segments) < 2 or segments[-1] != value['uuid']:
+        return None
+    return segments[-2], value['uuid']
+
+def _reference_objects(
+    record: Mapping,
+    collections: Sequence[str],
+    attach_as: str = 'expanded'
+) -> Iterator[Tuple[str, str, MutableMapping]]:
+    '''Yields ``(collection, uuid, object)`` for every object nested in a
+    record that references a record in one of the ``collections``, skipping
+    any related records already attached under ``attach_as``.'''
+    stack: List[Any] = list(record.values())
+    while stack:
+        value = stack.pop()
+        if isinstance(value, Mapping):
+            reference = _reference(value)
+            if reference is not None and reference[0] in collections:
+                yield reference[0], reference[1], value
+            stack.extend(child for key, child in value.items() if key != attach_as)
+        elif isinstance(value, list):
+            stack.extend(value)
+
+def references(
+    records: Iterable[Mapping],
+    collections: Sequence[str] = default_collections,
+    attach_as: str = 'expanded'
+) -> Dict[str, List[str]]:
+    '''Returns the uuids of all records that the ``records`` reference, by
+    collection, de-duplicated, in order of first reference.
+
+    Args:
+        records: Raw or transformed records.
+        collections: Collections of related records to include.
+        attach_as: Key of related records attached by ``expand()``, whose own
+            references to ignore.
+
+    Returns:
+        Lists of uuids, by collection.
+    '''
+    uuids: Dict[str, Dict[str, None]] = {}
+    for record in records:
+        for collection, uuid, _ in _reference_objects(record, collections, attach_as):
+            uuids.setdefault(collection, {})[uuid] = None
+    return {collection: list(collection_uuids) for collection, collection_uuids in uuids.items()}
+
+def fetch_related(
+    uuids: Mapping[str, Sequence[str]],
+    *,
+    uuids_per_request: int = 100,
+    max_workers: int = 4,
+    cache: Any = None,
+    config: client.Config = client.Config()
+) -> Dict[str, Dict[str, addict.Dict]]:
+    '''Requests transformed records by uuid, from multiple collections, with
+    up to ``max_workers`` requests in flight at once.
+
+    Args:
+        uuids: Lists of uuids, by collection, e.g., from ``references()``.
+        uuids_per_request: The number of records to retrieve in each request.
+        max_workers: Maximum number of requests in flight.
+        cache: A ``cache.RecordCache`` from which to serve records locally,
+            and in which to cache requested records. Default: ``None``, to
+            request all records. Its ``config`` replaces ``config``.
+        config: An instance of client.Config.
+
+    Returns:
+        Records, by uuid, by collection. Records that the Pure API did not
+        return, e.g., because they are confidential, are missing.
+    '''
+    def request(collection: str, group: List[str]) -> List[addict.Dict]:
+        if cache is not None:
+            return list(cache.filter_all_by_uuid_transformed(collection, uuids=group, uuids_per_request=uuids_per_request))
+        return list(client.filter_all_by_uuid_transformed(
+            collection, uuids=group, uuids_per_request=uuids_per_request, config=config
+        ))
+
+    related: Dict[str, Dict[str, addict.Dict]] = {collection: {} for collection in uuids}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pureapi-relations') as executor:
+        futures = [
+            (collection, executor.submit(request, collection, group))
+            for collection, collection_uuids in uuids.items()
+            for group in client._group_items(items=list(collection_uuids), items_per_group=uuids_per_request)
+        ]
+        for collection, future in futures:
+            for record in future.result():
+                related[collection][record.uuid] = record
+    return related
+
+def expand(
+    records: Iterable[MutableMapping],
+    *,
+    collections: Sequence[str] = default_collections,
+    batch_size: int = 100,
+    attach_as: str = 'expanded',
+    uuids_per_request: int = 100,
+    max_workers: int = 4,
+    cache: Any = None,
+    config: client.Config = client.Config()
+) -> Iterator[MutableMapping]:
+    '''Yields records, e.g., from ``client.get_all_transformed()`` or
+    ``client.filter_all_transformed()``, with the records they reference
+    attached to each referencing object, under the key ``attach_as``.
+
+    Collects references across each batch of ``batch_size`` records, so that
+    each related record is requested once per batch, however many records
+    reference it. Records referenced more than once in a batch are attached
+    as the same object. References to records that the Pure API did not
+    return are left as they are.
+
+    Args:
+        records: Raw or transformed records.
+        collections: Collections of related records to expand.
+        batch_size: Number of records whose references to collect at once.
+        attach_as: Key under which to attach each related record.
+        uuids_per_request: See ``fetch_related()``.
+        max_workers: See ``fetch_related()``.
+        cache: See ``fetch_related()``.
+        config: An instance of client.Config.
+
+    Yields:
+        The records, in order, with related records attached.
+    '''
+    records = iter(records)
+    while True:
+        batch = list(islice(records, max(1, int(batch_size))))
+        if not batch:
+            return
+        related = fetch_related(
+            references(batch, collections, attach_as),
+            uuids_per_request=uuids_per_request,
+            max_workers=max_workers,
+            cache=cache,
+            config=config
+        )
+        for record in batch:
+            for collection, uuid, reference in list(_reference_objects(record, collections, attach_as)):
+                related_record = related.get(collection, {}).get(uuid)
+                if related_record is not None:
+                    reference[attach_as] = related_record
+        yield from batch
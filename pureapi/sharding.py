@@ -0,0 +1,281 @@
+'''Multi-process, sharded harvests of large collections.
+
+For very large collections, decoding and transforming records in a single
+process is CPU-bound, even when requests are fast. A sharded harvest plans
+the same windows of records as ``client.get_all()`` or ``client.filter_all()``,
+from a single count request, then splits them into contiguous shards, which
+worker processes harvest in parallel, each with its own HTTP connections.
+
+Results either go to one JSON-lines file per shard, with
+``harvest_to_files()``, or come back as a single stream of records, in the
+same order as ``get_all()`` would yield them, with ``harvest()``. Shards that
+fail are retried individually.
+
+Worker processes inherit the ``config`` by forking, where the platform
+supports it. Otherwise, the ``config`` must be picklable, which requires a
+picklable ``retryer``.
+
+Example:
+    from pureapi import sharding
+    for ro in sharding.harvest('research-outputs', processes=8, transformed=True):
+        ...
+'''
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Any, Callable, Deque, Iterator, List, Mapping, Optional, Tuple
+
+import attr
+
+from pureapi import client, sinks
+from pureapi.exceptions import PureAPIException
+
+class PureAPIShardException(PureAPIException):
+    '''Raised when a shard fails after all retries.'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+@attr.s(auto_attribs=True, frozen=True)
+class Shard:
+    '''A contiguous range of windows of records.'''
+
+    index: int
+    '''Position of the shard in the harvest, starting at 0.'''
+
+    windows: Tuple[Mapping, ...]
+    '''URL query string params, or JSON filter payloads, for each window.'''
+
+@attr.s(auto_attribs=True, frozen=True)
+class ShardResult:
+    '''Result of harvesting a shard to a file.'''
+
+    shard: Shard
+    path: Optional[Path]
+    '''Path of the JSON-lines file containing the shard's records, or ``None``
+    if the shard contained no records.'''
+
+    record_count: int
+    '''Number of records in the file.'''
+
+def plan(
+    resource_path: str,
+    params: Mapping = None,
+    payload: Mapping = None,
+    shard_count: int = 1,
+    config: client.Config = client.Config()
+) -> List[Shard]:
+    '''Plans the shards for a harvest, with a single count request.
+
+    Args:
+        resource_path: URL path to a Pure API resource, to be appended to the
+            ``Config.base_url``. Do not include a leading forward slash (``/``).
+        params: A mapping representing URL query string params, as for
+            ``client.get_all()``.
+        payload: A mapping representing JSON filters of the collection, as for
+            ``client.filter_all()``. Default: ``None``, to use URL params.
+        shard_count: Maximum number of shards. There will be fewer if there
+            are fewer windows.
+        config: An instance of client.Config.
+
+    Returns:
+        Shards, in order of offset.
+    '''
+    if payload is not None:
+        windows = client._filter_all_windows(resource_path, dict(payload), config)
+    else:
+        windows = client._get_all_windows(resource_path, {} if params is None else dict(params), config)
+    shard_count = max(1, min(int(shard_count), len(windows)))
+    shards = []
+    start = 0
+    for index in range(shard_count):
+        # Spread any remainder over the first shards:
+        end = start + len(windows) // shard_count + (1 if index < len(windows) % shard_count else 0)
+        shards.append(Shard(index=index, windows=tuple(windows[start:end])))
+        start = end
+    return [shard for shard in shards if shard.windows]
+
+_worker_config: Optional[client.Config] = None
+'''The Config for all requests in a worker process.'''
+
+def _init_worker(config: client.Config) -> None:
+    global _worker_config
+    # Forked workers inherit any pooled connections of the parent's transport,
+    # which they must not write to:
+    _worker_config = attr.evolve(config, transport=config.transport.clone())
+
+def _shard_records(shard: Shard, resource_path: str, use_filter: bool, transformed: bool) -> Iterator[Any]:
+    config = _worker_config
+    collection = client._get_collection_from_resource_path(resource_path, config.version)
+    request = client.filter if use_filter else client.get
+    for window in shard.windows:
+        for item in client._decode(request(resource_path, window, config), collection, config)['items']:
+            yield client._transform(collection, item, config) if transformed else item
+
+def _harvest_shard(shard: Shard, resource_path: str, use_filter: bool, transformed: bool) -> List:
+    return list(_shard_records(shard, resource_path, use_filter, transformed))
+
+def _harvest_shard_to_file(
+    shard: Shard,
+    resource_path: str,
+    use_filter: bool,
+    transformed: bool,
+    directory: Path,
+    prefix: str,
+    compress: bool
+) -> ShardResult:
+    collection = client._get_collection_from_resource_path(resource_path, _worker_config.version)
+    sink = sinks.JsonLinesSink(directory, prefix=f'{prefix}-shard{shard.index:05d}', compress=compress)
+    with sink:
+        page = []
+        for record in _shard_records(shard, resource_path, use_filter, transformed):
+            page.append(record)
+            if len(page) >= 100:
+                sink.write(collection, page)
+                page = []
+        sink.write(collection, page)
+    path = sink.paths[0] if sink.paths else None
+    return ShardResult(shard=shard, path=path, record_count=sink.records_written)
+
+def _executor(processes: Optional[int], config: client.Config) -> ProcessPoolExecutor:
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(config,)
+    )
+
+class _ShardRunner:
+    '''Submits shards to an executor, with a bounded number in flight, and
+    resubmits failed shards up to ``max_retries`` times.'''
+
+    def __init__(self, executor: ProcessPoolExecutor, function: Callable, args: Tuple, max_retries: int):
+        self.executor = executor
+        self.function = function
+        self.args = args
+        self.max_retries = max_retries
+
+    def submit(self, shard: Shard) -> Future:
+        return self.executor.submit(self.function, shard, *self.args)
+
+    def result(self, shard: Shard, future: Future) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return future.result()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise PureAPIShardException(
+                        f'Shard {shard.index} failed after {self.max_retries + 1} attempts'
+                    ) from e
+                future = self.submit(shard)
+
+    def run(self, shards: List[Shard], max_in_flight: int) -> Iterator[Any]:
+        pending: Deque[Tuple[Shard, Future]] = deque()
+        shards_iter = iter(shards)
+        for shard in shards_iter:
+            pending.append((shard, self.submit(shard)))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            shard, future = pending.popleft()
+            yield self.result(shard, future)
+            for next_shard in shards_iter:
+                pending.append((next_shard, self.submit(next_shard)))
+                break
+
+def harvest(
+    resource_path: str,
+    params: Mapping = None,
+    payload: Mapping = None,
+    *,
+    processes: int = None,
+    shard_count: int = None,
+    transformed: bool = False,
+    max_retries: int = 2,
+    config: client.Config = client.Config()
+) -> Iterator[Any]:
+    '''Harvests all records in a collection with a pool of worker processes,
+    yielding them in the same order as ``client.get_all()`` or
+    ``client.filter_all()``.
+
+    At most two shards per process are harvested but not yet yielded at any
+    time, which bounds memory use.
+
+    Args:
+        resource_path: URL path to a Pure API resource, to be appended to the
+            ``Config.base_url``. Do not include a leading forward slash (``/``).
+        params: A mapping representing URL query string params, as for
+            ``client.get_all()``.
+        payload: A mapping representing JSON filters of the collection, as for
+            ``client.filter_all()``. Default: ``None``, to use URL params.
+        processes: Number of worker processes. Default: ``os.cpu_count()``
+        shard_count: Number of shards. Default: four per process.
+        transformed: Whether to yield records transformed as by the
+            ``client.*_transformed()`` functions, instead of raw JSON records.
+        max_retries: Number of times to retry each failed shard.
+        config: An instance of client.Config.
+
+    Yields:
+        Individual records.
+
+    Raises:
+        PureAPIShardException: If a shard fails after all retries.
+    '''
+    processes = processes or os.cpu_count() or 1
+    shards = plan(resource_path, params, payload, shard_count or processes * 4, config)
+    with _executor(processes, config) as executor:
+        runner = _ShardRunner(executor, _harvest_shard, (resource_path, payload is not None, transformed), max_retries)
+        for records in runner.run(shards, max_in_flight=processes * 2):
+            yield from records
+
+def harvest_to_files(
+    resource_path: str,
+    directory: os.PathLike,
+    params: Mapping = None,
+    payload: Mapping = None,
+    *,
+    prefix: str = None,
+    compress: bool = True,
+    processes: int = None,
+    shard_count: int = None,
+    transformed: bool = False,
+    max_retries: int = 2,
+    config: client.Config = client.Config()
+) -> List[ShardResult]:
+    '''Harvests all records in a collection with a pool of worker processes,
+    writing the records of each shard to a separate JSON-lines file.
+
+    Args:
+        resource_path: URL path to a Pure API resource, to be appended to the
+            ``Config.base_url``. Do not include a leading forward slash (``/``).
+        directory: Directory in which to write files. Created if missing.
+        params: See ``harvest()``.
+        payload: See ``harvest()``.
+        prefix: Prefix for all file names. Default: The collection name.
+        compress: Whether to gzip-compress files. Default: ``True``
+        processes: See ``harvest()``.
+        shard_count: See ``harvest()``.
+        transformed: See ``harvest()``.
+        max_retries: See ``harvest()``.
+        config: An instance of client.Config.
+
+    Returns:
+        Results for each shard, in order.
+
+    Raises:
+        PureAPIShardException: If a shard fails after all retries.
+    '''
+    processes = processes or os.cpu_count() or 1
+    if prefix is None:
+        prefix = client._get_collection_from_resource_path(resource_path, config.version)
+    shards = plan(resource_path, params, payload, shard_count or processes * 4, config)
+    with _executor(processes, config) as executor:
+        runner = _ShardRunner(
+            executor,
+            _harvest_shard_to_file,
+            (resource_path, payload is not None, transformed, Path(directory), prefix, compress),
+            max_retries
+        )
+        return list(runner.run(shards, max_in_flight=len(shards)))
@@ -0,0 +1,227 @@
+'''Sinks that write records to rolling files, for use with ``client.export()``.
+
+Each sink writes records to a sequence of files in a directory, rolling over
+to a new file whenever the current file exceeds a size limit, or has been
+open longer than a time limit. File names include a zero-padded part number,
+e.g., ``research-outputs-00000.jsonl.gz``.
+
+Example:
+    from pureapi import client, sinks
+    sink = sinks.JsonLinesSink('exports/', prefix='research-outputs', max_bytes=2**30)
+    client.export('research-outputs', sink=sink)
+'''
+import abc
+import gzip
+import json
+import os
+from pathlib import Path
+import time
+from typing import IO, List, Mapping, Optional, Sequence
+
+from pureapi import columnar
+from pureapi.exceptions import PureAPIException
+
+class PureAPISinkException(PureAPIException):
+    '''Raised when a sink cannot write records.'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+class RollingFileSink(abc.ABC):
+    '''Base class for sinks that write to a sequence of files, rolling over to
+    a new file when the current one reaches ``max_bytes`` or ``max_seconds``.
+
+    Subclasses implement ``_open()``, ``_write()``, ``_size()`` and
+    ``_close()``. Sinks are not thread-safe: ``client.export()`` calls
+    ``write()`` from only a single writer thread.
+    '''
+
+    extension: str = ''
+    '''File name extension, including the leading period.'''
+
+    def __init__(
+        self,
+        directory: os.PathLike,
+        *,
+        prefix: str = 'records',
+        max_bytes: Optional[int] = None,
+        max_seconds: Optional[float] = None
+    ):
+        '''
+        Args:
+            directory: Directory in which to write files. Created if missing.
+            prefix: Prefix for all file names.
+            max_bytes: Size at which to roll over to a new file. Default:
+                ``None``, for no size limit.
+            max_seconds: Time after which to roll over to a new file. Default:
+                ``None``, for no time limit.
+        '''
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.paths: List[Path] = []
+        '''Paths of all files written, in order.'''
+        self.records_written = 0
+        self._part = None
+        self._opened_at = None
+
+    def write(self, collection: str, items: Sequence[Mapping]) -> None:
+        '''Writes ``items`` from the ``collection``, rolling over to a new file
+        first, if necessary.'''
+        if not items:
+            return
+        if self._part is not None and self._should_roll_over():
+            self._close_part()
+        if self._part is None:
+            self._open_part(collection)
+        self._write(collection, items)
+        self.records_written += len(items)
+
+    def close(self) -> None:
+        '''Closes the current file, if any.'''
+        if self._part is not None:
+            self._close_part()
+
+    def __enter__(self) -> 'RollingFileSink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _should_roll_over(self) -> bool:
+        if self.max_bytes is not None and self._size() >= self.max_bytes:
+            return True
+        if self.max_seconds is not None and time.monotonic() - self._opened_at >= self.max_seconds:
+            return True
+        return False
+
+    def _open_part(self, collection: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'{self.prefix}-{len(self.paths):05d}{self.extension}'
+        self.paths.append(path)
+        self._part = self._open(path, collection)
+        self._opened_at = time.monotonic()
+
+    def _close_part(self) -> None:
+        self._close()
+        self._part = None
+
+    @abc.abstractmethod
+    def _open(self, path: Path, collection: str):
+        '''Opens a new file at ``path``, and returns it.'''
+
+    @abc.abstractmethod
+    def _write(self, collection: str, items: Sequence[Mapping]) -> None:
+        '''Writes ``items`` to the current file.'''
+
+    @abc.abstractmethod
+    def _size(self) -> int:
+        '''Returns the number of bytes written to the current file.'''
+
+    @abc.abstractmethod
+    def _close(self) -> None:
+        '''Closes the current file.'''
+
+class JsonLinesSink(RollingFileSink):
+    '''Writes records as JSON lines, optionally gzip-compressed.'''
+
+    def __init__(self, directory: os.PathLike, *, compress: bool = True, compresslevel: int = 6, **kwargs):
+        '''
+        Args:
+            directory: Directory in which to write files. Created if missing.
+            compress: Whether to gzip-compress files. Default: ``True``
+            compresslevel: gzip compression level, from 1 to 9. Default: 6
+            **kwargs: See ``RollingFileSink``.
+        '''
+        super().__init__(directory, **kwargs)
+        self.compress = compress
+        self.compresslevel = compresslevel
+        self.extension = '.jsonl.gz' if compress else '.jsonl'
+        self._raw: Optional[IO[bytes]] = None
+
+    def _open(self, path: Path, collection: str) -> IO[bytes]:
+        self._raw = open(path, 'wb')
+        if self.compress:
+            return gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=self.compresslevel)
+        return self._raw
+
+    def _write(self, collection: str, items: Sequence[Mapping]) -> None:
+        self._part.write(''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items).encode('utf-8'))
+
+    def _size(self) -> int:
+        # For compressed files, the size of the compressed output so far.
+        return self._raw.tell()
+
+    def _close(self) -> None:
+        self._part.close()
+        if self._raw is not self._part:
+            self._raw.close()
+        self._raw = None
+
+class ParquetSink(RollingFileSink):
+    '''Writes records as Parquet files, with one file for each table
+    ``columnar.ColumnarConverter`` produces per part, e.g.,
+    ``research-outputs-00000.research-outputs.personAssociations.parquet``.
+    ``paths`` contains the prefixes of these parts, and ``table_paths`` the
+    actual files. Requires ``pyarrow``.
+    '''
+
+    extension = ''
+
+    def __init__(
+        self,
+        directory: os.PathLike,
+        *,
+        version: str = None,
+        depth: int = columnar.default_depth,
+        children: Optional[Sequence[str]] = None,
+        **kwargs
+    ):
+        '''
+        Args:
+            directory: Directory in which to write files. Created if missing.
+            version: The Pure API version, without the decimal point.
+            depth: See ``columnar.ColumnarConverter``.
+            children: See ``columnar.ColumnarConverter``.
+            **kwargs: See ``RollingFileSink``.
+
+        Raises:
+            PureAPISinkException: If ``pyarrow`` is not installed.
+        '''
+        if columnar.pyarrow is None:
+            raise PureAPISinkException('pyarrow is required for ParquetSink, but is not installed')
+        super().__init__(directory, **kwargs)
+        self.version = version
+        self.depth = depth
+        self.children = children
+        self._converters = {}
+        self._writers = {}
+        self.table_paths: List[Path] = []
+        '''Paths of all Parquet files written, in order.'''
+
+    def _open(self, path: Path, collection: str) -> Path:
+        if collection not in self._converters:
+            self._converters[collection] = columnar.ColumnarConverter(
+                collection,
+                version=self.version,
+                depth=self.depth,
+                children=self.children
+            )
+        return path
+
+    def _write(self, collection: str, items: Sequence[Mapping]) -> None:
+        for name, batch in self._converters[collection].convert(items).items():
+            record_batch = batch.to_arrow()
+            if name not in self._writers:
+                table_path = Path(f'{self._part}.{name}.parquet')
+                self.table_paths.append(table_path)
+                self._writers[name] = (table_path, columnar.pyarrow.parquet.ParquetWriter(table_path, record_batch.schema))
+            self._writers[name][1].write_batch(record_batch)
+
+    def _size(self) -> int:
+        return sum(os.path.getsize(table_path) for table_path, _ in self._writers.values())
+
+    def _close(self) -> None:
+        for _, writer in self._writers.values():
+            writer.close()
+        self._writers = {}
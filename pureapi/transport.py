@@ -0,0 +1,483 @@
+'''Transports that send prepared HTTP requests for ``pureapi.client``.
+
+``client.get()`` and ``client.filter()`` prepare each request, then pass it to
+``Config.transport.send()``, via ``Config.retryer``. The default transport
+sends requests with ``requests``, over HTTP/1.1, with a new connection for
+each request. ``HTTPXTransport`` keeps persistent connections, and
+multiplexes concurrent requests over HTTP/2. ``SingleFlightTransport``
+coalesces identical concurrent requests into one. Other transports can record exchanges with a
+Pure API server to a store on disk, then replay them later, without network
+access, e.g., to profile harvests deterministically, or to reproduce
+production slowdowns offline.
+
+Example:
+    from pureapi import client, transport
+    store = transport.ExchangeStore('exchanges/')
+    recording = client.Config(transport=transport.RecordingTransport(store))
+    for ro in client.get_all_transformed('research-outputs', config=recording):
+        ...
+    # Later, offline, at twice the recorded speed:
+    replaying = client.Config(transport=transport.ReplayTransport(store, speed=2.0))
+    for ro in client.get_all_transformed('research-outputs', config=replaying):
+        ...
+'''
+from collections import OrderedDict
+from datetime import timedelta
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from pureapi.exceptions import PureAPIException
+
+try:
+    import httpx
+except ImportError: # pragma: no cover
+    httpx = None
+
+Timeout = Union[float, Tuple[float, float], None]
+'''Connect and read timeouts, in seconds, as for ``requests``.'''
+
+class PureAPITransportException(PureAPIException):
+    '''Raised when a transport cannot record or replay an exchange.'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+class Transport:
+    '''Base class for transports.
+
+    Subclasses must implement ``send()``, and may override ``prepare()``.
+    Transports may be called from multiple threads at once.
+    '''
+
+    def prepare(self, request: requests.Request) -> requests.PreparedRequest:
+        '''Prepares a request, adding any default headers.'''
+        with requests.Session() as s:
+            return s.prepare_request(request)
+
+    def send(self, request: requests.PreparedRequest, *, timeout: Timeout = None) -> requests.Response:
+        '''Sends a prepared request, and returns the response.
+
+        Args:
+            request: A prepared request.
+            timeout: Connect and read timeouts, in seconds.
+
+        Returns:
+            An HTTP response object, whatever its status code.
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails without
+                a response.
+        '''
+        raise NotImplementedError
+
+    def clone(self) -> 'Transport':
+        '''Returns a transport that sends requests in the same way, but shares
+        no connections with this one, e.g., for a forked worker process.
+        Default: This transport, which must then hold no connections.'''
+        return self
+
+class RequestsTransport(Transport):
+    '''Sends requests with ``requests``, in a new session for each request.'''
+
+    def send(self, request: requests.PreparedRequest, *, timeout: Timeout = None) -> requests.Response:
+        with requests.Session() as s:
+            return s.send(request, timeout=timeout)
+
+class HTTPXTransport(Transport):
+    '''Sends requests with ``httpx``, over a shared pool of persistent
+    connections, with HTTP/2 if the server supports it. With HTTP/2, requests
+    from multiple threads at once, e.g., from ``pipeline.get_all_transformed()``
+    or ``fanout.fan_out()``, are multiplexed over a single connection, instead
+    of each needing its own. Connections cannot be shared across processes, so
+    each ``sharding.harvest()`` worker process uses a ``clone()``.
+
+    Requires ``httpx``, with its ``http2`` extra, for HTTP/2. Failed requests
+    raise the same ``requests`` exceptions as ``RequestsTransport``.
+    '''
+
+    def __init__(
+        self,
+        *,
+        http2: bool = True,
+        http1: bool = True,
+        max_connections: Optional[int] = 100,
+        **client_kwargs: Any
+    ):
+        '''
+        Args:
+            http2: Whether to use HTTP/2, negotiated with TLS servers.
+            http1: Whether to allow HTTP/1.1. With ``http2=True`` and
+                ``http1=False``, uses HTTP/2 even without TLS, e.g., for a
+                local server, with prior knowledge that it supports HTTP/2.
+            max_connections: Maximum number of connections in the pool.
+            **client_kwargs: Any other arguments for ``httpx.Client``.
+
+        Raises:
+            PureAPITransportException: If ``httpx`` is not installed.
+        '''
+        if httpx is None:
+            raise PureAPITransportException('httpx is required for HTTPXTransport, but is not installed')
+        self._kwargs = dict(client_kwargs, http2=http2, http1=http1, max_connections=max_connections)
+        self.client = httpx.Client(
+            http1=http1,
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            **client_kwargs
+        )
+
+    def send(self, request: requests.PreparedRequest, *, timeout: Timeout = None) -> requests.Response:
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            httpx_timeout = httpx.Timeout(read, connect=connect)
+        else:
+            httpx_timeout = httpx.Timeout(timeout)
+        try:
+            r = self.client.request(
+                request.method,
+                request.url,
+                headers=dict(request.headers),
+                content=request.body,
+                timeout=httpx_timeout,
+            )
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e), request=request) from e
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e), request=request) from e
+
+        response = requests.Response()
+        response.request = request
+        response.url = str(r.url)
+        response.status_code = r.status_code
+        response.reason = r.reason_phrase
+        # The body is already decoded, so drop headers that describe the encoded
+        # body, including its length, if it was compressed:
+        encoded_headers = {'content-encoding', 'transfer-encoding'}
+        if r.headers.get('content-encoding', 'identity').lower() != 'identity':
+            encoded_headers.add('content-length')
+        response.headers = CaseInsensitiveDict({
+            name: value for name, value in r.headers.items()
+            if name.lower() not in encoded_headers
+        })
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.elapsed = r.elapsed
+        response._content = r.content
+        return response
+
+    def clone(self) -> 'HTTPXTransport':
+        '''Returns a transport with the same arguments, and a new, empty pool
+        of connections.'''
+        return HTTPXTransport(**self._kwargs)
+
+    def close(self) -> None:
+        '''Closes all connections.'''
+        self.client.close()
+
+    def __enter__(self) -> 'HTTPXTransport':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+class LimitedTransport(Transport):
+    '''Sends requests with another transport, with at most a fixed number
+    in flight at once. Transports that share a ``semaphore`` share the
+    limit, e.g., for multiple API keys on the same server.'''
+
+    def __init__(self, transport: Transport, semaphore: threading.Semaphore):
+        '''
+        Args:
+            transport: Transport with which to send requests.
+            semaphore: Semaphore to hold for the duration of each request,
+                e.g., ``threading.BoundedSemaphore(4)``.
+        '''
+        self.transport = transport
+        self.semaphore = semaphore
+
+    def prepare(self, request: requests.Request) -> requests.PreparedRequest:
+        return self.transport.prepare(request)
+
+    def send(self, request: requests.PreparedRequest, *, timeout: Timeout = None) -> requests.Response:
+        with self.semaphore:
+            return self.transport.send(request, timeout=timeout)
+
+    def clone(self) -> 'LimitedTransport':
+        return LimitedTransport(self.transport.clone(), self.semaphore)
+
+class _Flight:
+    '''A request in flight, shared by all identical concurrent requests.'''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[requests.Response] = None
+        self.error: Optional[BaseException] = None
+
+def _copy_response(response: requests.Response, request: requests.PreparedRequest) -> requests.Response:
+    copy = requests.Response()
+    copy.request = request
+    copy.url = response.url
+    copy.status_code = response.status_code
+    copy.reason = response.reason
+    copy.headers = CaseInsensitiveDict(response.headers)
+    copy.encoding = response.encoding
+    copy.elapsed = response.elapsed
+    copy._content = response.content
+    return copy
+
+class SingleFlightTransport(Transport):
+    '''Sends requests with another transport, coalescing identical requests
+    that are in flight at the same time into a single request, whose response
+    they all share. Optionally, also reuses successful responses for a short
+    time after they arrive.
+
+    Requests are identical if they have the same method, URL, body, and API
+    key. Each caller gets its own copy of the response object. Failed requests
+    are never reused after they end, so each caller's retryer retries them.
+
+    ``hits`` and ``misses`` count requests that did and did not share a
+    response, so that, e.g., ``metrics.PrometheusMetrics.register_cache()``
+    can export them.
+    '''
+
+    def __init__(self, transport: Transport = None, *, ttl: Optional[float] = None, max_cached: int = 128):
+        '''
+        Args:
+            transport: Transport with which to send requests. Default: A new
+                ``RequestsTransport``.
+            ttl: Seconds for which to reuse each successful response after it
+                arrives. Default: ``None``, to share responses only among
+                requests in flight at the same time.
+            max_cached: Maximum number of responses to keep for reuse. The
+                oldest are discarded first.
+        '''
+        self.transport = transport if transport is not None else RequestsTransport()
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._cached: 'OrderedDict[str, Tuple[float, requests.Response]]' = OrderedDict()
+
+    def prepare(self, request: requests.Request) -> requests.PreparedRequest:
+        return self.transport.prepare(request)
+
+    def _key(self, request: requests.PreparedRequest) -> str:
+        api_key = request.headers.get('api-key') or ''
+        return request_key(request) + hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+    def send(self, request: requests.PreparedRequest, *, timeout: Timeout = None) -> requests.Response:
+        key = self._key(request)
+        with self._lock:
+            cached = self._cached.get(key)
+            if cached is not None:
+                expires, response = cached
+                if time.monotonic() < expires:
+                    self.hits += 1
+                    return _copy_response(response, request)
+                del self._cached[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return _copy_response(flight.response, request)
+
+        try:
+            flight.response = self.transport.send(request, timeout=timeout)
+            return flight.response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if self.ttl and flight.response is not None and flight.response.ok:
+                    self._cached[key] = (time.monotonic() + self.ttl, flight.response)
+                    while len(self._cached) > self.max_cached:
+                        self._cached.popitem(last=False)
+            flight.done.set()
+
+    def clone(self) -> 'SingleFlightTransport':
+        '''Returns a transport with the same arguments, and no requests in
+        flight or responses kept for reuse.'''
+        return SingleFlightTransport(self.transport.clone(), ttl=self.ttl, max_cached=self.max_cached)
+
+    def clear(self) -> None:
+        '''Discards all responses kept for reuse.'''
+        with self._lock:
+            self._cached.clear()
+
+def request_key(request: requests.PreparedRequest) -> str:
+    '''Returns a key that identifies a request by its method, URL and body,
+    ignoring headers, which include the API key.'''
+    body = request.body or b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8') + b'\n' + request.url.encode('utf-8') + b'\n')
+    digest.update(body)
+    return digest.hexdigest()
+
+_dropped_headers = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+'''Response headers that do not apply to stored, decoded bodies.'''
+
+class ExchangeStore:
+    '''A content-addressed store of HTTP exchanges on disk.
+
+    Response bodies are stored gzip-compressed, once each, by the SHA-256
+    digest of their content, in ``bodies/``. Exchanges are stored as small JSON
+    files in ``exchanges/``, by ``request_key()``, and contain the request
+    method, URL and body, and the response status, headers, elapsed time, and
+    body digest. Request headers, which include the API key, are never stored.
+    '''
+
+    def __init__(self, directory: os.PathLike, *, compresslevel: int = 6):
+        '''
+        Args:
+            directory: Directory of the store. Created if missing.
+            compresslevel: gzip compression level for bodies, from 1 to 9.
+        '''
+        self.directory = Path(directory)
+        self.compresslevel = compresslevel
+
+    def _exchange_path(self, key: str) -> Path:
+        return self.directory / 'exchanges' / key[:2] / f'{key}.json'
+
+    def _body_path(self, digest: str) -> Path:
+        return self.directory / 'bodies' / digest[:2] / f'{digest}.gz'
+
+    def _write(self, path: Path, data: bytes) -> None:
+        # Write atomically, so concurrent writers and readers never see partial files:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, key: str) -> bool:
+        return self._exchange_path(key).exists()
+
+    def put(self, request: requests.PreparedRequest, response: requests.Response) -> str:
+        '''Stores an exchange, replacing any with the same request key.
+
+        Returns:
+            The request key.
+        '''
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        body_path = self._body_path(digest)
+        if not body_path.exists():
+            self._write(body_path, gzip.compress(content, compresslevel=self.compresslevel))
+        request_body = request.body or b''
+        if isinstance(request_body, bytes):
+            request_body = request_body.decode('utf-8')
+        exchange = {
+            'request': {'method': request.method, 'url': request.url, 'body': request_body},
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in _dropped_headers
+            },
+            'elapsed': response.elapsed.total_seconds(),
+            'body': digest,
+        }
+        key = request_key(request)
+        self._write(self._exchange_path(key), json.dumps(exchange).encode('utf-8'))
+        return key
+
+    def get(self, key: str) -> Optional[Mapping[str, Any]]:
+        '''Returns the exchange with a request ``key``, with its response body,
+        as bytes, in ``content``, or ``None`` if the store does not contain it.'''
+        try:
+            with open(self._exchange_path(key), 'rb') as f:
+                exchange = json.load(f)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(self._body_path(exchange['body']), 'rb') as f:
+                exchange['content'] = gzip.decompress(f.read())
+        except FileNotFoundError as e:
+            raise PureAPITransportException(f'Missing body {exchange["body"]} for exchange {key}') from e
+        return exchange
+
+class RecordingTransport(Transport):
+    '''Sends requests with another transport, storing every exchange.'''
+
+    def __init__(self, store: ExchangeStore, transport: Transport = None):
+        '''
+        Args:
+            store: Store in which to record exchanges.
+            transport: Transport with which to send requests. Default: A new
+                ``RequestsTransport``.
+        '''
+        self.store = store
+        self.transport = transport if transport is not None else RequestsTransport()
+
+    def prepare(self, request: requests.Request) -> requests.PreparedRequest:
+        return self.transport.prepare(request)
+
+    def send(self, request: requests.PreparedRequest, *, timeout: Timeout = None) -> requests.Response:
+        response = self.transport.send(request, timeout=timeout)
+        self.store.put(request, response)
+        return response
+
+    def clone(self) -> 'RecordingTransport':
+        return RecordingTransport(self.store, self.transport.clone())
+
+class ReplayTransport(Transport):
+    '''Replays stored exchanges, without network access.
+
+    Requests that were never recorded get a response with HTTP status 404 and
+    reason ``Not Recorded``, so that ``client`` functions fail with a
+    ``client.PureAPIHTTPError``, instead of retrying.
+    '''
+
+    def __init__(self, store: ExchangeStore, *, speed: Optional[float] = None):
+        '''
+        Args:
+            store: Store from which to replay exchanges.
+            speed: Speed relative to the recorded elapsed time of each
+                exchange, e.g., ``2.0`` for twice as fast. Default: ``None``,
+                to replay as fast as possible.
+        '''
+        self.store = store
+        self.speed = speed
+
+    def send(self, request: requests.PreparedRequest, *, timeout: Timeout = None) -> requests.Response:
+        exchange = self.store.get(request_key(request))
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        if exchange is None:
+            response.status_code = 404
+            response.reason = 'Not Recorded'
+            response._content = b''
+            return response
+
+        if self.speed is not None and self.speed > 0:
+            time.sleep(exchange['elapsed'] / self.speed)
+        response.status_code = exchange['status']
+        response.reason = exchange['reason']
+        response.headers = CaseInsensitiveDict(exchange['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.elapsed = timedelta(seconds=exchange['elapsed'])
+        response._content = exchange['content']
+        return response
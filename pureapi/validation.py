@@ -0,0 +1,264 @@
+'''Sampled validation of Pure API records against the schema for a Pure API
+version.
+
+Validating every record in a large harvest is too slow for production use, so
+``SampledValidator`` validates only a configurable fraction of records, and
+records schema drift statistics instead of raising exceptions. To validate
+the records yielded by the ``client.*_transformed()`` functions, pass a
+validator to ``client.Config``:
+
+Example:
+    validator = validation.SampledValidator(sample_rate=0.01)
+    config = client.Config(validator=validator)
+    for ro in client.get_all_transformed('research-outputs', config=config):
+        ...
+    print(validator.stats.report())
+'''
+from collections import Counter
+import random
+import threading
+from typing import Any, Callable, Dict, Mapping, MutableMapping, Optional, Tuple
+
+import attr
+
+from pureapi import common
+
+_json_types: Mapping[str, Tuple[type, ...]] = {
+    'string': (str,),
+    'integer': (int,),
+    'number': (int, float),
+    'boolean': (bool,),
+    'array': (list,),
+    'object': (dict,),
+}
+'''Python types of decoded JSON values, by swagger.io type name.'''
+
+@attr.s(auto_attribs=True)
+class DriftStats:
+    '''Statistics about differences between validated records and the schema.
+
+    Field paths are dotted, with ``[]`` marking array items, e.g.,
+    ``personAssociations[].person.uuid``.
+    '''
+
+    records_seen: int = 0
+    '''Number of records passed to the validator.'''
+
+    records_validated: int = 0
+    '''Number of records the validator sampled and validated.'''
+
+    unexpected_fields: Counter = attr.ib(factory=Counter)
+    '''Counts of fields, by path, that the schema does not define.'''
+
+    type_mismatches: Counter = attr.ib(factory=Counter)
+    '''Counts of ``(path, expected type, actual type)`` tuples for fields
+    whose values differ in type from the schema.'''
+
+    errors: Counter = attr.ib(factory=Counter)
+    '''Counts of unexpected exceptions raised during validation, by
+    collection and exception type name.'''
+
+    _lock: threading.Lock = attr.ib(factory=threading.Lock, repr=False, eq=False)
+
+    def record(self, validated: bool) -> None:
+        with self._lock:
+            self.records_seen += 1
+            if validated:
+                self.records_validated += 1
+
+    def unexpected_field(self, path: str) -> None:
+        with self._lock:
+            self.unexpected_fields[path] += 1
+
+    def type_mismatch(self, path: str, expected: str, actual: Any) -> None:
+        with self._lock:
+            self.type_mismatches[(path, expected, type(actual).__name__)] += 1
+
+    def error(self, collection: str, exception: Exception) -> None:
+        with self._lock:
+            self.errors[(collection, type(exception).__name__)] += 1
+
+    def report(self) -> MutableMapping:
+        '''Returns a summary of drift statistics, with per-field counts.
+
+        Returns:
+            A mapping with the record counts, and a ``fields`` mapping of
+            field paths to counts of ``unexpected`` occurrences and of
+            ``type_mismatch`` occurrences, by ``expected->actual`` type.
+        '''
+        with self._lock:
+            fields: Dict[str, MutableMapping] = {}
+            for path, count in self.unexpected_fields.items():
+                fields.setdefault(path, {})['unexpected'] = count
+            for (path, expected, actual), count in self.type_mismatches.items():
+                fields.setdefault(path, {}).setdefault('type_mismatch', {})[f'{expected}->{actual}'] = count
+            return {
+                'records_seen': self.records_seen,
+                'records_validated': self.records_validated,
+                'fields': fields,
+                'errors': {f'{collection}:{name}': count for (collection, name), count in self.errors.items()},
+            }
+
+class _FieldValidator:
+    '''Validates values of a single field, at a single path.'''
+    __slots__ = ('path', 'type_name', 'types', 'child')
+
+    def __init__(self, path: str, type_name: str, types: Tuple[type, ...], child: Optional[Callable]):
+        self.path = path
+        self.type_name = type_name
+        self.types = types
+        self.child = child
+
+    def __call__(self, value: Any, stats: DriftStats) -> None:
+        # bool is a subclass of int, but JSON integers are never booleans:
+        if not isinstance(value, self.types) or (value is True or value is False) and self.type_name in ('integer', 'number'):
+            stats.type_mismatch(self.path, self.type_name, value)
+        elif self.child is not None:
+            self.child(value, stats)
+
+class _ArrayValidator:
+    '''Validates the items of an array field.'''
+    __slots__ = ('items',)
+
+    def __init__(self, items: _FieldValidator):
+        self.items = items
+
+    def __call__(self, values: list, stats: DriftStats) -> None:
+        items = self.items
+        for value in values:
+            if value is not None:
+                items(value, stats)
+
+class _ObjectValidator:
+    '''Validates the fields of an object, compiling validators for the fields
+    of nested objects only when first needed.'''
+    __slots__ = ('compiler', 'definition', 'path', 'fields')
+
+    def __init__(self, compiler: 'SchemaValidator', definition: str, path: str):
+        self.compiler = compiler
+        self.definition = definition
+        self.path = path
+        self.fields: Optional[Mapping[str, _FieldValidator]] = None
+
+    def __call__(self, record: Mapping, stats: DriftStats) -> None:
+        fields = self.fields
+        if fields is None:
+            fields = self.fields = self.compiler._compile_fields(self.definition, self.path)
+        if not fields:
+            # The schema specifies no properties, so anything goes:
+            return
+        for key, value in record.items():
+            field = fields.get(key)
+            if field is None:
+                stats.unexpected_field(f'{self.path}{key}')
+            elif value is not None:
+                field(value, stats)
+
+class SchemaValidator:
+    '''Compiles and caches validators for the record schema definitions of a
+    Pure API version.
+
+    Compilation happens once per definition and field path, and compiled
+    validators check only the types of the fields present in a record, which
+    makes validating a record little more expensive than iterating over it.
+    '''
+
+    def __init__(self, version: str = None):
+        self.version = common.default_version() if version is None else version
+        if not common.valid_version(self.version):
+            raise common.PureAPIInvalidVersionError(self.version)
+        self._validators: Dict[str, Optional[_ObjectValidator]] = {}
+        self._lock = threading.Lock()
+
+    def validator_for(self, collection: str) -> Optional[Callable[[Mapping, DriftStats], None]]:
+        '''Returns a validator for records in the ``collection``, or ``None``
+        if the schema defines no records for the collection.
+
+        Raises:
+            common.PureAPIInvalidCollectionError: If the collection name is
+                invalid for the API version.
+        '''
+        try:
+            return self._validators[collection]
+        except KeyError:
+            pass
+        with self._lock:
+            if collection not in self._validators:
+                definition = common.item_definition_for(collection=collection, version=self.version)
+                self._validators[collection] = None if definition is None else _ObjectValidator(self, definition, '')
+            return self._validators[collection]
+
+    def validate(self, collection: str, record: Mapping, stats: DriftStats) -> None:
+        '''Validates a ``record`` from the ``collection``, adding any
+        differences from the schema to the ``stats``.'''
+        validator = self.validator_for(collection)
+        if validator is not None:
+            validator(record, stats)
+
+    def _compile_fields(self, definition: str, path: str) -> Mapping[str, _FieldValidator]:
+        return {
+            name: self._compile_field(schema, f'{path}{name}')
+            for name, schema in common.properties_for(definition=definition, version=self.version).items()
+        }
+
+    def _compile_field(self, schema: Mapping, path: str) -> _FieldValidator:
+        if '$ref' in schema:
+            child = _ObjectValidator(self, common._ref_name(schema['$ref']), f'{path}.')
+            return _FieldValidator(path, 'object', _json_types['object'], child)
+        type_name = schema.get('type', 'object')
+        child = None
+        if type_name == 'array' and 'items' in schema:
+            child = _ArrayValidator(self._compile_field(schema['items'], f'{path}[]'))
+        return _FieldValidator(path, type_name, _json_types.get(type_name, (object,)), child)
+
+@attr.s(auto_attribs=True)
+class SampledValidator:
+    '''Validates a random sample of records, recording schema drift in
+    ``stats`` instead of raising exceptions.
+
+    Instances are callables suitable for the ``validator`` attribute of
+    ``client.Config``. Validators for each version are compiled once, on first
+    use, and shared by all subsequent calls.
+    '''
+
+    sample_rate: float = attr.ib(
+        default=0.01,
+        converter=float
+    )
+    '''Fraction of records to validate, from ``0.0`` to ``1.0``. Default: ``0.01``'''
+    @sample_rate.validator
+    def validate_sample_rate(self, attribute: str, value: float) -> None:
+        if not 0.0 <= value <= 1.0:
+            raise ValueError(f'sample_rate must be between 0.0 and 1.0, not {value}')
+
+    debug: bool = False
+    '''If ``True``, validate every record, regardless of ``sample_rate``.'''
+
+    seed: Optional[int] = None
+    '''Seed for the random sampling of records, for reproducible samples.'''
+
+    stats: DriftStats = attr.ib(factory=DriftStats)
+    '''Drift statistics for all validated records.'''
+
+    _random: random.Random = attr.ib(init=False, repr=False, eq=False)
+    _validators: Dict[str, SchemaValidator] = attr.ib(init=False, factory=dict, repr=False, eq=False)
+
+    def __attrs_post_init__(self) -> None:
+        self._random = random.Random(self.seed)
+
+    def __call__(self, collection: str, record: Mapping, *, version: str = None) -> None:
+        '''Possibly validates a ``record`` from the ``collection``, depending
+        on the ``sample_rate``. Never raises exceptions for invalid records.'''
+        validated = self.debug or self._random.random() < self.sample_rate
+        self.stats.record(validated)
+        if not validated:
+            return
+        try:
+            if version is None:
+                version = common.default_version()
+            validator = self._validators.get(version)
+            if validator is None:
+                validator = self._validators.setdefault(version, SchemaValidator(version))
+            validator.validate(collection, record, self.stats)
+        except Exception as e:
+            self.stats.error(collection, e)
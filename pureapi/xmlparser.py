@@ -1,48 +1,267 @@
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
 import xml.etree.ElementTree as et
 import re
 
+try:
+  from lxml import etree as lxml_etree
+except ImportError:
+  lxml_etree = None
+
+# Field specs below use the subset of XPath that both ElementTree and lxml
+# support: child steps separated by '/', each optionally with a single
+# [@attribute='value'] predicate. Every path is compiled once per backend,
+# instead of on every find(): for ElementTree when it is defined, and for lxml on
+# first use with an lxml element. With lxml, paths compile to XPath objects. With
+# ElementTree, they compile to chains of single-tag findall() calls, which
+# ElementTree runs in C, with predicates checked in Python. Either way, a
+# compiled path returns all matching elements, in document order, so the first
+# match is the same one find() would return.
+
+_step_regex = re.compile(r"^([^\[\]/]+)(?:\[@([^=\]]+)='([^']*)'\])?$")
+
+def _compile_etree_path(path):
+  steps = []
+  for step in path[2:].split('/') if path.startswith('./') else path.split('/'):
+    match = _step_regex.match(step)
+    if match is None:
+      raise ValueError(f'Unsupported path step "{step}" in "{path}"')
+    steps.append(match.groups())
+
+  if len(steps) == 1 and steps[0][1] is None:
+    tag = steps[0][0]
+    return lambda elem: elem.findall(tag)
+
+  def findall(elem):
+    elems = [elem]
+    for tag, attrib, value in steps:
+      if attrib is None:
+        elems = [child for parent in elems for child in parent.findall(tag)]
+      else:
+        elems = [child for parent in elems for child in parent.findall(tag) if child.get(attrib) == value]
+      if not elems:
+        break
+    return elems
+  return findall
+
+def _compile_lxml_path(path):
+  return lxml_etree.XPath(path)
+
+_path_compilers = {'etree': _compile_etree_path, 'lxml': _compile_lxml_path}
+
+backend = 'etree'
+
+def use_backend(name):
+  # Selects the parser that records(), iterrecords() and parallel_records() use:
+  # 'etree', the default, or 'lxml', which is faster, if it is installed. Field
+  # specs and paths extract from elements of either backend, whichever is
+  # selected.
+  global backend
+  if name not in _path_compilers:
+    raise ValueError(f'Unknown backend "{name}"')
+  if name == 'lxml' and lxml_etree is None:
+    raise ValueError('The lxml backend requires lxml, which is not installed')
+  backend = name
+
+# Compiled paths work only on elements from their own backend, so field specs
+# and paths choose them by the type of each element.
+def _backend_of(elem):
+  if lxml_etree is not None and isinstance(elem, lxml_etree._Element):
+    return 'lxml'
+  return 'etree'
+
+def _text(elem):
+  return elem.text
+
+def _lower_text(elem):
+  return elem.text.lower()
+
+def _int_text(elem):
+  return int(elem.text)
+
+def _attrib(name):
+  return lambda elem: elem.attrib[name]
+
+def _elem(elem):
+  return elem
+
+_required = object()
+
+# A declarative set of fields to extract from an element. Each field is a tuple
+# of (key, path, extract, default): extract is called on the first element
+# matching path, and default is used when there is no match. Fields with a
+# default of _required raise AttributeError when there is no match, as calling
+# .text on the result of find() would.
+class FieldSpec:
+  def __init__(self, *fields):
+    self.fields = fields
+    self._compiled = {}
+    self._compile('etree')
+
+  def _compile(self, name):
+    compiled = self._compiled[name] = tuple(
+      (key, _path_compilers[name](path), extract, default, path)
+      for key, path, extract, default in self.fields
+    )
+    return compiled
+
+  def extract(self, elem, record=None):
+    if record is None:
+      record = {}
+    name = _backend_of(elem)
+    compiled = self._compiled.get(name) or self._compile(name)
+    for key, findall, extract, default, path in compiled:
+      found = findall(elem)
+      if found:
+        record[key] = extract(found[0])
+      elif default is _required:
+        raise AttributeError(f'No element matching required path "{path}"')
+      else:
+        record[key] = default
+    return record
+
+# For paths used outside of field specs, e.g. to iterate over child records.
+class Path:
+  def __init__(self, path):
+    self.path = path
+    self._compiled = {'etree': _compile_etree_path(path)}
+
+  def findall(self, elem):
+    name = _backend_of(elem)
+    findall = self._compiled.get(name)
+    if findall is None:
+      findall = self._compiled[name] = _path_compilers[name](self.path)
+    return findall(elem)
+
+  def find(self, elem):
+    found = self.findall(elem)
+    return found[0] if found else None
+
+def _parser_module():
+  return lxml_etree if backend == 'lxml' else et
+
 def records(xml):
-  root = et.fromstring(xml)
+  if backend == 'lxml' and isinstance(xml, str):
+    # lxml rejects str input with an encoding declaration, as ElementTree does
+    # not, so parse it as UTF-8 instead, overriding any declaration:
+    root = lxml_etree.fromstring(xml.encode('utf-8'), lxml_etree.XMLParser(encoding='utf-8'))
+  else:
+    root = _parser_module().fromstring(xml)
   return root.findall('result/content')
 
-def organisation(record):
+# Streaming alternative to records(), for exports too large to hold in memory,
+# either as a string or as a complete element tree. source may be a file name
+# or a binary file object. Yields each result/content element, or the result of
+# calling parse (e.g. publication) on it, then clears the element and removes
+# it from the tree, so memory use stays flat regardless of export size. Callers
+# must finish with each element before advancing the iterator.
+def iterrecords(source, parse=None):
+  depth = 0
+  result_elem = None
+  for event, elem in _parser_module().iterparse(source, events=('start', 'end')):
+    if event == 'start':
+      depth += 1
+      if depth == 2 and elem.tag == 'result':
+        result_elem = elem
+      continue
+    depth -= 1
+    if depth == 2 and elem.tag == 'content' and result_elem is not None:
+      yield parse(elem) if parse is not None else elem
+      elem.clear()
+      result_elem.remove(elem)
+    elif depth == 1 and elem.tag == 'result':
+      result_elem = None
+
+# Optional, bounded memoisation of the organisations, persons and organisation
+# associations that repeat across the records of an export. Pass the same
+# EntityCache to publication() for every record, e.g.
+#   cache = xmlparser.EntityCache()
+#   pubs = xmlparser.iterrecords(path, parse=lambda elem: xmlparser.publication(elem, cache))
+# Each entity is then parsed only once, and every record that contains it shares
+# the same dict, so callers must treat parsed records as read-only. Entities are
+# keyed by element tag and uuid, which assumes that, within an export, elements
+# with the same tag and uuid have the same content. The least-recently used
+# entities are evicted once the cache holds maxsize of them.
+class EntityCache:
+  def __init__(self, maxsize=10000):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+
+  def get(self, key, parse, elem):
+    try:
+      value = self._entries[key]
+    except KeyError:
+      self.misses += 1
+      value = self._entries[key] = parse(elem)
+      if len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+      return value
+    self.hits += 1
+    self._entries.move_to_end(key)
+    return value
+
+  def __len__(self):
+    return len(self._entries)
+
+  def clear(self):
+    self._entries.clear()
+
+def _cached(cache, elem, parse):
+  if cache is None:
+    return parse(elem, None)
+  return cache.get((elem.tag, elem.attrib['uuid']), lambda elem: parse(elem, cache), elem)
+
+_organisation_fields = FieldSpec(
+  ('type', "./typeClassification/term/localizedString[@locale='en_US']", _lower_text, _required),
+  # These fields will exist only for internal orgs:
+  ('pure_id', "./external/secondarySource[@source='synchronisedOrganisation']", _attrib('source_id'), None),
+  ('name_en', "./name/localizedString[@locale='en_US']", _text, None),
+  ('name_variant_en', "./nameVariant/classificationDefinedFieldExtension/value/localizedString[@locale='en_US']", _text, None),
+  ('url', "./webAddresses/classificationDefinedFieldExtension/value/localizedString[@locale='en_US']", _text, None),
+)
+_parent_organisation_path = Path('./organisations/organisation')
+_parent_organisation_fields = FieldSpec(
+  ('parent_pure_id', "./external/secondarySource[@source='synchronisedOrganisation']", _attrib('source_id'), None),
+)
+
+def organisation(record, cache=None):
+  return _cached(cache, record, _organisation)
+
+def _organisation(record, cache):
   org = {
     'pure_uuid': record.attrib['uuid'],
     'parent_pure_uuid': None,
     'parent_pure_id': None,
-    'type': record.find("./typeClassification/term/localizedString[@locale='en_US']").text.lower(),
   }
+  _organisation_fields.extract(record, org)
 
   # Hard-coded for now. Will need to change once we start importing external orgs.
   org['pure_internal'] = 'Y'
 
-  # These fields will exist only for internal orgs:
-  pure_id_elem = record.find("./external/secondarySource[@source='synchronisedOrganisation']")
-  org['pure_id'] = pure_id_elem.attrib['source_id'] if pure_id_elem is not None else None
-
-  name_en_elem = record.find("./name/localizedString[@locale='en_US']")
-  org['name_en'] = name_en_elem.text if name_en_elem is not None else None
-
-  name_variant_elem = record.find("./nameVariant/classificationDefinedFieldExtension/value/localizedString[@locale='en_US']")
-  org['name_variant_en'] = name_variant_elem.text if name_variant_elem is not None else None
-
-  url_elem = record.find("./webAddresses/classificationDefinedFieldExtension/value/localizedString[@locale='en_US']")
-  org['url'] = url_elem.text if url_elem is not None else None
-
-  parent_org_elem = record.find('./organisations/organisation')
+  parent_org_elem = _parent_organisation_path.find(record)
   if parent_org_elem is not None:
     org['parent_pure_uuid'] = parent_org_elem.attrib['uuid']
-    parent_pure_id_elem = parent_org_elem.find("./external/secondarySource[@source='synchronisedOrganisation']")
-    org['parent_pure_id'] = parent_pure_id_elem.attrib['source_id'] if parent_pure_id_elem is not None else None
+    _parent_organisation_fields.extract(parent_org_elem, org)
 
   return org
 
-def external_organisation(external_org_elem):
-  return {
-    'pure_uuid': external_org_elem.attrib['uuid'],
-    # Pure doesn't specify that this will be in English, so maybe a bad assumption:
-    'name_en': external_org_elem.find('./name').text,
-    'type': external_org_elem.find("./typeClassification/term/localizedString[@locale='en_US']").text.lower(),
+_external_organisation_fields = FieldSpec(
+  # Pure doesn't specify that this will be in English, so maybe a bad assumption:
+  ('name_en', './name', _text, _required),
+  ('type', "./typeClassification/term/localizedString[@locale='en_US']", _lower_text, _required),
+)
+
+def external_organisation(external_org_elem, cache=None):
+  return _cached(cache, external_org_elem, _external_organisation)
+
+def _external_organisation(external_org_elem, cache):
+  external_org = {'pure_uuid': external_org_elem.attrib['uuid']}
+  _external_organisation_fields.extract(external_org_elem, external_org)
+  external_org.update({
     'pure_internal': 'N',
 
     # Pure doesn't give us these fields for external orgs, so we just set them all to None:
@@ -51,66 +270,72 @@ def external_organisation(external_org_elem):
     'parent_pure_id': None,
     'parent_pure_uuid': None,
     'url': None
-  }
-
-def organisation_association(org_assoc_elem):
-  org_assoc = {}         
-
-  employment_type_elem = org_assoc_elem.find("./employmentType/term/localizedString[@locale='en_US']")
-  org_assoc['employment_type'] = employment_type_elem.text if employment_type_elem is not None else None
-
-  org_assoc['organisation'] = organisation(org_assoc_elem.find('./organisation'))
-
-  start_date_elem = org_assoc_elem.find('./period/startDate')
-  org_assoc['start_date'] = start_date_elem.text if start_date_elem is not None else None
-
-  end_date_elem = org_assoc_elem.find('./period/endDate')
-  org_assoc['end_date'] = end_date_elem.text if end_date_elem is not None else None
-
+  })
+  return external_org
+
+_organisation_association_fields = FieldSpec(
+  ('employment_type', "./employmentType/term/localizedString[@locale='en_US']", _text, None),
+  ('organisation', './organisation', _elem, _required),
+  ('start_date', './period/startDate', _text, None),
+  ('end_date', './period/endDate', _text, None),
   # This element seems to exist only for primary associations.
-  primary_assoc_elem = org_assoc_elem.find('./primaryAssociation')
-  org_assoc['primary_association'] = primary_assoc_elem.text if primary_assoc_elem is not None else 'false'
+  ('primary_association', './primaryAssociation', _text, 'false'),
+)
 
+def organisation_association(org_assoc_elem, cache=None):
+  org_assoc = _organisation_association_fields.extract(org_assoc_elem)
+  org_assoc['organisation'] = organisation(org_assoc['organisation'], cache)
   return org_assoc
 
-def staff_organisation_association(staff_org_assoc_elem):
-  staff_org_assoc = {}         
-
-  employment_type_elem = staff_org_assoc_elem.find("./employmentType/term/localizedString[@locale='en_US']")
-  staff_org_assoc['employment_type'] = employment_type_elem.text if employment_type_elem is not None else None
-
-  staff_org_assoc['organisation'] = organisation(staff_org_assoc_elem.find('./organisation'))
-
-  start_date_elem = staff_org_assoc_elem.find('./period/startDate')
-  staff_org_assoc['start_date'] = start_date_elem.text if start_date_elem is not None else None
-
-  end_date_elem = staff_org_assoc_elem.find('./period/endDate')
-  staff_org_assoc['end_date'] = end_date_elem.text if end_date_elem is not None else None
-
-  # This element seems to exist only for primary associations.
-  primary_assoc_elem = staff_org_assoc_elem.find('./primaryAssociation')
-  staff_org_assoc['primary_association'] = primary_assoc_elem.text if primary_assoc_elem is not None else 'false'
-
-  job_description_elem = staff_org_assoc_elem.find('./jobDescription')
-  staff_org_assoc['job_description'] = job_description_elem.text if job_description_elem is not None else None
+_staff_organisation_association_fields = FieldSpec(
+  *_organisation_association_fields.fields,
+  ('job_description', './jobDescription', _text, None),
+)
 
+def staff_organisation_association(staff_org_assoc_elem, cache=None):
+  staff_org_assoc = _staff_organisation_association_fields.extract(staff_org_assoc_elem)
+  staff_org_assoc['organisation'] = organisation(staff_org_assoc['organisation'], cache)
   return staff_org_assoc
 
+_associated_organisation_fields = FieldSpec(
+  ('external', './external', _text, _required),
+  ('organisation', './organisation', _elem, _required),
+  ('hidden', './hidden', _text, None),
+)
+
 # Don't know why Pure has so many repeated organisation-association elements.
 # This one is a little different than the others, so had to use a different method,
 # with a different name, for it.
-def associated_organisation(assoc_org_elem):
-  assoc_org = {
-    'external': assoc_org_elem.find('./external').text,
-    'organisation': organisation(assoc_org_elem.find('./organisation')),
-  }         
-
-  hidden_elem = assoc_org_elem.find('./hidden')
-  assoc_org['hidden'] = hidden_elem.text if hidden_elem is not None else None
-
-  return assoc_org
-
-def person(person_elem):
+def associated_organisation(assoc_org_elem, cache=None):
+  assoc_org = _associated_organisation_fields.extract(assoc_org_elem)
+  if cache is None:
+    assoc_org['organisation'] = organisation(assoc_org['organisation'])
+    return assoc_org
+  # These elements have no uuid of their own, so we key them by their content:
+  org_elem = assoc_org['organisation']
+  key = ('association', org_elem.tag, org_elem.attrib['uuid'], assoc_org['external'], assoc_org['hidden'])
+  def parse(org_elem):
+    assoc_org['organisation'] = organisation(org_elem, cache)
+    return assoc_org
+  return cache.get(key, parse, org_elem)
+
+_person_fields = FieldSpec(
+  ('first_name', './name/firstName', _text, None),
+  ('last_name', './name/lastName', _text, None),
+  ('emplid', './employeeId', _text, None),
+  # TODO: Will we always have an hindex for internal persons?
+  ('hindex', './hIndex', _attrib('hIndexTotal'), None),
+  ('scopus_id', "./external/secondarySource[@source='Scopus']", _attrib('source_id'), None),
+  ('pure_id', "./external/secondarySource[@source='synchronisedPerson']", _attrib('source_id'), None),
+)
+_link_identifier_path = Path('./linkIdentifiers/linkIdentifier/linkIdentifier')
+_organisation_association_path = Path('./organisationAssociations/organisationAssociation')
+_staff_organisation_association_path = Path('./staffOrganisationAssociations/staffOrganisationAssociation')
+
+def person(person_elem, cache=None):
+  return _cached(cache, person_elem, _person)
+
+def _person(person_elem, cache):
   person = {
     'pure_uuid': person_elem.attrib['uuid'],
 
@@ -125,150 +350,244 @@ def person(person_elem):
     'organisation_associations': [],
     'staff_organisation_associations': [],
   }
+  _person_fields.extract(person_elem, person)
 
-  first_name_elem = person_elem.find('./name/firstName')
-  person['first_name'] = first_name_elem.text if first_name_elem is not None else None
-
-  last_name_elem = person_elem.find('./name/lastName')
-  person['last_name'] = last_name_elem.text if last_name_elem is not None else None
-
-  emplid_elem = person_elem.find('./employeeId')
-  person['emplid'] = emplid_elem.text if emplid_elem is not None else None
-
-  for link_id_elem in person_elem.findall('./linkIdentifiers/linkIdentifier/linkIdentifier'):
-    if re.match('umn:', link_id_elem.text):
+  for link_id_elem in _link_identifier_path.findall(person_elem):
+    if link_id_elem.text.startswith('umn:'):
       # Pure prefixes internet IDs with 'umn:', which we remove:
       person['internet_id'] = link_id_elem.text[4:]
       # Should be only one internet ID:
       break
 
-  # TODO: Will we always have an hindex for internal persons?
-  hindex_elem = person_elem.find('./hIndex')
-  person['hindex'] = hindex_elem.attrib['hIndexTotal'] if hindex_elem is not None else None
-
-  scopus_id_elem = person_elem.find("./external/secondarySource[@source='Scopus']")
-  person['scopus_id'] = scopus_id_elem.attrib['source_id'] if scopus_id_elem is not None else None
-
-  pure_id_elem = person_elem.find("./external/secondarySource[@source='synchronisedPerson']")
-  person['pure_id'] = pure_id_elem.attrib['source_id'] if pure_id_elem is not None else None
+  for org_assoc_elem in _organisation_association_path.findall(person_elem):
+    person['organisation_associations'].append(organisation_association(org_assoc_elem, cache))
 
-  for org_assoc_elem in person_elem.findall('./organisationAssociations/organisationAssociation'): 
-    person['organisation_associations'].append(organisation_association(org_assoc_elem))
-
-  for staff_org_assoc_elem in person_elem.findall('./staffOrganisationAssociations/staffOrganisationAssociation'): 
-    person['staff_organisation_associations'].append(staff_organisation_association(staff_org_assoc_elem))
+  for staff_org_assoc_elem in _staff_organisation_association_path.findall(person_elem):
+    person['staff_organisation_associations'].append(staff_organisation_association(staff_org_assoc_elem, cache))
 
   return person
 
-def person_association(person_assoc_elem):
+_person_association_fields = FieldSpec(
+  ('person_role', './personRole/term/localizedString', _lower_text, _required),
+  ('first_name', './name/firstName', _text, None),
+  ('last_name', './name/lastName', _text, None),
+  ('external_organisation', './externalOrganisation', _text, None),
+  ('internal_person', './person', _elem, None),
+  ('external_person', './externalPerson', _elem, None),
+  ('hidden', './hidden', _text, None),
+)
+_associated_organisation_path = Path('./organisations/association')
+
+def person_association(person_assoc_elem, cache=None):
   person_assoc = {
-    'person_role': person_assoc_elem.find('./personRole/term/localizedString').text.lower(),
     # This will be set by the calling code (e.g. publication()):
     'ordinal': None,
     'organisation_associations': [],
   }
+  _person_association_fields.extract(person_assoc_elem, person_assoc)
 
-  first_name_elem = person_assoc_elem.find('./name/firstName')
-  person_assoc['first_name'] = first_name_elem.text if first_name_elem is not None else None
-
-  last_name_elem = person_assoc_elem.find('./name/lastName')
-  person_assoc['last_name'] = last_name_elem.text if last_name_elem is not None else None
-
-  external_org_elem = person_assoc_elem.find('./externalOrganisation') 
-  person_assoc['external_organisation'] = external_org_elem.text if external_org_elem is not None else None
-
-  internal_person_elem = person_assoc_elem.find('./person')
-  external_person_elem = person_assoc_elem.find('./externalPerson')
+  internal_person_elem = person_assoc.pop('internal_person')
+  external_person_elem = person_assoc.pop('external_person')
   if internal_person_elem is not None:
-    person_assoc['person'] = person(internal_person_elem)
+    person_assoc['person'] = person(internal_person_elem, cache)
   elif external_person_elem is not None:
-    person_assoc['person'] = person(external_person_elem)
+    # Cached external persons are keyed by their own tag, so setting this on a
+    # shared dict is harmless:
+    person_assoc['person'] = person(external_person_elem, cache)
     person_assoc['person']['pure_internal'] = 'N'
   else:
     print('No person found for person_association: ' + str(person_assoc))
-  
-  for assoc_org_elem in person_assoc_elem.findall('./organisations/association'): 
-    person_assoc['organisation_associations'].append(associated_organisation(assoc_org_elem))
 
-  hidden_elem = person_assoc_elem.find('./hidden')
-  person_assoc['hidden'] = hidden_elem.text if hidden_elem is not None else None
+  for assoc_org_elem in _associated_organisation_path.findall(person_assoc_elem):
+    person_assoc['organisation_associations'].append(associated_organisation(assoc_org_elem, cache))
 
   return person_assoc
 
+_publication_fields = FieldSpec(
+  ('title', './title', _text, _required),
+  ('container_title', './journal/title/string', _text, _required),
+  ('scopus_id', "./external/secondarySource[@source='Scopus']", _attrib('source_id'), None),
+  ('pmid', "./external/secondarySource[@source='PubMed']", _attrib('source_id'), None),
+  # Seems there may be more than one of these in the Pure pub_elem, but we just use the
+  # first one for now.
+  ('doi', './dois/doi/doi', _text, None),
+  ('issn', './journal/issn/string', _text, None),
+  ('volume', './volume', _text, None),
+  ('issue', './journalNumber', _text, None),
+  ('pages', './pages', _text, None),
+  # TODO: So far, lots of pub_elems are missing this data. Is it missing from all of them?
+  ('citation_total', './citations/citationTotal', _int_text, None),
+  ('year', './publicationDate/year', _text, _required),
+  ('month', './publicationDate/month', _text, None),
+  ('day', './publicationDate/day', _text, None),
+  ('owner_organisation', './owner', _elem, _required),
+)
+_person_association_path = Path('./persons/personAssociation')
+_external_organisation_path = Path('./associatedExternalOrganisations/externalOrganisation')
+
 # Right now, this handles only ContributionToJournalType records.
-def publication(pub_elem):
-  publication = {  
+def publication(pub_elem, cache=None):
+  publication = {
     'pure_uuid': pub_elem.attrib['uuid'],
     # Hard-coded for now:
     'type': 'article-journal',
-    'title': pub_elem.find('./title').text,
-    'container_title': pub_elem.find('./journal/title/string').text,
     'person_associations': [],
     'organisation_associations': [],
     'associated_external_organisations': [],
   }
+  _publication_fields.extract(pub_elem, publication)
 
-  scopus_id_elem = pub_elem.find("./external/secondarySource[@source='Scopus']")
-  publication['scopus_id'] = scopus_id_elem.attrib['source_id'] if scopus_id_elem is not None else None
-
-  pmid_elem = pub_elem.find("./external/secondarySource[@source='PubMed']")
-  publication['pmid'] = pmid_elem.attrib['source_id'] if pmid_elem is not None else None
-
-  # Seems there may be more than one of these in the Pure pub_elem, but we just use the 
-  # first one for now.
-  doi_elem = pub_elem.find('./dois/doi/doi')
-  publication['doi'] = doi_elem.text if doi_elem is not None else None
-
-  issn_elem = pub_elem.find('./journal/issn/string')
-  publication['issn'] = issn_elem.text if issn_elem is not None else None
-
-  volume_elem = pub_elem.find('./volume')
-  publication['volume'] = volume_elem.text if volume_elem is not None else None
-
-  issue_elem = pub_elem.find('./journalNumber')
-  publication['issue'] = issue_elem.text if issue_elem is not None else None
-
-  pages_elem = pub_elem.find('./pages')
-  publication['pages'] = pages_elem.text if pages_elem is not None else None
-
-  # TODO: So far, lots of pub_elems are missing this data. Is it missing from all of them?
-  citation_total_elem = pub_elem.find('./citations/citationTotal')
-  publication['citation_total'] = int(citation_total_elem.text) if citation_total_elem is not None else None
-
-  year = pub_elem.find('./publicationDate/year').text
+  year = publication.pop('year')
+  month = publication.pop('month')
+  day = publication.pop('day')
   issued_precision = 366
-  month = '01'
-  day = '01'
-  month_elem = pub_elem.find('./publicationDate/month')
-  if (month_elem is not None):
-    month = month_elem.text
+  if month is not None:
     if len(month) == 1:
       month = '0' + month
     issued_precision = 31
-  day_elem = pub_elem.find('./publicationDate/day')
-  if (day_elem is not None):
-    day = day_elem.text
+  else:
+    month = '01'
+  if day is not None:
     if len(day) == 1:
       day = '0' + day
     issued_precision = 1
+  else:
+    day = '01'
   publication['issued'] = {}
   publication['issued']['date_parts'] = [int(year), int(month), int(day)]
   publication['issued']['literal'] = '-'.join([year, month, day])
   publication['issued_precision'] = issued_precision
 
   person_ordinal = 0
-  for person_assoc_elem in pub_elem.findall('./persons/personAssociation'):
-    person_assoc = person_association(person_assoc_elem)
+  for person_assoc_elem in _person_association_path.findall(pub_elem):
+    person_assoc = person_association(person_assoc_elem, cache)
     person_assoc['ordinal'] = person_ordinal
     publication['person_associations'].append(person_assoc)
     person_ordinal = person_ordinal + 1
 
-  for assoc_org_elem in pub_elem.findall('./organisations/association'): 
-    publication['organisation_associations'].append(associated_organisation(assoc_org_elem))
+  for assoc_org_elem in _associated_organisation_path.findall(pub_elem):
+    publication['organisation_associations'].append(associated_organisation(assoc_org_elem, cache))
 
-  for external_org_elem in pub_elem.findall('./associatedExternalOrganisations/externalOrganisation'):
-    publication['associated_external_organisations'].append(external_organisation(external_org_elem))
+  for external_org_elem in _external_organisation_path.findall(pub_elem):
+    publication['associated_external_organisations'].append(external_organisation(external_org_elem, cache))
 
-  publication['owner_organisation'] = organisation(pub_elem.find('./owner'))
+  publication['owner_organisation'] = organisation(publication['owner_organisation'], cache)
 
   return publication
+
+# Parallel alternative to iterrecords(), for exports too large to parse on a
+# single core. Splits the export, at byte boundaries between top-level content
+# elements, into chunks of at least chunk_bytes, then parses each chunk with
+# parse (which must be a module-level function, e.g. publication) in a pool of
+# worker processes. Yields the parsed records in export order, with at most two
+# chunks per process in flight, so memory use stays bounded. If cache_size is
+# given, each worker passes its own EntityCache of that size to parse, so
+# entities are shared within, but not across, chunks.
+#
+# Splitting scans for content tags without parsing, so it assumes that no
+# comments or CDATA sections contain them.
+def parallel_records(source, parse=publication, processes=None, chunk_bytes=4 * 2**20, cache_size=None):
+  processes = processes or os.cpu_count() or 1
+  context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+  with ProcessPoolExecutor(
+    max_workers=processes,
+    mp_context=context,
+    initializer=_init_parallel_worker,
+    initargs=(backend, cache_size),
+  ) as executor:
+    pending = deque()
+    for prefix, chunk, suffix in _chunks(source, chunk_bytes):
+      pending.append(executor.submit(_parse_chunk, prefix + chunk + suffix, parse))
+      if len(pending) >= processes * 2:
+        yield from pending.popleft().result()
+    while pending:
+      yield from pending.popleft().result()
+
+_worker_cache = None
+
+def _init_parallel_worker(backend_name, cache_size):
+  global _worker_cache
+  use_backend(backend_name)
+  _worker_cache = EntityCache(cache_size) if cache_size is not None else None
+
+def _parse_chunk(xml, parse):
+  if _worker_cache is None:
+    return [parse(elem) for elem in records(xml)]
+  return [parse(elem, _worker_cache) for elem in records(xml)]
+
+_content_tag_regex = re.compile(rb'<(/?)content[\s/>]')
+_tag_regex = re.compile(rb'<(/?)([^\s/>!?]+)[^>]*?(/?)>')
+
+# Closing tags for all elements left open at the end of prefix.
+def _closing_tags(prefix):
+  open_tags = []
+  for match in _tag_regex.finditer(prefix):
+    if match.group(1):
+      open_tags.pop()
+    elif not match.group(3):
+      open_tags.append(match.group(2))
+  return b''.join(b'</' + tag + b'>' for tag in reversed(open_tags))
+
+# Yields (prefix, chunk, suffix) tuples, where prefix is everything in the
+# export before the first content element, and suffix closes the elements
+# that prefix opens, so that each prefix + chunk + suffix is a complete export.
+def _chunks(source, chunk_bytes, read_bytes=2**20):
+  f = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+  try:
+    buffer = b''
+    prefix = suffix = None
+    # Position in buffer from which to scan for more content tags:
+    scan_pos = 0
+    # End of the last complete, top-level content element in buffer, which
+    # always starts with the current chunk:
+    chunk_end = 0
+    depth = 0
+    eof = False
+    while True:
+      for match in _content_tag_regex.finditer(buffer, scan_pos):
+        tag_end = buffer.find(b'>', match.start()) + 1
+        if tag_end == 0:
+          # Incomplete tag. Read more, then try again:
+          break
+        scan_pos = tag_end
+        if match.group(1):
+          depth -= 1
+          if depth == 0:
+            chunk_end = tag_end
+            if chunk_end >= chunk_bytes:
+              yield prefix, buffer[:chunk_end], suffix
+              buffer = buffer[chunk_end:]
+              scan_pos -= chunk_end
+              chunk_end = 0
+              break
+        elif buffer[tag_end - 2:tag_end - 1] != b'/':
+          if prefix is None:
+            prefix = buffer[:match.start()]
+            suffix = _closing_tags(prefix)
+            buffer = buffer[match.start():]
+            scan_pos -= match.start()
+            depth = 1
+            break
+          depth += 1
+      else:
+        if eof:
+          break
+        # Partial tags at the end of the buffer may match after the next read:
+        scan_pos = max(scan_pos, len(buffer) - 16)
+        block = f.read(read_bytes)
+        eof = not block
+        buffer += block
+        continue
+      # We broke out of the scan, either to read more or because buffer changed.
+      # Read more only if the scan could not otherwise continue:
+      if tag_end == 0:
+        if eof:
+          break
+        block = f.read(read_bytes)
+        eof = not block
+        buffer += block
+    if prefix is not None and chunk_end > 0:
+      yield prefix, buffer[:chunk_end], suffix
+  finally:
+    if f is not source:
+      f.close()
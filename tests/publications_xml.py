@@ -0,0 +1,87 @@
+'''Synthetic legacy Pure XML exports of publications, for testing
+pureapi.xmlparser. Internal persons and organisations repeat across
+publications, as they do in real exports.'''
+
+def organisation(i):
+    return f'''<organisation uuid="org-{i}">
+  <typeClassification><term><localizedString locale="en_US">Department</localizedString></term></typeClassification>
+  <external><secondarySource source="synchronisedOrganisation" source_id="ORG{i}"/></external>
+  <name><localizedString locale="en_US">Department {i}</localizedString></name>
+  <nameVariant><classificationDefinedFieldExtension><value><localizedString locale="en_US">Dept {i}</localizedString></value></classificationDefinedFieldExtension></nameVariant>
+  <webAddresses><classificationDefinedFieldExtension><value><localizedString locale="en_US">https://example.com/org-{i}</localizedString></value></classificationDefinedFieldExtension></webAddresses>
+  <organisations><organisation uuid="org-college"><external><secondarySource source="synchronisedOrganisation" source_id="COLLEGE"/></external></organisation></organisations>
+</organisation>'''
+
+def internal_person(i):
+    return f'''<person uuid="person-{i}">
+  <name><firstName>First{i}</firstName><lastName>Last{i}</lastName></name>
+  <employeeId>{1000 + i}</employeeId>
+  <linkIdentifiers><linkIdentifier><linkIdentifier>orcid:0000-{i}</linkIdentifier></linkIdentifier><linkIdentifier><linkIdentifier>umn:user{i}</linkIdentifier></linkIdentifier></linkIdentifiers>
+  <hIndex hIndexTotal="{i % 50}"/>
+  <external><secondarySource source="Scopus" source_id="SCOPUS{i}"/><secondarySource source="synchronisedPerson" source_id="PERSON{i}"/></external>
+  <organisationAssociations><organisationAssociation>
+    <employmentType><term><localizedString locale="en_US">Faculty</localizedString></term></employmentType>
+    {organisation(i % 7)}
+    <period><startDate>2001-01-01</startDate></period>
+    <primaryAssociation>true</primaryAssociation>
+  </organisationAssociation></organisationAssociations>
+  <staffOrganisationAssociations><staffOrganisationAssociation>
+    <employmentType><term><localizedString locale="en_US">Faculty</localizedString></term></employmentType>
+    {organisation(i % 7)}
+    <period><startDate>2001-01-01</startDate><endDate>2020-12-31</endDate></period>
+    <jobDescription>Professor</jobDescription>
+  </staffOrganisationAssociation></staffOrganisationAssociations>
+</person>'''
+
+def person_association(i, internal):
+    if internal:
+        person = internal_person(i)
+    else:
+        person = f'<externalPerson uuid="external-person-{i}"><name><firstName>Ext{i}</firstName><lastName>Person{i}</lastName></name></externalPerson>'
+    return f'''<personAssociation>
+  <personRole><term><localizedString locale="en_US">Author</localizedString></term></personRole>
+  <name><firstName>First{i}</firstName><lastName>Last{i}</lastName></name>
+  {person}
+  <organisations><association><external>false</external>{organisation(i % 7)}<hidden>false</hidden></association></organisations>
+  <hidden>false</hidden>
+</personAssociation>'''
+
+def publication(i, persons_per_publication=4):
+    persons = ''.join(
+        person_association((i + j) % 25, internal=(j % 2 == 0))
+        for j in range(persons_per_publication)
+    )
+    month = f'<month>{i % 12 + 1}</month>' if i % 3 else ''
+    day = f'<day>{i % 28 + 1}</day>' if i % 3 == 1 else ''
+    return f'''<content uuid="pub-{i}">
+  <title>Publication {i}</title>
+  <journal><title><string>Journal {i % 5}</string></title><issn><string>1234-{i % 5:04d}</string></issn></journal>
+  <external><secondarySource source="Scopus" source_id="SCOPUSPUB{i}"/><secondarySource source="PubMed" source_id="{i}"/></external>
+  <dois><doi><doi>10.1000/{i}</doi></doi></dois>
+  <volume>{i % 30}</volume>
+  <journalNumber>{i % 4}</journalNumber>
+  <pages>{i}-{i + 10}</pages>
+  <citations><citationTotal>{i % 100}</citationTotal></citations>
+  <publicationDate><year>{2000 + i % 20}</year>{month}{day}</publicationDate>
+  <persons>{persons}</persons>
+  <organisations><association><external>false</external>{organisation(i % 7)}<hidden>false</hidden></association></organisations>
+  <associatedExternalOrganisations><externalOrganisation uuid="external-org-{i % 3}"><name>External {i % 3}</name><typeClassification><term><localizedString locale="en_US">Company</localizedString></term></typeClassification></externalOrganisation></associatedExternalOrganisations>
+  <owner uuid="org-{i % 7}">
+    <typeClassification><term><localizedString locale="en_US">Department</localizedString></term></typeClassification>
+    <name><localizedString locale="en_US">Department {i % 7}</localizedString></name>
+  </owner>
+</content>'''
+
+def publications_xml(count, persons_per_publication=4):
+    '''Returns a complete export of ``count`` publications, as bytes.'''
+    contents = ''.join(publication(i, persons_per_publication) for i in range(count))
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<GetPublicationResponse><count>{count}</count><result>{contents}</result></GetPublicationResponse>'.encode('utf-8')
+
+def write_publications_xml(path, count, persons_per_publication=4):
+    '''Writes an export of ``count`` publications to ``path``, one publication
+    at a time, so that arbitrarily large exports fit in memory.'''
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<GetPublicationResponse><count>{count}</count><result>')
+        for i in range(count):
+            f.write(publication(i, persons_per_publication))
+        f.write('</result></GetPublicationResponse>')
@@ -0,0 +1,106 @@
+import time
+
+from addict import Dict
+
+from pureapi import cache, client
+
+from benchmarks.stub_server import StubServer, record_uuid
+
+def test_record_cache():
+    with StubServer(counts={'persons': 50}, changes_count=20, changes_page_size=10) as server:
+        records = cache.RecordCache(config=server.config())
+        uuids = [record_uuid('persons', index) for index in range(30)]
+        assert [r.uuid for r in records.filter_all_by_uuid_transformed('persons', uuids=uuids)] == uuids
+        assert server.request_count == 1
+        # Served locally, in the order requested:
+        persons = list(records.filter_all_by_uuid_transformed('persons', uuids=list(reversed(uuids))))
+        assert [r.uuid for r in persons] == list(reversed(uuids))
+        assert all(isinstance(r, Dict) for r in persons)
+        assert server.request_count == 1
+        assert (records.hits, records.misses) == (30, 30)
+
+        # The first 20 persons change, and every tenth change is a DELETE:
+        invalidator = cache.ChangesInvalidator(records, start='2020-01-01')
+        assert invalidator.poll() == 20
+        assert invalidator.resumption_token == '20'
+        assert len(records) == 10
+        list(records.filter_all_by_uuid_transformed('persons', uuids=uuids))
+        assert server.request_count == 1 + 2 + 1
+
+        # Refreshing requests changed records again, and evicts deleted ones:
+        refreshing = cache.ChangesInvalidator(records, start='2020-01-01', refresh=True)
+        requests = server.request_count
+        assert refreshing.poll() == 20
+        # Two pages of changes, and one request for the changed records in each:
+        assert server.request_count == requests + 2 + 2
+        assert len(records) == 28
+        assert ('persons', uuids[9]) not in records
+        assert ('persons', uuids[8]) in records
+
+def test_changes_during_request(monkeypatch):
+    with StubServer(counts={'persons': 50}, changes_count=10, changes_page_size=10) as server:
+        records = cache.RecordCache(config=server.config())
+        invalidator = cache.ChangesInvalidator(records, start='2020-01-01')
+        uuids = [record_uuid('persons', index) for index in range(10)]
+        filter_all_by_uuid_transformed = client.filter_all_by_uuid_transformed
+
+        def changed_during_request(*args, **kwargs):
+            # Changes to all 10 records arrive after the request, but before
+            # the records are cached:
+            responses = list(filter_all_by_uuid_transformed(*args, **kwargs))
+            assert invalidator.poll() == 10
+            yield from responses
+
+        monkeypatch.setattr(client, 'filter_all_by_uuid_transformed', changed_during_request)
+        assert [r.uuid for r in records.filter_all_by_uuid_transformed('persons', uuids=uuids)] == uuids
+        # The possibly stale records were not cached:
+        assert len(records) == 0
+        assert not records.tracks('persons', uuids[0])
+
+        # Records requested after the changes are cached:
+        monkeypatch.setattr(client, 'filter_all_by_uuid_transformed', filter_all_by_uuid_transformed)
+        list(records.filter_all_by_uuid_transformed('persons', uuids=uuids))
+        assert len(records) == 10
+        assert records.tracks('persons', uuids[0])
+
+def test_record_cache_ttl_and_spill(tmp_path):
+    with StubServer(counts={'persons': 50}) as server:
+        records = cache.RecordCache(maxsize=5, spill_path=str(tmp_path / 'spill'), config=server.config())
+        uuids = [record_uuid('persons', index) for index in range(10)]
+        list(records.filter_all_by_uuid_transformed('persons', uuids=uuids))
+        assert len(records) == 5
+        # Evicted records are read back from the spill file:
+        assert list(records.filter_all_by_uuid_transformed('persons', uuids=uuids[:5]))[0].uuid == uuids[0]
+        assert server.request_count == 1
+        assert records.get('persons', uuids[0]).name.firstName is not None
+        assert records.invalidate('persons', uuids[1])
+        assert ('persons', uuids[1]) not in records
+        records.close()
+
+        expiring = cache.RecordCache(ttl=0.1, config=server.config())
+        list(expiring.filter_all_by_uuid_transformed('persons', uuids=uuids))
+        assert expiring.get('persons', uuids[0]) is not None
+        time.sleep(0.15)
+        assert expiring.get('persons', uuids[0]) is None
+
+def test_changes_invalidator_thread():
+    with StubServer(counts={'persons': 50}, changes_count=20, changes_page_size=10) as server:
+        records = cache.RecordCache(config=server.config())
+        records.put('persons', record_uuid('persons', 3), Dict(uuid=record_uuid('persons', 3)))
+        with cache.ChangesInvalidator(records, start='2020-01-01', poll_interval=0.01) as invalidator:
+            deadline = time.monotonic() + 5
+            while invalidator.invalidated == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert invalidator.invalidated == 1
+        assert len(records) == 0
+
+def test_changes_invalidator_trailing_empty_pages():
+    with StubServer(counts={'persons': 50}, changes_count=20, changes_page_size=10, zero_count_every=1) as server:
+        records = cache.RecordCache(config=server.config())
+        invalidator = cache.ChangesInvalidator(records, start='2020-01-01')
+        invalidator.poll()
+        assert server.request_count == 2
+        # The token from the trailing page without changes:
+        assert invalidator.resumption_token == '20'
+        invalidator.poll()
+        assert server.request_count == 3
@@ -5,10 +5,12 @@ from datetime import date, timedelta
 import importlib
 import json
 import os
+import weakref
 
 from addict import Dict
 import json
 import pytest
+import requests
 from requests.exceptions import HTTPError
 
 from pureapi import client, common
@@ -38,6 +40,8 @@ def test_config():
         client.Config(domain=test_domain, key=test_key, headers='bogus')
     with pytest.raises(TypeError, match='callable'):
         client.Config(domain=test_domain, key=test_key, retryer='bogus')
+    with pytest.raises(TypeError, match='transport'):
+        client.Config(domain=test_domain, key=test_key, transport=requests.Session())
 
     config = client.Config(domain=test_domain, key=test_key)
     assert config.headers['api-key'] == test_key
@@ -83,7 +87,7 @@ def test_preconfig():
        assert function.keywords['config'] is config
 
 def test_get_collection_from_resource_path():
-    for resource_path in ('persons', 'persons/12345'):
+    for resource_path in ('persons', 'persons/12345', 'persons-meta/orderings'):
         collection = client._get_collection_from_resource_path(
             resource_path,
             version=common.latest_version
@@ -92,6 +96,8 @@ def test_get_collection_from_resource_path():
 
     with pytest.raises(common.PureAPIInvalidCollectionError):
         client._get_collection_from_resource_path('bogus', version=common.latest_version)
+    with pytest.raises(common.PureAPIInvalidCollectionError):
+        client._get_collection_from_resource_path('bogus-meta/orderings', version=common.latest_version)
 
 @pytest.mark.integration
 def test_get(version):
@@ -585,3 +591,122 @@ def test_filter_exception(version):
         }
         r = client.filter('persons', payload=payload, config=config)
     assert exc_info.errisinstance(HTTPError)
+
+def test_transform_with_validator():
+    seen = []
+    def validator(collection, record, *, version):
+        seen.append((collection, record['uuid'], version))
+
+    config = client.Config(validator=validator)
+    record = client._transform('persons', {'uuid': '123'}, config)
+    assert isinstance(record, Dict)
+    assert record.uuid == '123'
+    assert seen == [('persons', '123', config.version)]
+
+    with pytest.raises(TypeError, match='callable'):
+        client.Config(validator='bogus')
+
+class MockPageResponse:
+    def __init__(self, count, items=None):
+        self.count = count
+        self.items = items
+
+    def json(self):
+        d = {'count': self.count}
+        if self.items is not None:
+            d['items'] = self.items
+        return d
+
+def mock_pages(record_count):
+    uuids = [f'uuid-{i}' for i in range(record_count)]
+    def mock_get(resource_path, params=None, config=None):
+        offset, size = params['offset'], params['size']
+        if size == 0:
+            return MockPageResponse(record_count)
+        return MockPageResponse(record_count, [{'uuid': uuid} for uuid in uuids[offset:offset+size]])
+    return uuids, mock_get
+
+class ListSink:
+    def __init__(self):
+        self.items = []
+        self.closed = False
+
+    def write(self, collection, items):
+        self.items.extend(items)
+
+    def close(self):
+        self.closed = True
+
+def test_export(monkeypatch):
+    uuids, mock_get = mock_pages(25)
+    monkeypatch.setattr(client, 'get', mock_get)
+
+    sink = ListSink()
+    assert client.export('persons', sink=sink, params={'size': 10}) == 25
+    assert [item['uuid'] for item in sink.items] == uuids
+    assert sink.closed
+
+    sink = ListSink()
+    client.export('persons', sink=sink, params={'size': 10}, transformed=True)
+    assert all(isinstance(item, Dict) for item in sink.items)
+
+def test_export_sink_failure(monkeypatch):
+    uuids, mock_get = mock_pages(25)
+    monkeypatch.setattr(client, 'get', mock_get)
+
+    class FailingSink(ListSink):
+        def write(self, collection, items):
+            raise OSError('disk full')
+
+    sink = FailingSink()
+    with pytest.raises(client.PureAPIClientException, match='sink') as exc_info:
+        client.export('persons', sink=sink, params={'size': 10})
+    assert isinstance(exc_info.value.__cause__, OSError)
+    assert sink.closed
+
+@pytest.mark.parametrize('max_resident_pages', [1, 2, 3])
+def test_bounded_memory(monkeypatch, max_resident_pages):
+    uuids, mock_get = mock_pages(95)
+    received = []
+    live_responses = weakref.WeakSet()
+    def bounded_get(resource_path, params=None, config=None):
+        r = mock_get(resource_path, params, config)
+        if params['size']:
+            # A page must not be requested until the caller has received all
+            # records in all but max_resident_pages - 1 of the earlier pages:
+            page = params['offset'] // params['size']
+            assert len(received) >= (page - max_resident_pages + 1) * params['size']
+            live_responses.add(r)
+        return r
+    monkeypatch.setattr(client, 'get', bounded_get)
+
+    config = client.Config(max_resident_pages=max_resident_pages)
+    for record in client.get_all_transformed('persons', {'size': 10}, config=config):
+        assert isinstance(record, Dict)
+        # Response objects are released as soon as they are decoded:
+        assert len(live_responses) <= max_resident_pages - 1
+        received.append(record.uuid)
+    assert received == uuids
+
+    # Stopping early stops the prefetcher:
+    records = client.get_all_transformed('persons', {'size': 10}, config=config)
+    assert next(records).uuid == uuids[0]
+    records.close()
+
+    with pytest.raises(ValueError):
+        client.Config(max_resident_pages=0)
+
+def test_bounded_memory_errors(monkeypatch):
+    uuids, mock_get = mock_pages(50)
+    def failing_get(resource_path, params=None, config=None):
+        if params['offset'] >= 20:
+            raise client.PureAPIRequestException('connection reset')
+        return mock_get(resource_path, params, config)
+    monkeypatch.setattr(client, 'get', failing_get)
+
+    config = client.Config(max_resident_pages=2)
+    received = []
+    with pytest.raises(client.PureAPIRequestException):
+        for record in client.get_all_transformed('persons', {'size': 10}, config=config):
+            received.append(record.uuid)
+    assert received == uuids[:20]
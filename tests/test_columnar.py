@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from pureapi import columnar
+from pureapi.common import PureAPIInvalidCollectionError
+
+def load_research_output(version):
+    with open(f'tests/data/{version}/research_output/f145e583-7d49-415e-aefb-381905b58ae7.json') as f:
+        return json.load(f)
+
+class MockResponse:
+    def __init__(self, items):
+        self.items = items
+
+    def json(self):
+        return {'count': len(self.items), 'items': self.items}
+
+def test_columns_for(version):
+    columns = {column.name: column for column in columnar.columns_for('research-outputs', version=version)}
+    assert columns['uuid'].type_name == 'string'
+    assert columns['title.value'].path == ('title', 'value')
+    assert 'title.value' not in {column.name for column in columnar.columns_for('research-outputs', version=version, depth=1)}
+
+    child_tables = columnar.child_tables_for('research-outputs', version=version)
+    assert 'personAssociations' in child_tables
+    assert 'electronicVersions' in child_tables
+
+    with pytest.raises(PureAPIInvalidCollectionError):
+        columnar.columns_for('bogus', version=version)
+
+def test_converter(version):
+    record = load_research_output(version)
+    converter = columnar.ColumnarConverter(
+        'research-outputs',
+        version=version,
+        children=['personAssociations', 'electronicVersions']
+    )
+    batches = converter.convert([record, {'uuid': 'empty', 'title': 'wrong type'}])
+    assert set(batches) == {
+        'research-outputs',
+        'research-outputs.personAssociations',
+        'research-outputs.electronicVersions',
+    }
+
+    ros = batches['research-outputs']
+    assert ros.num_rows == 2
+    assert ros.data['uuid'] == [record['uuid'], 'empty']
+    assert ros.data['title.value'] == [record['title']['value'], None]
+
+    persons = batches['research-outputs.personAssociations']
+    assert persons.num_rows == len(record['personAssociations'])
+    assert set(persons.data['parent_uuid']) == {record['uuid']}
+    assert persons.data['ordinal'] == list(range(len(record['personAssociations'])))
+    assert persons.data['name.lastName'][0] == record['personAssociations'][0]['name']['lastName']
+
+    with pytest.raises(columnar.PureAPIColumnarException):
+        columnar.ColumnarConverter('research-outputs', version=version, children=['title'])
+
+def test_write(version, tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    record = load_research_output(version)
+    responses = [MockResponse([record]), MockResponse([record, {'uuid': 'empty'}])]
+    paths = columnar.write(
+        columnar.batches(responses, 'research-outputs', version=version, children=['personAssociations']),
+        tmp_path
+    )
+    table = pyarrow.parquet.read_table(paths['research-outputs'])
+    assert table.num_rows == 3
+    assert table.column('uuid').to_pylist() == [record['uuid'], record['uuid'], 'empty']
+    child_table = pyarrow.parquet.read_table(paths['research-outputs.personAssociations'])
+    assert child_table.num_rows == 2 * len(record['personAssociations'])
+
+def test_to_numpy(version):
+    pytest.importorskip('numpy')
+    record = load_research_output(version)
+    batch = columnar.ColumnarConverter('research-outputs', version=version, children=[]).convert([record])['research-outputs']
+    array = batch.to_numpy()
+    assert array['uuid'][0] == record['uuid']
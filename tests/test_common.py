@@ -64,3 +64,16 @@ def test_collections_for_all_versions():
         assert not common.valid_collection(collection='bogus', version=version)
         with pytest.raises(common.PureAPIInvalidVersionError):
             collections = common.collections_for(version='bogus')
+
+def test_item_definition_for(version):
+    assert common.item_definition_for(collection='research-outputs', version=version) == 'WSResearchOutput'
+    assert common.item_definition_for(collection='changes', version=version) is not None
+    with pytest.raises(common.PureAPIInvalidCollectionError):
+        common.item_definition_for(collection='bogus', version=version)
+
+def test_properties_for(version):
+    properties = common.properties_for(definition='WSResearchOutput', version=version)
+    assert 'uuid' in properties
+    # Defined only by sub-types, like WSContributionToJournal:
+    assert 'journalAssociation' in properties or 'volume' in properties
+    assert common.properties_for(definition='bogus', version=version) == {}
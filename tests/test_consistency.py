@@ -0,0 +1,162 @@
+import pytest
+
+from pureapi import client, consistency
+
+from benchmarks.stub_server import StubServer, record_uuid
+
+class EditedCollection:
+    '''Serves pages of a collection from a list of uuids, which tests edit
+    between page requests, as other users would edit records in Pure during a
+    long harvest.'''
+
+    def __init__(self, server, collection, count):
+        self.server = server
+        self.collection = collection
+        self.uuids = [record_uuid(collection, index) for index in range(count)]
+        self.created = count
+        self.pages = 0
+        self.edits = {}
+        '''Functions to call after a number of pages with items, by number.'''
+        server.page = self.page
+
+    def create(self, position=None):
+        uuid = record_uuid(self.collection, self.created)
+        self.created += 1
+        self.uuids.insert(len(self.uuids) if position is None else position, uuid)
+        return uuid
+
+    def page(self, collection, offset, size):
+        if size > 0:
+            self.pages += 1
+        uuids = self.uuids[offset:offset + size]
+        items = ','.join(self.server.record_json(collection, index, uuid) for index, uuid in enumerate(uuids))
+        page = f'{{"count": {len(self.uuids)}, "pageInformation": {{"offset": {offset}, "size": {size}}}, "items": [{items}]}}'
+        if self.pages in self.edits:
+            self.edits.pop(self.pages)()
+        return page
+
+def harvest(function, *args, **kwargs):
+    report = consistency.ConsistencyReport()
+    uuids = [record['uuid'] for record in function(*args, report=report, **kwargs)]
+    assert len(uuids) == len(set(uuids))
+    assert report.records == len(uuids)
+    return uuids, report
+
+def test_no_edits():
+    with StubServer(counts={'persons': 45}) as server:
+        uuids, report = harvest(consistency.get_all, 'persons', {'size': 10}, config=server.config())
+        assert uuids == [record_uuid('persons', index) for index in range(45)]
+        assert report == consistency.ConsistencyReport(
+            ordering=None,
+            initial_count=45,
+            final_count=45,
+            records=45,
+            duplicates=0,
+            requests=5,
+            passes=1,
+            drift=False
+        )
+
+        # Sizes that are not positive fall back to the default:
+        uuids, report = harvest(consistency.get_all, 'persons', {'size': 0}, config=server.config())
+        assert len(uuids) == 45
+        assert report.requests == 1
+        uuids, report = harvest(consistency.filter_all, 'persons', {'size': -1}, config=server.config())
+        assert len(uuids) == 45
+
+        persons = list(consistency.filter_all_transformed('persons', {'size': 20}, config=server.config()))
+        assert persons == list(client.get_all_transformed('persons', {'size': 10}, config=server.config()))
+
+def test_deletion():
+    with StubServer(counts={'persons': 45}) as server:
+        persons = EditedCollection(server, 'persons', 45)
+        deleted = persons.uuids[3]
+        persons.edits[2] = lambda: persons.uuids.remove(deleted)
+
+        # Without consistency mode, the record that moves into an earlier window is missed:
+        missed = [person.uuid for person in client.get_all_transformed('persons', {'size': 10}, config=server.config())]
+        assert record_uuid('persons', 20) not in missed
+
+        persons = EditedCollection(server, 'persons', 45)
+        persons.edits[2] = lambda: persons.uuids.remove(deleted)
+        uuids, report = harvest(consistency.get_all, 'persons', {'size': 10}, config=server.config())
+        assert set(persons.uuids) <= set(uuids)
+        assert record_uuid('persons', 20) in uuids
+        assert deleted in uuids
+        assert report.initial_count == 45
+        assert report.final_count == 44
+        assert report.passes == 2
+        assert not report.drift
+
+def test_insertion():
+    with StubServer(counts={'persons': 45}) as server:
+        persons = EditedCollection(server, 'persons', 45)
+        persons.edits[1] = lambda: persons.create(position=0)
+        persons.edits[3] = lambda: [persons.create(position=5) for _ in range(12)]
+        uuids, report = harvest(consistency.filter_all, 'persons', {'size': 10}, config=server.config())
+        assert sorted(uuids) == sorted(persons.uuids)
+        assert report.final_count == 58
+        assert report.duplicates > 0
+        assert not report.drift
+
+def test_stable_ordering():
+    with StubServer(counts={'persons': 45}, orderings={'persons': ['lastName', 'created', 'modified']}) as server:
+        config = server.config()
+        assert consistency.orderings('persons', config=config) == ['lastName', 'created', 'modified']
+        assert consistency.orderings('persons/some-uuid', config=config) == ['lastName', 'created', 'modified']
+        assert consistency.orderings('research-outputs', config=config) == []
+        assert consistency.stable_ordering('persons', config=config) == 'created'
+        assert consistency.stable_ordering('persons', preferred=('rating',), config=config) is None
+
+        # Records created during a harvest in ``created`` order come last:
+        persons = EditedCollection(server, 'persons', 45)
+        persons.edits[2] = lambda: [persons.create() for _ in range(3)]
+        uuids, report = harvest(consistency.get_all, 'persons', {'size': 10}, config=config)
+        assert uuids == persons.uuids
+        assert report.ordering == 'created'
+        assert report.duplicates == 0
+        assert report.passes == 2
+        assert not report.drift
+
+        _, report = harvest(consistency.get_all, 'persons', {'size': 10, 'order': 'lastName'}, config=config)
+        assert report.ordering == 'lastName'
+        _, report = harvest(consistency.filter_all, 'persons', {'size': 10}, ordering=None, config=config)
+        assert report.ordering is None
+        _, report = harvest(consistency.filter_all, 'persons', {'size': 10, 'orderings': ['modified']}, config=config)
+        assert report.ordering == 'modified'
+
+    with StubServer(counts={'persons': 5}) as server:
+        assert consistency.orderings('persons', config=server.config()) == []
+
+def test_strict():
+    with StubServer(counts={'persons': 25}) as server:
+        persons = EditedCollection(server, 'persons', 25)
+        for page in range(1, 100):
+            persons.edits[page] = persons.create
+        uuids, report = harvest(consistency.get_all, 'persons', {'size': 10}, max_passes=2, config=server.config())
+        assert report.passes == 2
+        assert report.drift
+
+        with pytest.raises(consistency.PureAPIConsistencyException) as excinfo:
+            list(consistency.get_all('persons', {'size': 10}, max_passes=2, strict=True, config=server.config()))
+        assert excinfo.value.report.drift
+
+def test_seen_set():
+    seen = consistency._SeenSet()
+    assert seen.add(record_uuid('persons', 0))
+    assert not seen.add(record_uuid('persons', 0))
+    assert seen.add('not-a-uuid')
+    assert seen.add('x' * 36)
+    assert 'not-a-uuid' in seen
+    assert record_uuid('persons', 1) not in seen
+    assert len(seen) == 3
+
+def test_explicit_config(monkeypatch):
+    # The default config would require these:
+    monkeypatch.delenv(client.env_domain_varname, raising=False)
+    monkeypatch.delenv(client.env_key_varname, raising=False)
+    with StubServer(counts={'persons': 15}) as server:
+        config = server.config()
+        expected = [record_uuid('persons', index) for index in range(15)]
+        assert [p.uuid for p in consistency.get_all_transformed('persons', {'size': 10}, config=config)] == expected
+        assert [p.uuid for p in consistency.filter_all_transformed('persons', {'size': 10}, config=config)] == expected
@@ -0,0 +1,85 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from addict import Dict
+import pytest
+
+from pureapi import dataloader
+
+from benchmarks.stub_server import StubServer, record_uuid
+
+def test_dataloader():
+    with StubServer(counts={'persons': 100, 'organisational-units': 10}) as server:
+        uuids = [record_uuid('persons', index) for index in range(25)]
+        with dataloader.DataLoader(max_batch_size=10, wait=0.05, config=server.config()) as loader:
+            futures = loader.load_many('persons', uuids)
+            assert [future.result().uuid for future in futures] == uuids
+            assert all(isinstance(future.result(), Dict) for future in futures)
+            # 25 uuids, in batches of at most 10:
+            assert loader.batch_count == 3
+            assert server.request_count == 3
+
+            # Lookups from many threads at once share requests:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                persons = list(executor.map(lambda uuid: loader.get('persons', uuid), uuids + uuids[:5]))
+            assert [person.uuid for person in persons] == uuids + uuids[:5]
+            assert server.request_count <= 3 + 10
+
+            org = loader.load('organisational-units', record_uuid('organisational-units', 1))
+            assert org.result().uuid == record_uuid('organisational-units', 1)
+            assert loader.missing == set()
+
+def test_dataloader_asyncio():
+    with StubServer(counts={'persons': 100}) as server:
+        uuids = [record_uuid('persons', index) for index in range(30)]
+        async def load_all(loader):
+            return await asyncio.gather(*(loader.aload('persons', uuid) for uuid in uuids))
+        with dataloader.DataLoader(transformed=False, config=server.config()) as loader:
+            persons = asyncio.run(load_all(loader))
+            assert [person['uuid'] for person in persons] == uuids
+            assert server.request_count == 1
+
+def test_dataloader_missing():
+    with StubServer(counts={'persons': 100}) as server:
+        uuid_page = server.uuid_page
+        server.uuid_page = lambda collection, uuids: uuid_page(collection, [uuid for uuid in uuids if uuid != 'deleted'])
+        with dataloader.DataLoader(config=server.config()) as loader:
+            found, missing = loader.load_many('persons', [record_uuid('persons', 0), 'deleted'])
+            assert found.result().uuid == record_uuid('persons', 0)
+            assert missing.result() is None
+            assert loader.missing == {('persons', 'deleted')}
+
+        with dataloader.DataLoader(raise_missing=True, config=server.config()) as loader:
+            with pytest.raises(dataloader.PureAPIRecordNotFoundError) as exc_info:
+                loader.get('persons', 'deleted')
+            assert (exc_info.value.collection, exc_info.value.uuid) == ('persons', 'deleted')
+
+        # Failed requests fail every future in the batch:
+        with dataloader.DataLoader(config=server.config(domain='127.0.0.1:1', retryer=lambda f, *a, **k: f(*a, **k))) as loader:
+            futures = loader.load_many('persons', ['a', 'b'])
+            for future in futures:
+                with pytest.raises(Exception):
+                    future.result()
+
+def test_dataloader_cancelled():
+    with StubServer(counts={'persons': 100}) as server:
+        uuids = [record_uuid('persons', index) for index in range(3)]
+        async def load_with_cancelled(loader):
+            cancelled = asyncio.ensure_future(loader.aload('persons', uuids[0]))
+            others = [asyncio.ensure_future(loader.aload('persons', uuid)) for uuid in uuids]
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            persons = await asyncio.wait_for(asyncio.gather(*others), timeout=5)
+            return cancelled, persons
+        with dataloader.DataLoader(wait=0.1, config=server.config()) as loader:
+            cancelled, persons = asyncio.run(load_with_cancelled(loader))
+            # Cancelling one lookup of a uuid cancels no other lookups of it:
+            assert cancelled.cancelled()
+            assert [person.uuid for person in persons] == uuids
+            assert server.request_count == 1
+
+            # Lookups cancelled before the batch is requested are not requested:
+            futures = loader.load_many('persons', uuids)
+            assert all(future.cancel() for future in futures)
+            loader.get('persons', uuids[0])
+            assert server.request_count == 2
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from pureapi import client, fanout, transport
+
+from benchmarks.stub_server import StubServer, record_uuid
+
+def test_fan_out():
+    with StubServer(counts={'persons': 100}, latency=0.05) as a, StubServer(counts={'persons': 60}, latency=0.05) as b:
+        configs = {'a': a.config(), 'b': b.config(), 'b2': b.config(key='another')}
+        start = time.perf_counter()
+        results = list(fanout.get_all(configs, 'persons', {'size': 20}))
+        seconds = time.perf_counter() - start
+        assert {
+            tag: [record['uuid'] for result in results if result.tag == tag for record in result.value.json()['items']]
+            for tag in configs
+        } == {
+            'a': [record_uuid('persons', index) for index in range(100)],
+            'b': [record_uuid('persons', index) for index in range(60)],
+            'b2': [record_uuid('persons', index) for index in range(60)],
+        }
+        # 14 requests in total, including count requests, but no more than 6
+        # for any config, each taking at least 0.05 seconds:
+        assert seconds < 14 * 0.05
+
+        records = list(fanout.get_all_transformed({'a': a.config(), 'b': b.config()}, 'persons', {'size': 50}))
+        assert sorted(result.value.uuid for result in records if result.tag == 'b') == sorted(
+            record_uuid('persons', index) for index in range(60)
+        )
+
+        responses = list(fanout.get_all_changes({'a': a.config()}, '2020-01-01'))
+        assert all(result.tag == 'a' for result in responses)
+        assert sum(r.value.json()['count'] for r in responses) == a.changes_count
+
+def test_fan_out_errors():
+    with StubServer(counts={'persons': 30}) as server:
+        configs = {'good': server.config(), 'bad': server.config(key='bad')}
+        def workload(config):
+            if config.key == 'bad':
+                raise ValueError('bad config')
+            return client.get_all('persons', {'size': 10}, config=config)
+
+        with pytest.raises(fanout.PureAPIFanOutException) as exc_info:
+            list(fanout.fan_out(configs, workload))
+        assert isinstance(exc_info.value.__cause__, ValueError)
+
+        results = list(fanout.fan_out(configs, workload, return_exceptions=True))
+        assert [result.tag for result in results if result.error is not None] == ['bad']
+        assert len([result for result in results if result.tag == 'good']) == 3
+
+def test_server_limits():
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+    class SlowTransport(transport.RequestsTransport):
+        def send(self, request, *, timeout=None):
+            nonlocal in_flight, max_in_flight
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            time.sleep(0.02)
+            with lock:
+                in_flight -= 1
+            return super().send(request, timeout=timeout)
+
+    with StubServer(counts={'persons': 50}) as server:
+        configs = {key: server.config(key=key, transport=SlowTransport()) for key in ('a', 'b', 'c')}
+        results = list(fanout.get_all(configs, 'persons', {'size': 10}, server_limits={fanout.server(configs['a']): 2}))
+        assert len(results) == 15
+        assert max_in_flight == 2
@@ -0,0 +1,171 @@
+import json
+
+import pytest
+
+from pureapi import client, hierarchy
+from pureapi.hierarchy import OrganisationHierarchy
+
+class MockResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return json.loads(json.dumps(self.body))
+
+class MockPure:
+    '''A minimal, in-memory stand-in for the Pure API.'''
+    def __init__(self, orgs):
+        self.orgs = {org['uuid']: org for org in orgs}
+        self.changes = {}
+
+    def get(self, resource_path, params=None, config=None):
+        if resource_path.startswith('changes/'):
+            return MockResponse(self.changes[resource_path.split('/')[1]])
+        orgs = list(self.orgs.values())
+        if params['size'] == 0:
+            return MockResponse({'count': len(orgs)})
+        return MockResponse({
+            'count': len(orgs),
+            'items': orgs[params['offset']:params['offset'] + params['size']],
+        })
+
+    def filter(self, resource_path, payload=None, config=None):
+        items = [self.orgs[uuid] for uuid in payload['uuids'] if uuid in self.orgs]
+        return MockResponse({'count': len(items), 'items': items})
+
+def org(uuid, *parents):
+    record = {'uuid': uuid, 'info': {}}
+    if parents:
+        record['parents'] = [{'uuid': parent} for parent in parents]
+    return record
+
+def change(uuid, change_type, family='Organisation'):
+    return {'uuid': uuid, 'changeType': change_type, 'familySystemName': family}
+
+# university
+#   college-a
+#     dept-a1
+#       lab-a1
+#     dept-a2
+#   college-b
+#     dept-b1
+# external (parent not in the hierarchy)
+orgs = [
+    org('dept-a1', 'college-a'),
+    org('university'),
+    org('college-a', 'university'),
+    org('lab-a1', 'dept-a1'),
+    org('dept-a2', 'college-a'),
+    org('college-b', 'university'),
+    org('dept-b1', 'college-b', 'college-a'),
+    org('external', 'missing'),
+]
+
+@pytest.fixture
+def pure(monkeypatch):
+    pure = MockPure(orgs)
+    monkeypatch.setattr(client, 'get', pure.get)
+    monkeypatch.setattr(client, 'filter', pure.filter)
+    return pure
+
+def test_queries():
+    h = OrganisationHierarchy.from_records(orgs)
+    assert len(h) == 8
+    assert 'lab-a1' in h and 'missing' not in h
+    assert set(h.roots()) == {'university', 'external'}
+    assert h.parent('university') is None
+    assert h.parent('external') is None
+    assert h.parent('dept-b1') == 'college-b' # The first parent.
+    assert h.ancestors('lab-a1') == ['dept-a1', 'college-a', 'university']
+    assert h.depth('lab-a1') == 3
+    assert h.children('college-a') == ['dept-a1', 'dept-a2']
+    assert h.children('lab-a1') == []
+    assert set(h.descendants('college-a')) == {'dept-a1', 'lab-a1', 'dept-a2'}
+    assert h.descendants('college-a', inclusive=True)[0] == 'college-a'
+    assert h.subtree_size('university') == 7
+    assert h.is_ancestor('university', 'lab-a1')
+    assert h.is_ancestor('college-a', 'lab-a1')
+    assert not h.is_ancestor('college-b', 'lab-a1')
+    assert not h.is_ancestor('lab-a1', 'college-a')
+    assert not h.is_ancestor('lab-a1', 'lab-a1')
+    assert h.is_ancestor('lab-a1', 'lab-a1', inclusive=True)
+    assert not h.is_ancestor('external', 'lab-a1')
+    assert sorted(h) == sorted(o['uuid'] for o in orgs)
+    with pytest.raises(KeyError):
+        h.parent('missing')
+
+    # Every unit's descendants agree with its ancestors:
+    for uuid in h:
+        assert set(h.descendants(uuid)) == {other for other in h if uuid in h.ancestors(other)}
+
+    totals = h.rollup({'lab-a1': 1, 'dept-a2': 2, 'dept-b1': 4, 'university': 8, 'missing': 16})
+    assert totals['university'] == 15
+    assert totals['college-a'] == 3
+    assert totals['college-b'] == 4
+    assert totals['external'] == 0
+
+def test_cycles():
+    h = OrganisationHierarchy({'a': 'c', 'b': 'a', 'c': 'b', 'd': 'a', 'e': 'e'})
+    assert len(h) == 5
+    assert len(h.roots()) == 2
+    for uuid in h:
+        assert len(h.ancestors(uuid)) < 5
+
+def test_save_and_load(tmp_path):
+    h = OrganisationHierarchy.from_records(orgs, resumption_token='token1')
+    h.save(tmp_path / 'orgs.json')
+    loaded = OrganisationHierarchy.load(tmp_path / 'orgs.json')
+    assert loaded.resumption_token == 'token1'
+    assert list(loaded) == list(h)
+    assert loaded.ancestors('lab-a1') == h.ancestors('lab-a1')
+
+    with open(tmp_path / 'bad.json', 'w') as f:
+        json.dump({'version': 0}, f)
+    with pytest.raises(hierarchy.PureAPIHierarchyException):
+        OrganisationHierarchy.load(tmp_path / 'bad.json')
+
+def test_harvest_and_refresh(pure):
+    with pytest.raises(hierarchy.PureAPIHierarchyException):
+        OrganisationHierarchy().refresh()
+
+    h = OrganisationHierarchy.harvest(params={'size': 3})
+    assert len(h) == 8
+    assert h.is_ancestor('university', 'lab-a1')
+    start_date = h.resumption_token
+
+    # Move dept-a1 to college-b, delete college-a, and add a new lab:
+    pure.orgs['dept-a1'] = org('dept-a1', 'college-b')
+    pure.orgs['lab-a2'] = org('lab-a2', 'dept-a2')
+    del pure.orgs['college-a']
+    pure.changes[start_date] = {
+        'count': 5,
+        'resumptionToken': 'token1',
+        'moreChanges': True,
+        'items': [
+            change('dept-a1', 'UPDATE'),
+            change('college-a', 'DELETE'),
+            change('lab-a2', 'ADD'),
+            change('dept-a2', 'UPDATE'),
+            change('p1', 'UPDATE', family='Person'),
+        ],
+    }
+    pure.changes['token1'] = {'count': 0, 'resumptionToken': 'token2', 'moreChanges': False}
+
+    assert h.refresh() == 4
+    assert h.resumption_token == 'token1'
+    assert 'college-a' not in h
+    assert h.ancestors('lab-a1') == ['dept-a1', 'college-b', 'university']
+    assert h.parent('lab-a2') == 'dept-a2'
+    assert 'dept-a2' in h.roots() # Its parent was deleted.
+    assert not h.is_ancestor('university', 'dept-a2')
+
+    # If the parent returns, so do its children:
+    pure.orgs['college-a'] = org('college-a', 'university')
+    pure.changes['token1'] = {
+        'count': 1,
+        'resumptionToken': 'token2',
+        'moreChanges': False,
+        'items': [change('college-a', 'ADD')],
+    }
+    assert h.refresh() == 1
+    assert h.ancestors('lab-a2') == ['dept-a2', 'college-a', 'university']
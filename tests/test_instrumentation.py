@@ -0,0 +1,104 @@
+import pytest
+
+from pureapi import client, instrumentation, mirror
+
+from benchmarks.stub_server import StubServer
+
+class RecordingHooks(instrumentation.Hooks):
+    def __init__(self):
+        self.events = []
+
+    def request_start(self, event):
+        self.events.append(('request_start', event.resource_path))
+
+    def retry(self, event):
+        self.events.append(('retry', type(event.error).__name__))
+
+    def request_end(self, event):
+        self.events.append(('request_end', event.status, event.attempts))
+
+    def page_decoded(self, event):
+        self.events.append(('page_decoded', event.records))
+
+    def record_transformed(self, collection, seconds):
+        self.events.append(('record_transformed', collection))
+
+def test_hooks():
+    hooks = RecordingHooks()
+    with StubServer(counts={'persons': 3}) as server:
+        records = list(client.get_all_transformed('persons', {'size': 2}, config=server.config(hooks=hooks)))
+    assert len(records) == 3
+    assert hooks.events == [
+        ('request_start', 'persons'), ('request_end', 200, 1),
+        ('request_start', 'persons'), ('request_end', 200, 1),
+        ('page_decoded', 2), ('record_transformed', 'persons'), ('record_transformed', 'persons'),
+        ('request_start', 'persons'), ('request_end', 200, 1),
+        ('page_decoded', 1), ('record_transformed', 'persons'),
+    ]
+
+def test_metrics_collector():
+    metrics = instrumentation.MetricsCollector(slowest_count=3)
+    with StubServer(counts={'persons': 500}, changes_count=250, error_rate=0.3, seed=2) as server:
+        config = server.config(hooks=metrics)
+        assert len(list(client.get_all_transformed('persons', {'size': 50}, config=config))) == 500
+        assert len(list(client.get_all_changes('2020-01-01', config=config))) == 3
+        retries = server.error_count
+    with StubServer(counts={'persons': 1}, error_rate=1.0, error_mode='status') as server:
+        with pytest.raises(client.PureAPIHTTPError):
+            client.get('persons', config=server.config(hooks=metrics))
+
+    report = metrics.report()
+    persons = report['collections']['persons']
+    assert persons['requests']['200']['count'] == 11
+    assert persons['requests']['503']['count'] == 1
+    assert persons['records_decoded'] == persons['records_transformed'] == 500
+    assert persons['response_bytes'] > 0
+    assert persons['retries'] + report['collections']['changes']['retries'] == retries > 0
+    assert report['collections']['changes']['records_decoded'] == 250
+    assert report['in_flight'] == 0
+    assert len(report['slowest']) == 3
+    assert report['slowest'][0]['seconds'] >= report['slowest'][-1]['seconds']
+
+def test_hooks_for():
+    config_hooks = RecordingHooks()
+    assert instrumentation.hooks_for(None) is None
+    assert instrumentation.hooks_for(config_hooks) is config_hooks
+    registered = RecordingHooks()
+    instrumentation.register(registered)
+    try:
+        combined = instrumentation.hooks_for(config_hooks)
+        assert combined.hooks == (config_hooks, registered)
+        # Combinations are reused until the registered hooks change:
+        assert instrumentation.hooks_for(config_hooks) is combined
+        other = RecordingHooks()
+        instrumentation.register(other)
+        combined_again = instrumentation.hooks_for(config_hooks)
+        assert combined_again is not combined
+        assert combined_again.hooks[0] is config_hooks
+        assert combined_again.hooks[1].hooks == (registered, other)
+        instrumentation.unregister(other)
+        assert instrumentation.hooks_for(config_hooks).hooks == (config_hooks, registered)
+    finally:
+        instrumentation.unregister(registered)
+        instrumentation.unregister(other)
+    assert instrumentation.hooks_for(config_hooks) is config_hooks
+
+def test_mirror_metrics(tmp_path):
+    metrics = instrumentation.MetricsCollector()
+    with StubServer(counts={'persons': 30}, changes_count=20) as server:
+        config = server.config(hooks=metrics)
+        with mirror.Mirror(tmp_path / 'pure.sqlite', collections=['persons'], config=config) as m:
+            assert m.load('persons', {'size': 10}) == 30
+            m.sync('2020-01-01')
+    persons = metrics.report()['collections']['persons']
+    # Records from the load, and records changed by the sync:
+    assert persons['records_decoded'] > 30
+
+def test_histogram():
+    histogram = instrumentation.Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) is None
@@ -0,0 +1,45 @@
+import urllib.request
+
+from pureapi import client, instrumentation, metrics, xmlparser
+
+from benchmarks.stub_server import StubServer
+
+def test_sequence_number():
+    assert metrics.sequence_number('eyJzZXF1ZW5jZU51bWJlciI6MTk0MTM1MjM2fQ==') == 194135236
+    assert metrics.sequence_number('1234') == 1234
+    assert metrics.sequence_number('2020-03-12') is None
+
+def test_serve():
+    prometheus, server = metrics.serve(port=0)
+    cache = xmlparser.EntityCache()
+    cache.hits, cache.misses = 3, 1
+    prometheus.register_cache('xml-entities', cache)
+    try:
+        with StubServer(counts={'persons': 150}, changes_count=250, changes_page_size=100) as stub:
+            # No hooks in the config; the registered metrics receive events anyway:
+            config = stub.config()
+            assert config.hooks is None
+            assert len(list(client.get_all_transformed('persons', {'size': 100}, config=config))) == 150
+            list(client.get_all_changes('2020-01-01', config=config))
+        prometheus.set_changes_head(300)
+
+        url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+        with urllib.request.urlopen(url) as r:
+            assert r.headers['Content-Type'] == metrics.content_type
+            text = r.read().decode('utf-8')
+    finally:
+        server.shutdown()
+        instrumentation.unregister(prometheus)
+
+    lines = text.splitlines()
+    assert 'pureapi_requests_total{collection="persons",status="200"} 3' in lines
+    assert 'pureapi_records_decoded_total{collection="persons"} 150' in lines
+    assert 'pureapi_records_transformed_total{collection="persons"} 150' in lines
+    assert 'pureapi_request_duration_seconds_count{collection="persons",status="200"} 3' in lines
+    assert 'pureapi_request_duration_seconds_bucket{collection="persons",status="200",le="+Inf"} 3' in lines
+    assert 'pureapi_in_flight_requests 0' in lines
+    assert 'pureapi_changes_pages_total 3' in lines
+    assert 'pureapi_changes_sequence_number 250' in lines
+    assert 'pureapi_changes_lag 50' in lines
+    assert 'pureapi_cache_hits_total{cache="xml-entities"} 3' in lines
+    assert instrumentation.global_hooks is None
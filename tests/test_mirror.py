@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from pureapi import client, mirror
+
+class MockResponse:
+    def __init__(self, body):
+        self.body = body
+        self.content = json.dumps(body).encode('utf-8')
+
+    def json(self):
+        return json.loads(json.dumps(self.body))
+
+class MockPure:
+    '''A minimal, in-memory stand-in for the Pure API.'''
+    def __init__(self, persons):
+        self.persons = {person['uuid']: person for person in persons}
+        self.changes = {}
+
+    def get(self, resource_path, params=None, config=None):
+        if resource_path.startswith('changes/'):
+            return MockResponse(self.changes[resource_path.split('/')[1]])
+        persons = list(self.persons.values())
+        if params['size'] == 0:
+            return MockResponse({'count': len(persons)})
+        return MockResponse({
+            'count': len(persons),
+            'items': persons[params['offset']:params['offset'] + params['size']],
+        })
+
+    def filter(self, resource_path, payload=None, config=None):
+        items = [self.persons[uuid] for uuid in payload['uuids'] if uuid in self.persons]
+        return MockResponse({'count': len(items), 'items': items})
+
+def person(uuid, last_name, modified='2023-01-01T00:00:00.000Z'):
+    return {'uuid': uuid, 'name': {'lastName': last_name}, 'info': {'modifiedDate': modified}}
+
+def versions(m):
+    return dict(m.connection.execute('SELECT uuid, version FROM records WHERE collection = ?', ('persons',)))
+
+def change(uuid, change_type, family='Person', version=1):
+    return {'uuid': uuid, 'changeType': change_type, 'familySystemName': family, 'version': version}
+
+@pytest.fixture
+def pure(monkeypatch):
+    pure = MockPure([person(f'p{i}', f'Last{i}') for i in range(5)])
+    monkeypatch.setattr(client, 'get', pure.get)
+    monkeypatch.setattr(client, 'filter', pure.filter)
+    return pure
+
+def test_load_and_sync(pure, tmp_path):
+    with mirror.Mirror(tmp_path / 'pure.sqlite', collections=['persons']) as m:
+        with pytest.raises(mirror.PureAPIMirrorException):
+            m.sync()
+        assert m.load('persons', params={'size': 2}) == 5
+        assert m.count('persons') == 5
+        assert m.get('persons', 'p1')['name']['lastName'] == 'Last1'
+        assert versions(m) == {f'p{i}': None for i in range(5)}
+        start_date = m.resumption_token
+
+        pure.persons['p1'] = person('p1', 'Changed', modified='2023-02-01T00:00:00.000Z')
+        pure.persons['p5'] = person('p5', 'Added')
+        del pure.persons['p2']
+        del pure.persons['p3']
+        pure.changes[start_date] = {
+            'count': 5,
+            'resumptionToken': 'token1',
+            'moreChanges': True,
+            'items': [
+                change('p1', 'UPDATE'),
+                change('p2', 'DELETE'),
+                change('p5', 'ADD', version=3),
+                change('p3', 'UPDATE'), # No longer returned by the API.
+                change('o1', 'UPDATE', family='Organisation'),
+            ],
+        }
+        pure.changes['token1'] = {'count': 0, 'resumptionToken': 'token2', 'moreChanges': False}
+
+        result = m.sync()
+        assert result.upserted == 2
+        assert result.deleted == 2
+        assert m.count('persons') == 4
+        assert m.get('persons', 'p1')['name']['lastName'] == 'Changed'
+        assert m.get('persons', 'p2') is None
+        assert m.get('persons', 'p3') is None
+        assert m.get('persons', 'p5')['name']['lastName'] == 'Added'
+        assert [record['uuid'] for record in m.records('persons', modified_since='2023-02-01')] == ['p1']
+        assert versions(m) == {'p0': None, 'p1': 1, 'p4': None, 'p5': 3}
+        # The token from the trailing page without changes:
+        assert result.resumption_token == 'token2'
+        assert m.resumption_token == 'token2'
+
+    # Readers can use their own connections, and state persists:
+    with mirror.Mirror(tmp_path / 'pure.sqlite', collections=['persons']) as m:
+        assert m.count('persons') == 4
+        assert m.resumption_token == 'token2'
+
+def test_load_unmirrored_collection(pure, tmp_path):
+    with mirror.Mirror(tmp_path / 'pure.sqlite', collections=['persons']) as m:
+        with pytest.raises(mirror.PureAPIMirrorException):
+            m.load('organisational-units')
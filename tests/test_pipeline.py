@@ -0,0 +1,102 @@
+from functools import partial
+import threading
+import time
+
+import pytest
+
+from pureapi import client, pipeline
+
+from benchmarks.stub_server import StubServer, record_uuid
+
+def pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('pureapi-pipeline')]
+
+@pytest.mark.parametrize('fetch_workers,transform_workers,max_pages', [(1, 1, 1), (4, 1, None), (3, 2, 4)])
+def test_get_all_transformed(fetch_workers, transform_workers, max_pages):
+    with StubServer(counts={'persons': 95}, latency=0.01, jitter=0.02) as server:
+        config = server.config()
+        records = list(pipeline.get_all_transformed(
+            'persons',
+            {'size': 10},
+            fetch_workers=fetch_workers,
+            transform_workers=transform_workers,
+            max_pages=max_pages,
+            config=config
+        ))
+        assert [record.uuid for record in records] == [record_uuid('persons', index) for index in range(95)]
+        assert records == list(client.get_all_transformed('persons', {'size': 10}, config=config))
+
+        records = list(pipeline.filter_all_transformed('persons', {'size': 20}, fetch_workers=fetch_workers, config=config))
+        assert [record.uuid for record in records] == [record_uuid('persons', index) for index in range(95)]
+    assert pipeline_threads() == []
+
+def test_overlap():
+    with StubServer(counts={'persons': 40}, latency=0.1) as server:
+        start = time.perf_counter()
+        assert len(list(pipeline.get_all_transformed('persons', {'size': 5}, fetch_workers=4, config=server.config()))) == 40
+        # 9 requests, including the count request, each taking at least 0.1
+        # seconds, but with up to 4 at once:
+        assert time.perf_counter() - start < 9 * 0.1
+
+def test_early_stop():
+    with StubServer(counts={'persons': 1000}, latency=0.01) as server:
+        records = pipeline.get_all_transformed('persons', {'size': 10}, fetch_workers=2, max_pages=3, config=server.config())
+        for index, record in enumerate(records):
+            if index == 15:
+                break
+        records.close()
+        assert pipeline_threads() == []
+        # The count request, and no more than max_pages pages beyond the two
+        # pages the caller received:
+        assert server.request_count <= 1 + 2 + 3
+        request_count = server.request_count
+        time.sleep(0.05)
+        assert server.request_count == request_count
+
+def test_errors():
+    with StubServer(counts={'persons': 50}) as server:
+        config = server.config()
+        fetches = [lambda: client.get('persons', {'offset': 0, 'size': 10}, config)] * 3
+        def failing_fetch():
+            raise client.PureAPIClientException('Request failed')
+        fetches.insert(2, failing_fetch)
+        records = pipeline.records('persons', fetches, config=config, max_pages=2)
+        received = []
+        with pytest.raises(client.PureAPIClientException):
+            for record in records:
+                received.append(record)
+        # The records of the pages before the failed page:
+        assert len(received) == 20
+        assert pipeline_threads() == []
+
+        def failing_transform(collection, item, config):
+            raise ValueError('Transformation failed')
+        records = pipeline.records('persons', fetches[:1], config=config)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(client, '_transform', failing_transform)
+            with pytest.raises(ValueError):
+                list(records)
+        assert pipeline_threads() == []
+
+        raw = list(pipeline.records('persons', fetches[:2], transformed=False, config=config))
+        assert [item['uuid'] for item in raw] == [record_uuid('persons', index) for index in range(10)] * 2
+
+@pytest.mark.parametrize('transform_workers,max_pages', [(1, None), (4, 1)])
+def test_raw_records(transform_workers, max_pages):
+    with StubServer(counts={'persons': 35}) as server:
+        config = server.config()
+        fetches = [
+            partial(client.get, 'persons', {'offset': offset, 'size': 10}, config)
+            for offset in range(0, 35, 10)
+        ]
+        raw = list(pipeline.records(
+            'persons',
+            fetches,
+            transform_workers=transform_workers,
+            max_pages=max_pages,
+            transformed=False,
+            config=config
+        ))
+        assert [item['uuid'] for item in raw] == [record_uuid('persons', index) for index in range(35)]
+        assert all(type(item) is dict for item in raw)
+    assert pipeline_threads() == []
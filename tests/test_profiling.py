@@ -0,0 +1,41 @@
+import time
+
+from pureapi import client, profiling
+
+from benchmarks.stub_server import StubServer
+
+def test_profile(capsys, tmp_path):
+    samples_path = tmp_path / 'samples.folded'
+    with StubServer(counts={'persons': 120}, latency=0.02) as server:
+        config = server.config(profile=True, profile_samples=str(samples_path))
+        for person in client.get_all_transformed('persons', {'size': 50}, config=config):
+            time.sleep(0.001)
+
+    profile = profiling.last_profile
+    assert profile.collection == 'persons'
+    assert profile.records == 120
+    assert profile.pages == 3
+    assert profile.stages['network'].wall >= 0.08
+    assert profile.stages['consumer'].wall >= 0.12
+    assert profile.stages['transform'].calls == 120
+    assert 'pureapi profile: persons, 120 records in 3 pages' in capsys.readouterr().err
+
+    samples = samples_path.read_text().splitlines()
+    assert samples
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in samples)
+    assert any('test_profiling:test_profile' in line for line in samples)
+
+def test_profile_stops_early(capsys):
+    with StubServer(counts={'persons': 120}) as server:
+        records = client.get_all_changes_transformed('2020-01-01', config=server.config(profile=True))
+        next(records)
+        records.close()
+    assert profiling.last_profile.collection == 'changes'
+    assert profiling.last_profile.records == 1
+    assert 'pureapi profile: changes' in capsys.readouterr().err
+
+def test_env_profile(monkeypatch):
+    monkeypatch.setenv(profiling.env_profile_varname, '1')
+    assert client.Config().profile is True
+    monkeypatch.setenv(profiling.env_profile_varname, 'false')
+    assert client.Config().profile is False
@@ -0,0 +1,114 @@
+import copy
+import json
+import pickle
+
+import pytest
+
+from pureapi import cache, client, common, hierarchy, records, response
+
+from benchmarks.stub_server import StubServer, recorded_templates, record_uuid
+
+def decoded(record):
+    return json.loads(json.dumps(record))
+
+def test_from_json(version):
+    for collection, templates in recorded_templates(version).items():
+        for template in templates:
+            transformed = response.transform(collection, decoded(template), version=version)
+            record = records.from_json(collection, decoded(template), version=version)
+            assert isinstance(record, records.Record)
+            assert type(record).__name__ == common.item_definition_for(collection=collection, version=version)
+            assert record == transformed
+            assert records.to_dict(record) == transformed.to_dict()
+            assert records.materialize(record) is record
+            assert records.to_dict(record) == transformed.to_dict()
+            assert pickle.loads(pickle.dumps(record)) == record
+
+def test_defaults(version):
+    person = records.from_json('persons', {'uuid': 'p1'}, version=version)
+    assert person == response.transform('persons', {'uuid': 'p1'}, version=version)
+    assert person.name.firstName is None
+    assert person.info.previousUuids == []
+    assert person.orcid is None
+    ou = records.from_json('organisational-units', {'uuid': 'o1'}, version=version)
+    assert ou.parents[0].uuid is None
+    assert hierarchy.parent_uuid(ou) is None
+    ou = records.from_json('organisational-units', {'uuid': 'o2', 'parents': [{'uuid': 'o1'}]}, version=version)
+    assert hierarchy.parent_uuid(ou) == 'o1'
+
+def test_record_behaviour(version):
+    template = recorded_templates(version)['research-outputs'][0]
+    raw = decoded(template)
+    ro = records.from_json('research-outputs', raw, version=version)
+
+    # Nested objects are converted on first access, and only once:
+    assert type(raw['title']) is dict
+    title = ro.title
+    assert isinstance(title, records.Record)
+    assert ro.title is title
+    assert title.value == template['title']['value']
+    associations = ro.personAssociations
+    assert all(isinstance(association, records.Record) for association in associations)
+    assert ro.personAssociations is associations
+
+    # Mapping access:
+    assert ro['title'] is title
+    assert ro.get('title') is title
+    assert 'title' in ro
+    assert 'missingField' not in ro
+    assert ro.get('missingField') is None
+    assert set(ro) == set(raw)
+    assert len(ro) == len(raw)
+    with pytest.raises(KeyError):
+        ro['missingField']
+
+    # Properties defined by the schema, but missing, are None:
+    assert ro.abstract is not None
+    del ro['abstract']
+    assert ro.abstract is None
+    assert 'abstract' not in ro
+
+    # Fields not defined by the schema are kept:
+    ro['expanded'] = {'extra': True}
+    assert ro.expanded == {'extra': True}
+    assert 'expanded' in ro
+    del ro['expanded']
+    with pytest.raises(AttributeError):
+        ro.expanded
+    extra = records.from_json('research-outputs', {'uuid': 'r1', 'undocumented': 1}, version=version)
+    assert extra.undocumented == 1
+    assert extra['undocumented'] == 1
+
+    # Records have no per-instance __dict__:
+    with pytest.raises(AttributeError):
+        ro.__dict__
+    with pytest.raises(AttributeError):
+        ro.notAField = 1
+
+    # Fields that would hide Mapping methods are only accessible as keys:
+    list_result = records.record_class('WSPersonListResult', version).from_json({'count': 1, 'items': [{'uuid': 'p1'}]})
+    assert callable(list_result.items)
+    assert list_result['items'][0].uuid == 'p1'
+
+    assert copy.deepcopy(ro) == ro
+
+def test_config(version):
+    with pytest.raises(ValueError):
+        client.Config(record_type='tuples')
+    with StubServer(counts={'persons': 25}, version=version) as server:
+        config = server.config(version=version, record_type='slots')
+        persons = list(client.get_all_transformed('persons', {'size': 10}, config=config))
+        assert [person.uuid for person in persons] == [record_uuid('persons', index) for index in range(25)]
+        assert all(isinstance(person, records.Record) for person in persons)
+        assert persons == list(client.get_all_transformed('persons', {'size': 10}, config=server.config(version=version)))
+
+def test_cache_spill(tmp_path, version):
+    with StubServer(counts={'persons': 5}, version=version) as server:
+        config = server.config(version=version, record_type='slots')
+        records_cache = cache.RecordCache(maxsize=1, spill_path=str(tmp_path / 'spill'), config=config)
+        uuids = [record_uuid('persons', index) for index in range(3)]
+        persons = list(records_cache.filter_all_by_uuid_transformed('persons', uuids=uuids))
+        spilled = records_cache.get('persons', uuids[0])
+        assert isinstance(spilled, records.Record)
+        assert spilled == persons[0]
+        records_cache.close()
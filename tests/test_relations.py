@@ -0,0 +1,57 @@
+from addict import Dict
+
+from pureapi import cache, client, relations
+
+from benchmarks.stub_server import StubServer, recorded_templates
+
+def test_references():
+    record = {
+        'uuid': 'ro',
+        'link': {'href': 'https://example.com/ws/api/524/research-outputs/ro'},
+        'personAssociations': [
+            {'person': {'uuid': 'p1', 'link': {'href': 'https://example.com/ws/api/524/persons/p1'}}},
+            {'externalPerson': {'uuid': 'e1', 'link': {'href': 'https://example.com/ws/api/524/external-persons/e1'}}},
+            {'person': {'uuid': 'p1', 'link': {'href': 'https://example.com/ws/api/524/persons/p1'}}},
+        ],
+        'journalAssociation': {'journal': {'uuid': 'j1', 'link': {'href': 'https://example.com/ws/api/524/journals/j1'}}},
+        'publisher': {'uuid': 'pub', 'link': {'href': 'https://example.com/ws/api/524/publishers/pub'}},
+        'type': {'uri': '/dk/atira/pure/researchoutput/researchoutputtypes/contributiontojournal/article'},
+    }
+    assert relations.references([record, {'person': {'uuid': 'p2', 'link': {'href': '/persons/p2'}}}]) == {
+        'persons': ['p1', 'p2'],
+        'external-persons': ['e1'],
+        'journals': ['j1'],
+    }
+    assert relations.references([record], collections=['publishers']) == {'publishers': ['pub']}
+
+def test_expand():
+    templates = {**recorded_templates(), 'journals': [{'title': {'value': 'Journal'}}]}
+    counts = {collection: 30 for collection in templates}
+    with StubServer(counts=counts, templates=templates) as server:
+        config = server.config()
+        research_outputs = list(client.get_all_transformed('research-outputs', {'size': 30}, config=config))
+        uuids = relations.references(research_outputs)
+        requests = server.request_count
+        expanded = list(relations.expand(research_outputs, batch_size=30, uuids_per_request=50, config=config))
+        assert [ro.uuid for ro in expanded] == [ro.uuid for ro in research_outputs]
+        # One request per collection, per 50 uuids:
+        assert server.request_count - requests == sum((len(collection_uuids) + 49) // 50 for collection_uuids in uuids.values())
+
+        org = expanded[0].managingOrganisationalUnit
+        assert isinstance(org.expanded, Dict)
+        assert org.expanded.uuid == org.uuid
+        attached = [
+            association.person.expanded or association.externalPerson.expanded
+            for ro in expanded for association in ro.personAssociations
+        ]
+        # Some associations, e.g., with author collaborations, reference neither:
+        attached = [person for person in attached if person]
+        assert attached and all(person.uuid for person in attached)
+        assert expanded[0].journalAssociation.journal.expanded.title.value == 'Journal'
+
+        # With a cache, related records are requested only once:
+        records = cache.RecordCache(config=config)
+        list(relations.expand(research_outputs, batch_size=10, cache=records))
+        requests = server.request_count
+        list(relations.expand(research_outputs, batch_size=10, cache=records))
+        assert server.request_count == requests
@@ -0,0 +1,89 @@
+import gzip
+import json
+import os
+
+from addict import Dict
+import pytest
+
+from pureapi import client, sharding, transport
+
+from benchmarks.stub_server import StubServer, record_uuid
+
+record_count = 95
+
+class MockResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+def mock_get(resource_path, params=None, config=None):
+    if params['size'] == 0:
+        return MockResponse({'count': record_count})
+    end = min(params['offset'] + params['size'], record_count)
+    return MockResponse({
+        'count': record_count,
+        'items': [{'uuid': f'uuid-{i}', 'pid': os.getpid()} for i in range(params['offset'], end)],
+    })
+
+@pytest.fixture
+def pure(monkeypatch):
+    monkeypatch.setattr(client, 'get', mock_get)
+
+def test_plan(pure):
+    shards = sharding.plan('persons', params={'size': 10}, shard_count=3)
+    assert [len(shard.windows) for shard in shards] == [4, 3, 3]
+    offsets = [window['offset'] for shard in shards for window in shard.windows]
+    assert offsets == list(range(0, record_count, 10))
+
+    # Never more shards than windows:
+    assert len(sharding.plan('persons', params={'size': 50}, shard_count=8)) == 2
+
+def test_harvest(pure):
+    records = list(sharding.harvest('persons', params={'size': 10}, processes=2, shard_count=5, transformed=True))
+    assert [record.uuid for record in records] == [f'uuid-{i}' for i in range(record_count)]
+    assert all(isinstance(record, Dict) for record in records)
+    assert os.getpid() not in {record.pid for record in records}
+
+def test_harvest_to_files(pure, tmp_path):
+    results = sharding.harvest_to_files('persons', tmp_path, params={'size': 10}, processes=2, shard_count=3)
+    assert [result.record_count for result in results] == [40, 30, 25]
+    uuids = []
+    for result in results:
+        assert result.path.name.startswith(f'persons-shard{result.shard.index:05d}')
+        with gzip.open(result.path, 'rt') as f:
+            uuids.extend(json.loads(line)['uuid'] for line in f)
+    assert uuids == [f'uuid-{i}' for i in range(record_count)]
+
+def test_harvest_retries_failed_shards(monkeypatch, tmp_path):
+    def flaky_get(resource_path, params=None, config=None):
+        marker = tmp_path / f'failed-{params["offset"]}'
+        if params['offset'] == 20 and not marker.exists():
+            marker.touch()
+            raise client.PureAPIRequestException('flaky')
+        return mock_get(resource_path, params, config)
+    monkeypatch.setattr(client, 'get', flaky_get)
+    records = list(sharding.harvest('persons', params={'size': 10}, processes=2, shard_count=4))
+    assert len(records) == record_count
+
+    def failing_get(resource_path, params=None, config=None):
+        if params['offset'] == 20:
+            raise client.PureAPIRequestException('always fails')
+        return mock_get(resource_path, params, config)
+    monkeypatch.setattr(client, 'get', failing_get)
+    with pytest.raises(sharding.PureAPIShardException, match='Shard 1'):
+        list(sharding.harvest('persons', params={'size': 10}, processes=2, shard_count=5, max_retries=1))
+
+def test_harvest_with_http2_transport():
+    pytest.importorskip('httpx')
+    pytest.importorskip('h2')
+    with StubServer(counts={'persons': record_count}, http2=True) as server:
+        with transport.HTTPXTransport(http1=False) as t:
+            config = server.config(transport=t)
+            # The parent opens a connection for the count request, before forking:
+            records = list(sharding.harvest('persons', params={'size': 10}, processes=2, shard_count=5, config=config))
+            assert [record['uuid'] for record in records] == [record_uuid('persons', i) for i in range(record_count)]
+        assert server.protocol_error_count == 0
+        # The count request, and one request for each window, without retries:
+        assert server.request_count == 1 + 10
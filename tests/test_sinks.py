@@ -0,0 +1,54 @@
+import gzip
+import json
+
+import pytest
+
+from pureapi import sinks
+
+def test_json_lines_sink_rollover_by_size(tmp_path):
+    items = [{'uuid': str(i), 'title': {'value': 'x' * 100}} for i in range(10)]
+    with sinks.JsonLinesSink(tmp_path, prefix='persons', compress=False, max_bytes=250) as sink:
+        for i in range(0, 10, 2):
+            sink.write('persons', items[i:i+2])
+    assert sink.records_written == 10
+    assert [path.name for path in sink.paths] == [f'persons-{i:05d}.jsonl' for i in range(5)]
+    lines = [json.loads(line) for path in sink.paths for line in path.read_text().splitlines()]
+    assert lines == items
+
+def test_json_lines_sink_rollover_by_time(tmp_path, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(sinks.time, 'monotonic', lambda: now[0])
+    sink = sinks.JsonLinesSink(tmp_path, max_seconds=60)
+    sink.write('persons', [{'uuid': '1'}])
+    now[0] = 30.0
+    sink.write('persons', [{'uuid': '2'}])
+    now[0] = 61.0
+    sink.write('persons', [{'uuid': '3'}])
+    sink.close()
+    assert len(sink.paths) == 2
+    with gzip.open(sink.paths[0], 'rt') as f:
+        assert [json.loads(line)['uuid'] for line in f] == ['1', '2']
+
+def test_incomplete_sink(tmp_path):
+    class NoCloseSink(sinks.RollingFileSink):
+        def _open(self, path, collection):
+            return open(path, 'w')
+        def _write(self, collection, items):
+            pass
+        def _size(self):
+            return 0
+    with pytest.raises(TypeError):
+        NoCloseSink(tmp_path)
+    with pytest.raises(TypeError):
+        sinks.RollingFileSink(tmp_path)
+
+def test_parquet_sink(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    with open('tests/data/524/research_output/f145e583-7d49-415e-aefb-381905b58ae7.json') as f:
+        record = json.load(f)
+    with sinks.ParquetSink(tmp_path, prefix='ros', version='524', children=['personAssociations']) as sink:
+        sink.write('research-outputs', [record, record])
+    names = sorted(path.name for path in sink.table_paths)
+    assert names == ['ros-00000.research-outputs.parquet', 'ros-00000.research-outputs.personAssociations.parquet']
+    assert pyarrow.parquet.read_table(sink.table_paths[0]).num_rows == 2
@@ -0,0 +1,32 @@
+import pytest
+
+from pureapi import client
+
+from benchmarks.stub_server import StubServer, record_uuid
+
+def test_stub_server():
+    with StubServer(counts={'persons': 250}, changes_count=450, zero_count_every=2, error_rate=0.2, seed=1) as server:
+        config = server.config()
+        uuids = [record['uuid'] for r in client.get_all('persons', {'size': 100}, config=config) for record in r.json()['items']]
+        assert uuids == [record_uuid('persons', index) for index in range(250)]
+
+        filtered = [
+            record['uuid']
+            for r in client.filter_all_by_uuid('persons', uuids=uuids[:150], uuids_per_request=40, config=config)
+            for record in r.json()['items']
+        ]
+        assert filtered == uuids[:150]
+
+        responses = list(client.get_all_changes('2020-01-01', config=config))
+        # Every third page of changes has a count of zero, and is skipped:
+        assert [r.json()['count'] for r in responses] == [100, 100, 100, 50]
+        assert {change['familySystemName'] for r in responses for change in r.json()['items']} == {'Person'}
+
+        # Injected errors are connection resets, which the retryer retries:
+        assert server.error_count > 0
+
+def test_stub_server_status_errors():
+    with StubServer(counts={'persons': 10}, error_rate=1.0, error_mode='status') as server:
+        with pytest.raises(client.PureAPIHTTPError) as exc_info:
+            client.get('persons', config=server.config())
+        assert exc_info.value.response.status_code == 503
@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import json
+import time
+
+import pytest
+import requests
+
+from pureapi import client, transport
+
+from benchmarks.stub_server import StubServer, record_uuid
+
+def test_record_and_replay(tmp_path):
+    store = transport.ExchangeStore(tmp_path)
+    with StubServer(counts={'persons': 120}, changes_count=150, latency=0.05) as server:
+        recording = server.config(transport=transport.RecordingTransport(store))
+        recorded = list(client.get_all_transformed('persons', {'size': 50}, config=recording))
+        recorded_changes = [r.json() for r in client.get_all_changes('2020-01-01', config=recording)]
+        recorded_filtered = client.filter('persons', {'uuids': [recorded[0].uuid]}, config=recording).json()
+        # The stub ignores the unknown param, so this response is identical to the count request's:
+        client.get('persons', {'size': 0, 'offset': 0, 'unknown': 1}, config=recording)
+        domain = server.domain
+
+    # Identical bodies are stored only once:
+    assert len(list((tmp_path / 'exchanges').glob('*/*.json'))) == 8
+    assert len(list((tmp_path / 'bodies').glob('*/*.gz'))) == 7
+    assert not any(b'stub' in path.read_bytes() for path in (tmp_path / 'exchanges').glob('*/*.json'))
+
+    replaying = client.Config(protocol='http', domain=domain, key='other', transport=transport.ReplayTransport(store))
+    assert list(client.get_all_transformed('persons', {'size': 50}, config=replaying)) == recorded
+    assert [r.json() for r in client.get_all_changes('2020-01-01', config=replaying)] == recorded_changes
+    assert client.filter('persons', {'uuids': [recorded[0].uuid]}, config=replaying).json() == recorded_filtered
+
+    with pytest.raises(client.PureAPIHTTPError) as exc_info:
+        client.get('persons', {'size': 51}, config=replaying)
+    assert exc_info.value.response.reason == 'Not Recorded'
+
+    # The four get_all() requests took at least 0.2 seconds to record:
+    slow = client.Config(protocol='http', domain=domain, key='x', transport=transport.ReplayTransport(store, speed=2.0))
+    start = time.perf_counter()
+    list(client.get_all('persons', {'size': 50}, config=slow))
+    assert time.perf_counter() - start >= 0.1
+
+@pytest.mark.parametrize('http2', [False, True])
+def test_httpx_transport(http2):
+    pytest.importorskip('httpx')
+    if http2:
+        pytest.importorskip('h2')
+    with StubServer(counts={'persons': 200}, error_rate=0.1, seed=2, http2=http2) as server:
+        with transport.HTTPXTransport(http2=http2, http1=not http2) as t:
+            config = server.config(transport=t)
+            windows = [{'offset': offset, 'size': 20} for offset in range(0, 200, 20)]
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                responses = list(executor.map(lambda params: client.get('persons', params, config=config), windows))
+            expected = [record_uuid('persons', index) for index in range(200)]
+            assert [record['uuid'] for r in responses for record in r.json()['items']] == expected
+
+            uuids = expected[:5]
+            filtered = client.filter('persons', {'uuids': uuids}, config=config)
+            assert filtered.status_code == 200
+            assert [record['uuid'] for record in filtered.json()['items']] == uuids
+
+            with pytest.raises(client.PureAPIHTTPError):
+                client.get('persons/missing', config=config)
+
+            # Injected connection or stream resets are retried:
+            assert server.error_count > 0
+            if http2:
+                # All concurrent requests are multiplexed over a single connection:
+                assert server.connection_count == 1
+
+def test_httpx_transport_connection_error():
+    pytest.importorskip('httpx')
+    with StubServer() as server:
+        domain = server.domain
+    with transport.HTTPXTransport() as t:
+        prepped = t.prepare(requests.Request('GET', f'http://{domain}/ws/api/524/persons'))
+        with pytest.raises(requests.exceptions.ConnectionError):
+            t.send(prepped, timeout=(1, 1))
+
+def test_httpx_transport_compressed():
+    httpx = pytest.importorskip('httpx')
+    body = json.dumps({'count': 0, 'items': []}).encode('utf-8')
+    compressed = gzip.compress(body)
+
+    def handler(request):
+        return httpx.Response(200, stream=httpx.ByteStream(compressed), headers={
+            'content-type': 'application/json',
+            'content-encoding': 'gzip',
+            'content-length': str(len(compressed)),
+        })
+
+    with transport.HTTPXTransport(transport=httpx.MockTransport(handler)) as t:
+        r = t.send(t.prepare(requests.Request('GET', 'http://example.com/ws/api/524/persons')))
+    assert r.content == body
+    assert r.json() == {'count': 0, 'items': []}
+    assert 'content-encoding' not in r.headers
+    assert 'content-length' not in r.headers
+
+def test_single_flight():
+    with StubServer(counts={'persons': 50}, latency=0.2) as server:
+        t = transport.SingleFlightTransport()
+        config = server.config(transport=t)
+        params = {'offset': 10, 'size': 5}
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda _: client.get('persons', params, config=config), range(8)))
+        # Identical concurrent requests share a single request:
+        assert server.request_count == 1
+        assert (t.hits, t.misses) == (7, 1)
+        assert len({id(r) for r in responses}) == 8
+        assert all(r.json() == responses[0].json() for r in responses)
+
+        # Requests with different params, payloads, or API keys do not:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda call: call(), [
+                lambda: client.get('persons', {'offset': 15, 'size': 5}, config=config),
+                lambda: client.filter('persons', {'uuids': [record_uuid('persons', 1)]}, config=config),
+                lambda: client.filter('persons', {'uuids': [record_uuid('persons', 2)]}, config=config),
+                lambda: client.get('persons', params, config=server.config(key='another', transport=t)),
+            ]))
+        assert server.request_count == 5
+
+        # Without a TTL, later requests are not coalesced:
+        client.get('persons', params, config=config)
+        assert server.request_count == 6
+
+def test_single_flight_ttl():
+    with StubServer(counts={'persons': 50}) as server:
+        t = transport.SingleFlightTransport(ttl=0.5, max_cached=1)
+        config = server.config(transport=t)
+        first = client.get('persons', {'size': 5}, config=config)
+        second = client.get('persons', {'size': 5}, config=config)
+        assert server.request_count == 1
+        assert second.json() == first.json()
+
+        # Only max_cached responses are kept:
+        client.get('persons', {'size': 6}, config=config)
+        client.get('persons', {'size': 5}, config=config)
+        assert server.request_count == 3
+
+        time.sleep(0.6)
+        client.get('persons', {'size': 5}, config=config)
+        assert server.request_count == 4
+
+        # Failed requests are never reused:
+        with pytest.raises(client.PureAPIHTTPError):
+            client.get('persons/missing', config=config)
+        with pytest.raises(client.PureAPIHTTPError):
+            client.get('persons/missing', config=config)
+        assert server.request_count == 6
+
+def test_clone():
+    requests_transport = transport.RequestsTransport()
+    assert requests_transport.clone() is requests_transport
+    single_flight = transport.SingleFlightTransport(ttl=1.0, max_cached=5)
+    clone = single_flight.clone()
+    assert clone is not single_flight
+    assert (clone.ttl, clone.max_cached) == (1.0, 5)
+    pytest.importorskip('httpx')
+    with transport.HTTPXTransport(http2=False, max_connections=3) as t:
+        with t.clone() as clone:
+            assert clone.client is not t.client
+            assert clone._kwargs == t._kwargs
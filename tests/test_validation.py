@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import json
+
+import pytest
+
+from pureapi import validation
+
+def load_research_output(version):
+    with open(f'tests/data/{version}/research_output/f145e583-7d49-415e-aefb-381905b58ae7.json') as f:
+        return json.load(f)
+
+def test_sampled_validator_debug(version):
+    validator = validation.SampledValidator(debug=True)
+    record = load_research_output(version)
+    validator('research-outputs', record, version=version)
+    baseline = validator.stats.report()
+    assert baseline['records_seen'] == 1
+    assert baseline['records_validated'] == 1
+    assert baseline['errors'] == {}
+
+    drifted = copy.deepcopy(record)
+    drifted['bogusField'] = 'bogus'
+    drifted['title'] = 'no longer an object'
+    drifted['personAssociations'][0]['pureId'] = 'no longer an integer'
+    validator = validation.SampledValidator(debug=True)
+    validator('research-outputs', drifted, version=version)
+    fields = validator.stats.report()['fields']
+    assert fields['bogusField']['unexpected'] == 1
+    assert fields['title']['type_mismatch'] == {'object->str': 1}
+    assert fields['personAssociations[].pureId']['type_mismatch'] == {'integer->str': 1}
+
+def test_sampled_validator_sample_rate():
+    record = load_research_output('524')
+    validator = validation.SampledValidator(sample_rate=0.0)
+    for _ in range(100):
+        validator('research-outputs', record, version='524')
+    assert validator.stats.records_seen == 100
+    assert validator.stats.records_validated == 0
+
+    validator = validation.SampledValidator(sample_rate=0.5, seed=1)
+    for _ in range(1000):
+        validator('research-outputs', record, version='524')
+    assert 400 < validator.stats.records_validated < 600
+
+    with pytest.raises(ValueError, match='sample_rate'):
+        validation.SampledValidator(sample_rate=1.5)
+    with pytest.raises(ValueError, match='sample_rate'):
+        validation.SampledValidator(sample_rate=-0.1)
+    assert validation.SampledValidator(sample_rate=1).sample_rate == 1.0
+    assert validation.SampledValidator(sample_rate=0).sample_rate == 0.0
+
+def test_sampled_validator_threads():
+    validator = validation.SampledValidator(sample_rate=0.5, seed=1)
+    records = [{'uuid': str(index)} for index in range(1000)]
+
+    def validate(record):
+        validator('persons', record, version='524')
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(10):
+            list(executor.map(validate, records))
+    assert validator.stats.records_seen == 10000
+    assert 0 < validator.stats.records_validated < 10000
+
+def test_sampled_validator_never_raises():
+    validator = validation.SampledValidator(debug=True)
+    validator('bogus', {}, version='524')
+    assert validator.stats.report()['errors'] == {'bogus:PureAPIInvalidCollectionError': 1}
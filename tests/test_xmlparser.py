@@ -0,0 +1,138 @@
+import io
+import tracemalloc
+
+import pytest
+
+from pureapi import xmlparser
+
+from .publications_xml import publications_xml, write_publications_xml
+
+def test_publication():
+    [pub_elem] = xmlparser.records(publications_xml(2))[1:]
+    pub = xmlparser.publication(pub_elem)
+    assert pub['pure_uuid'] == 'pub-1'
+    assert pub['issued']['literal'] == '2001-02-02'
+    assert pub['issued_precision'] == 1
+    assert [pa['ordinal'] for pa in pub['person_associations']] == [0, 1, 2, 3]
+    internal, external = pub['person_associations'][:2]
+    assert internal['person']['internet_id'] == 'user1'
+    assert internal['person']['pure_internal'] == 'Y'
+    assert external['person']['pure_internal'] == 'N'
+    assert pub['owner_organisation']['pure_uuid'] == 'org-1'
+
+def test_iterrecords():
+    xml = publications_xml(20)
+    expected = [xmlparser.publication(elem) for elem in xmlparser.records(xml)]
+    assert list(xmlparser.iterrecords(io.BytesIO(xml), parse=xmlparser.publication)) == expected
+    assert [elem.attrib['uuid'] for elem in xmlparser.iterrecords(io.BytesIO(xml))] == [f'pub-{i}' for i in range(20)]
+
+def test_iterrecords_memory_is_flat(tmp_path):
+    def peak_memory(count):
+        path = tmp_path / f'{count}.xml'
+        write_publications_xml(path, count)
+        tracemalloc.start()
+        for pub in xmlparser.iterrecords(str(path), parse=xmlparser.publication):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    # Ten times the publications should need nowhere near ten times the memory:
+    assert peak_memory(300) < 2 * peak_memory(30)
+
+def test_backends_agree():
+    # lxml is opt-in:
+    assert xmlparser.backend == 'etree'
+    xml = publications_xml(10)
+    etree_elems = xmlparser.records(xml)
+    expected = [xmlparser.publication(elem) for elem in etree_elems]
+    if xmlparser.lxml_etree is None:
+        pytest.skip('lxml is not installed')
+    try:
+        xmlparser.use_backend('lxml')
+        lxml_elems = xmlparser.records(xml)
+        assert [xmlparser.publication(elem) for elem in lxml_elems] == expected
+        assert list(xmlparser.iterrecords(io.BytesIO(xml), parse=xmlparser.publication)) == expected
+        # Elements from either backend, whichever is selected:
+        assert [xmlparser.publication(elem) for elem in etree_elems] == expected
+        xmlparser.use_backend('etree')
+        assert [xmlparser.publication(elem) for elem in lxml_elems] == expected
+    finally:
+        xmlparser.use_backend('etree')
+
+@pytest.mark.parametrize('backend', ['etree', 'lxml'])
+def test_str_with_encoding_declaration(backend):
+    if backend == 'lxml' and xmlparser.lxml_etree is None:
+        pytest.skip('lxml is not installed')
+    xml = publications_xml(2).decode('utf-8')
+    if not xml.startswith('<?xml'):
+        xml = '<?xml version="1.0" encoding="UTF-8"?>\n' + xml
+    try:
+        xmlparser.use_backend(backend)
+        assert [xmlparser.publication(elem)['pure_uuid'] for elem in xmlparser.records(xml)] == ['pub-0', 'pub-1']
+    finally:
+        xmlparser.use_backend('etree')
+
+def test_field_spec():
+    spec = xmlparser.FieldSpec(
+        ('en', "./name[@locale='en_US']", xmlparser._text, None),
+        ('fr', "./name[@locale='fr_FR']", xmlparser._text, 'none'),
+        ('id', './id', xmlparser._int_text, xmlparser._required),
+    )
+    elem = xmlparser.records(
+        b'<r><result><content><name locale="de_DE">Name</name><name locale="en_US">Name</name><id>7</id></content></result></r>'
+    )[0]
+    assert spec.extract(elem) == {'en': 'Name', 'fr': 'none', 'id': 7}
+    elem.remove(elem.find('id'))
+    with pytest.raises(AttributeError):
+        spec.extract(elem)
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        xmlparser.use_backend('sax')
+
+def test_entity_cache():
+    xml = publications_xml(30)
+    expected = [xmlparser.publication(elem) for elem in xmlparser.records(xml)]
+    cache = xmlparser.EntityCache()
+    pubs = [xmlparser.publication(elem, cache) for elem in xmlparser.records(xml)]
+    assert pubs == expected
+    assert cache.hits > cache.misses
+    # Repeated entities are shared across records:
+    assert pubs[0]['owner_organisation'] is pubs[7]['owner_organisation']
+    assert pubs[0]['person_associations'][0]['person'] is pubs[25]['person_associations'][0]['person']
+    # Owners have less content than other organisation elements with the same uuid:
+    assert pubs[0]['owner_organisation'] != pubs[0]['organisation_associations'][0]['organisation']
+    # External persons are cached separately from internal persons:
+    assert all(
+        pa['person']['pure_internal'] == ('Y' if pa['person']['pure_uuid'].startswith('person-') else 'N')
+        for pub in pubs for pa in pub['person_associations']
+    )
+
+def test_entity_cache_is_bounded():
+    cache = xmlparser.EntityCache(maxsize=5)
+    for pub_elem in xmlparser.records(publications_xml(30)):
+        xmlparser.publication(pub_elem, cache)
+    assert len(cache) == 5
+
+def test_chunks():
+    xml = publications_xml(20)
+    expected = [elem.attrib['uuid'] for elem in xmlparser.records(xml)]
+    for chunk_bytes, read_bytes in [(1, 7), (5000, 100), (10**9, 2**20)]:
+        chunks = list(xmlparser._chunks(io.BytesIO(xml), chunk_bytes, read_bytes))
+        assert all(chunk.startswith(b'<content') for _, chunk, _ in chunks)
+        assert [
+            elem.attrib['uuid']
+            for prefix, chunk, suffix in chunks
+            for elem in xmlparser.records(prefix + chunk + suffix)
+        ] == expected
+    assert len(list(xmlparser._chunks(io.BytesIO(xml), 1))) == 20
+
+def test_parallel_records(tmp_path):
+    path = tmp_path / 'publications.xml'
+    write_publications_xml(path, 40)
+    expected = list(xmlparser.iterrecords(str(path), parse=xmlparser.publication))
+    assert list(xmlparser.parallel_records(str(path), processes=2, chunk_bytes=20000)) == expected
+    assert list(xmlparser.parallel_records(path, processes=2, chunk_bytes=20000, cache_size=100)) == expected
+    empty = b'<?xml version="1.0"?><GetPublicationResponse><count>0</count><result/></GetPublicationResponse>'
+    assert list(xmlparser.parallel_records(io.BytesIO(empty))) == []